@@ -0,0 +1,69 @@
+"""
+Timeline query latency of the recordings catalog.
+
+Fills a temporary catalog with synthetic events spread over cameras and
+days, then times the queries behind `/events` and `segment_at`.
+
+    python -m benchmarks.catalog_query --events 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from server_node.backend.catalog import Catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog query benchmark")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--cameras", type=int, default=32)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    start = 1_700_000_000.0
+    span = args.days * 86400
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = Catalog(os.path.join(directory, "catalog.db"))
+        connection = catalog._connect()  # pylint: disable=protected-access
+        began = time.perf_counter()
+        with connection:
+            cameras = rng.integers(0, args.cameras, args.events)
+            times = start + rng.uniform(0, span, args.events)
+            connection.executemany(
+                "INSERT OR IGNORE INTO events (camera_id, ts, end_ts, confidence, labels) VALUES (?, ?, ?, 1.0, '')",
+                zip(cameras.tolist(), times.tolist(), (times + 5).tolist()),
+            )
+            segment_starts = np.arange(start, start + span, 300.0)
+            connection.executemany(
+                "INSERT INTO segments (camera_id, path, start_ts, end_ts) VALUES (?, ?, ?, ?)",
+                ((cid, f"camera{cid}_{i}.mp4", ts, ts + 300)
+                 for cid in range(args.cameras) for i, ts in enumerate(segment_starts.tolist())),
+            )
+        print(f"{args.events} events, {args.cameras * len(segment_starts)} segments "
+              f"inserted in {time.perf_counter() - began:.1f} s")
+
+        def timed(name, query):
+            samples = []
+            for _ in range(args.queries):
+                camera_id = int(rng.integers(0, args.cameras))
+                t = start + float(rng.uniform(0, span))
+                began = time.perf_counter()
+                query(camera_id, t)
+                samples.append(time.perf_counter() - began)
+            samples = np.array(samples) * 1000
+            print(f"{name:<32} p50 {np.percentile(samples, 50):.3f} ms  p99 {np.percentile(samples, 99):.3f} ms")
+
+        timed("events(camera, 1 day, 100)", lambda c, t: catalog.events(c, t, t + 86400, limit=100))
+        timed("events(camera, 1 hour)", lambda c, t: catalog.events(c, t, t + 3600, limit=1000))
+        timed("events(all cameras, 10 min)", lambda c, t: catalog.events(None, t, t + 600, limit=100))
+        timed("segment_at(camera, t)", catalog.segment_at)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark FrameProcessor.detect speed and quality at several detection scales.
+
+Renders a synthetic scene (textured static background, sensor noise and a few
+moving rectangles with known positions), runs the detector at each scale and
+reports milliseconds per frame plus recall/precision of the returned boxes
+against the ground truth.
+
+    python -m benchmarks.detection_scale --width 1280 --height 720 --frames 300
+"""
+import argparse
+import time
+from dataclasses import replace
+import numpy as np
+from server_node import config
+from server_node.backend.frame_processor import FrameProcessor
+
+IOU_MATCH = 0.3
+
+
+def synthetic_scene(width, height, frames, objects=3, seed=0):
+    """
+    Yields (frame, ground_truth_boxes) for a scene with moving rectangles.
+    """
+    rng = np.random.default_rng(seed)
+    background = rng.integers(40, 200, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    background = np.kron(background, np.ones((8, 8, 1), dtype=np.uint8))[:height, :width]
+
+    size = np.column_stack([rng.integers(width // 16, width // 6, objects),
+                            rng.integers(height // 12, height // 5, objects)])
+    pos = rng.uniform(0, 1, (objects, 2)) * (np.array([width, height]) - size)
+    vel = rng.uniform(-1, 1, (objects, 2)) * np.array([width, height]) / 120
+    colours = rng.integers(0, 255, (objects, 3))
+
+    for _ in range(frames):
+        frame = background.copy()
+        noise = rng.integers(-6, 7, size=frame.shape, dtype=np.int16)
+        frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+        pos += vel
+        bounce = (pos < 0) | (pos > np.array([width, height]) - size)
+        vel[bounce] *= -1
+        pos = np.clip(pos, 0, np.array([width, height]) - size)
+
+        truth = []
+        for (x, y), (w, h), colour in zip(pos.astype(int), size, colours):
+            frame[y:y + h, x:x + w] = colour
+            truth.append((x, y, int(w), int(h)))
+        yield frame, truth
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def run(scale, grayscale, frames, width, height, warmup):
+    settings = replace(config.Snapshot(), detection_scale=scale, detection_grayscale=grayscale)
+    processor = FrameProcessor(0)
+    elapsed = 0.0
+    matched = truths = detections = 0
+
+    for index, (frame, truth) in enumerate(synthetic_scene(width, height, frames)):
+        started = time.perf_counter()
+        boxes = processor.detect(frame, settings)
+        spent = time.perf_counter() - started
+
+        # let the background model settle before scoring
+        if index < warmup:
+            continue
+        elapsed += spent
+        truths += len(truth)
+        detections += len(boxes)
+        matched += sum(any(iou(t, b) >= IOU_MATCH for b in boxes) for t in truth)
+
+    scored = max(1, frames - warmup)
+    recall = matched / truths if truths else 0.0
+    precision = min(1.0, matched / detections) if detections else 0.0
+    return elapsed / scored * 1000, recall, precision
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection scale benchmark")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.5, 0.33, 0.25])
+    args = parser.parse_args()
+
+    print(f"{args.width}x{args.height}, {args.frames} frames ({args.warmup} warm-up)")
+    print(f"{'scale':>6} {'gray':>5} {'ms/frame':>9} {'speedup':>8} {'recall':>7} {'precision':>10}")
+    baseline = None
+    for grayscale in (False, True):
+        for scale in args.scales:
+            ms, recall, precision = run(scale, grayscale, args.frames, args.width, args.height, args.warmup)
+            baseline = baseline or ms
+            print(f"{scale:>6.2f} {str(grayscale):>5} {ms:>9.2f} {baseline / ms:>7.1f}x {recall:>7.2f} {precision:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Memory and allocation churn of the frame path from decoder to QImage.
+
+Replays decoded yuv420p frames for several cameras through two versions of
+the receive and display path, each in a fresh process:
+
+- copying: `to_ndarray`, a copy for processing, boxes drawn on another copy,
+  then resize, BGR->RGB conversion and a detached QImage (the old path)
+- pooled: BgrConverter into pooled buffers shared by recorder, processing
+  and display, boxes drawn by the renderer onto its pooled scaled image,
+  QImage wrapping that buffer
+
+and reports time per frame, NumPy bytes allocated per frame (tracemalloc),
+minor page faults per frame and resident memory over the run. Processing
+itself is left out; it costs the same either way.
+
+    python -m benchmarks.frame_memory --cameras 4 --width 1920 --height 1080 --frames 600
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+PATHS = ("copying", "pooled")
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_frames(width, height, count=8):
+    import av  # pylint: disable=import-outside-toplevel
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+    background = np.kron(background, np.ones((8, 8, 1), dtype=np.uint8))
+    frames = []
+    for i in range(count):
+        image = np.roll(background, i * 16, axis=1)
+        frames.append(av.VideoFrame.from_ndarray(np.ascontiguousarray(image), format="bgr24")
+                      .reformat(format="yuv420p"))
+    return frames
+
+
+def run_path(path, args, results):
+    """
+    Child process: replays the frames through one path and reports stats.
+    """
+    import cv2  # pylint: disable=import-outside-toplevel
+    from PyQt5.QtGui import QImage  # pylint: disable=no-name-in-module,import-outside-toplevel
+    from server_node.backend.frame_pool import BgrConverter, FramePool  # pylint: disable=import-outside-toplevel
+    from server_node.backend.overlay import Overlay, draw_boxes  # pylint: disable=import-outside-toplevel
+    from server_node.gui.frame_renderer import FrameRenderer  # pylint: disable=import-outside-toplevel
+
+    frames = synthetic_frames(args.width, args.height)
+    boxes = ((args.width // 4, args.height // 4, args.width // 5, args.height // 5),)
+    overlay = Overlay(boxes, ("#1",))
+    target = (args.tile_width, args.tile_height)
+    converters = [BgrConverter() for _ in range(args.cameras)]
+    pools = [FramePool(capacity=4) for _ in range(args.cameras)]
+    # what other consumers hold on to: recorder queue, processing lane, mailbox
+    recorder = [collections.deque(maxlen=args.recorder_depth) for _ in range(args.cameras)]
+    in_flight = [None] * args.cameras
+
+    def copying(camera, frame, process_due):
+        img = frame.to_ndarray(format="bgr24")
+        recorder[camera].append(img)
+        if process_due:
+            in_flight[camera] = img.copy()
+            display = draw_boxes(in_flight[camera], boxes, ("#1",))
+        else:
+            display = draw_boxes(img.copy(), boxes, ("#1",))
+        scale = min(target[0] / args.width, target[1] / args.height)
+        small = cv2.resize(display, (int(args.width * scale), int(args.height * scale)),
+                           interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        return QImage(rgb.data, rgb.shape[1], rgb.shape[0], rgb.strides[0], QImage.Format_RGB888).copy()
+
+    def pooled(camera, frame, process_due):
+        img = converters[camera].convert(frame)
+        recorder[camera].append(img)
+        if process_due:
+            in_flight[camera] = img
+        return FrameRenderer._render(img, target, overlay, None, pools[camera])  # pylint: disable=protected-access
+
+    step = copying if path == "copying" else pooled
+
+    def replay(count, trace=False):
+        allocated = 0
+        for i in range(count):
+            for camera in range(args.cameras):
+                if trace:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                image = step(camera, frames[(i + camera) % len(frames)], i % args.process_every == 0)
+                del image  # the GUI has made its pixmap
+                if trace:
+                    allocated += tracemalloc.get_traced_memory()[1] - before
+        return allocated
+
+    replay(args.warmup)
+    rss = [rss_mb()]
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    started = time.perf_counter()
+    for chunk in range(10):
+        replay(args.frames // 10)
+        rss.append(rss_mb())
+        if chunk == 0:
+            steady = rss[-1]
+    elapsed = time.perf_counter() - started
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+
+    tracemalloc.start()
+    allocated = replay(min(args.frames, 100), trace=True)
+    tracemalloc.stop()
+
+    total = args.frames // 10 * 10 * args.cameras
+    results.put({
+        "path": path,
+        "ms_per_frame": elapsed * 1000 / total,
+        "allocated_mb_per_frame": allocated / 2 ** 20 / (min(args.frames, 100) * args.cameras),
+        "faults_per_frame": faults / total,
+        "rss_start": rss[0],
+        "rss_steady": steady,
+        "rss_end": rss[-1],
+        "rss_max": max(rss),
+        "pool_misses": sum(c.pool.misses for c in converters),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame path memory benchmark")
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--tile-width", type=int, default=640)
+    parser.add_argument("--tile-height", type=int, default=360)
+    parser.add_argument("--frames", type=int, default=600, help="Frames per camera")
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--recorder-depth", type=int, default=4, help="Frames queued at the recorder")
+    parser.add_argument("--process-every", type=int, default=3, help="Process every n-th frame")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"{args.cameras} cameras, {args.width}x{args.height} -> {args.tile_width}x{args.tile_height}, "
+          f"{args.frames} frames each")
+    print(f"{'path':<8} {'ms/frame':>9} {'MB alloc/frame':>15} {'faults/frame':>13} "
+          f"{'RSS start':>10} {'steady':>8} {'end':>8} {'max':>8} {'misses':>7}")
+    for path in PATHS:
+        process = context.Process(target=run_path, args=(path, args, results))
+        process.start()
+        r = results.get()
+        process.join()
+        print(f"{r['path']:<8} {r['ms_per_frame']:>9.2f} {r['allocated_mb_per_frame']:>15.2f} "
+              f"{r['faults_per_frame']:>13.1f} {r['rss_start']:>8.0f}MB {r['rss_steady']:>6.0f}MB "
+              f"{r['rss_end']:>6.0f}MB {r['rss_max']:>6.0f}MB {r['pool_misses']:>7}")
+
+
+if __name__ == "__main__":
+    main()
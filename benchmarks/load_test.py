@@ -0,0 +1,192 @@
+"""
+End-to-end load test: N synthetic camera nodes against a local server.
+
+The nodes run in a separate process and stream stamped synthetic frames over
+loopback WebRTC to the server running in this process (no GUI by default,
+`--gui` adds an offscreen CameraGrid). A display probe reads the stamps back
+where frames leave the mailbox for display and reports per camera:
+
+- glass-to-display latency (p50/p95/max)
+- displayed and processed fps, frames sent by the node
+- frames dropped by the processing lanes and overwritten in the mailbox
+- server CPU per camera
+
+    python -m benchmarks.load_test --cameras 8 --duration 20
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+
+
+def run_nodes(server_url, cameras, width, height, fps, pattern, duration, results, tracks_per_connection=0):
+    """
+    Child process: streams `cameras` synthetic cameras for `duration` seconds,
+    one node each or, with `tracks_per_connection`, from one multi-camera node.
+    """
+    logging.disable(logging.CRITICAL)
+    from camera_node.__main__ import run  # pylint: disable=import-outside-toplevel
+    from camera_node.node import CameraNode  # pylint: disable=import-outside-toplevel
+    from camera_node.synthetic import SyntheticStreamTrack  # pylint: disable=import-outside-toplevel
+
+    async def main():
+        tracks = {cid: SyntheticStreamTrack(width, height, fps, pattern=pattern, seed=cid)
+                  for cid in range(cameras)}
+        if tracks_per_connection:
+            tasks = [asyncio.ensure_future(CameraNode(server_url, tracks, tracks_per_connection).run())]
+        else:
+            tasks = [asyncio.ensure_future(run(server_url, cid, track=track)) for cid, track in tracks.items()]
+        await asyncio.sleep(duration)
+        results.put({cid: track.frames_sent for cid, track in tracks.items()})
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+class ProbedMailbox:
+    """
+    Wraps the server's FrameMailbox and records display latency of every
+    frame a display consumer takes out of it.
+    """
+    def __init__(self, mailbox):
+        from camera_node.synthetic import read_timestamp  # pylint: disable=import-outside-toplevel
+        self._read_timestamp = read_timestamp
+        self.mailbox = mailbox
+        self.recording = False
+        self.latencies = defaultdict(list)
+        self.displayed = defaultdict(int)
+
+    def take_all(self, timeout=None):
+        frames = self.mailbox.take_all(timeout)
+        if self.recording:
+            now = time.time()
+            for camera_id, (frame, _) in frames.items():
+                self.displayed[camera_id] += 1
+                stamp = self._read_timestamp(frame)
+                if stamp is not None and 0 <= now - stamp < 30:
+                    self.latencies[camera_id].append(now - stamp)
+        return frames
+
+    def reset(self):
+        self.latencies.clear()
+        self.displayed.clear()
+
+
+def display_loop(probe, fps, stop):
+    interval = 1.0 / fps
+    while not stop.is_set():
+        started = time.monotonic()
+        probe.take_all(timeout=interval)
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera server load test")
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=15, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds to connect and settle")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--pattern", default="bounce")
+    parser.add_argument("--raw", action="store_true", help="Display raw frames (skip processing)")
+    parser.add_argument("--display-fps", type=float, default=30)
+    parser.add_argument("--gui", action="store_true", help="Feed an offscreen CameraGrid")
+    parser.add_argument("--mosaic", action="store_true", help="Use the single-canvas mosaic view with --gui")
+    parser.add_argument("--scaling", default="area", choices=["area", "linear", "nearest"])
+    parser.add_argument("--tracks-per-connection", type=int, default=0,
+                        help="Stream all cameras from one node, this many per peer connection")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    from server_node import config  # pylint: disable=import-outside-toplevel
+    config.configure(store=config.FileSettings(None))
+    config.runtime.update(raw_view=args.raw, display_fps=int(args.display_fps),
+                          mosaic_view=args.mosaic, display_scaling=args.scaling)
+    from server_node.backend import server  # pylint: disable=import-outside-toplevel
+
+    uvicorn_server = server.create_server("127.0.0.1", args.port, log_level="warning")
+    threading.Thread(target=uvicorn_server.run, daemon=True).start()
+    while not uvicorn_server.started:
+        time.sleep(0.05)
+
+    probe = ProbedMailbox(server.stream_manager.frames)
+    stop = threading.Event()
+    app = None
+    if args.gui:
+        import os  # pylint: disable=import-outside-toplevel
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication  # pylint: disable=import-outside-toplevel
+        from server_node.gui.camera_grid import CameraGrid  # pylint: disable=import-outside-toplevel
+        app = QApplication([])
+        grid = CameraGrid(probe)
+        grid.resize(1280, 720)
+        grid.show()
+    else:
+        threading.Thread(target=display_loop, args=(probe, args.display_fps, stop), daemon=True).start()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    nodes = context.Process(
+        target=run_nodes,
+        args=(f"http://127.0.0.1:{args.port}/offer", args.cameras, args.width, args.height,
+              args.fps, args.pattern, args.warmup + args.duration + 1, results, args.tracks_per_connection),
+        daemon=True,
+    )
+    nodes.start()
+
+    def wait(seconds):
+        if app is None:
+            time.sleep(seconds)
+            return
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.002)
+
+    wait(args.warmup)
+    lanes_before = server.engine.stats()
+    overwritten_before = dict(server.stream_manager.frames.overwritten)
+    probe.reset()
+    probe.recording = True
+    cpu_before, wall_before = time.process_time(), time.monotonic()
+
+    wait(args.duration)
+
+    probe.recording = False
+    cpu = time.process_time() - cpu_before
+    wall = time.monotonic() - wall_before
+    lanes_after = server.engine.stats()
+    overwritten_after = dict(server.stream_manager.frames.overwritten)
+    sent = results.get(timeout=30)
+    stop.set()
+    nodes.join(timeout=10)
+    uvicorn_server.should_exit = True
+
+    print(f"{args.cameras} cameras, {args.width}x{args.height} @ {args.fps:g} fps, "
+          f"pattern={args.pattern}, view={'raw' if args.raw else 'processed'}, "
+          f"{'gui' if args.gui else 'headless'}, {wall:.1f} s measured")
+    print(f"server CPU: {cpu / wall:.0%} total, {cpu / wall / max(1, args.cameras):.1%} per camera")
+    print(f"{'cam':>4} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7} {'disp fps':>9} "
+          f"{'proc fps':>9} {'sent':>6} {'lane drop':>10} {'mbox drop':>10}")
+    for camera_id in range(args.cameras):
+        latencies = np.array(probe.latencies.get(camera_id, [np.nan])) * 1000
+        before = lanes_before.get(camera_id)
+        after = lanes_after.get(camera_id)
+        processed = (after.processed - before.processed) if before and after else 0
+        dropped = (after.dropped - before.dropped) if before and after else 0
+        overwritten = overwritten_after.get(camera_id, 0) - overwritten_before.get(camera_id, 0)
+        print(f"{camera_id:>4} {np.nanpercentile(latencies, 50):>7.1f} {np.nanpercentile(latencies, 95):>7.1f} "
+              f"{np.nanmax(latencies):>7.1f} {probe.displayed[camera_id] / wall:>9.1f} "
+              f"{processed / wall:>9.1f} {sent.get(camera_id, 0):>6} {dropped:>10} {overwritten:>10}")
+
+
+if __name__ == "__main__":
+    main()
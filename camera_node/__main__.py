@@ -1,56 +1,62 @@
 import asyncio
 import argparse
-import aiohttp
 import logging
-from aiortc import RTCPeerConnection, RTCSessionDescription
-from .stream_manager import CameraStreamTrack
+from .node import CameraNode
+from .stream_manager import CameraStreamTrack, MotionGate
+from .synthetic import PATTERNS, SyntheticStreamTrack
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("camera_node")
 
-async def run(server_url, camera_index):
-    pc = RTCPeerConnection()
-    track = CameraStreamTrack(camera_index)
-    pc.addTrack(track)
+async def run(server_url, camera_index, gate=None, track=None):
+    """
+    Streams a single camera, reconnecting until cancelled.
+    """
+    if track is None:
+        track = CameraStreamTrack(camera_index, gate=gate)
+    await CameraNode(server_url, {camera_index: track}).run()
 
-    logger.info(f"Connecting to server at {server_url}")
 
-    offer = await pc.createOffer()
-    await pc.setLocalDescription(offer)
+def parse_camera(spec):
+    """
+    "ID" streams device ID as camera ID; "ID=SOURCE" streams SOURCE (a
+    device index, video file or RTSP URL) as camera ID.
+    """
+    camera_id, _, source = spec.partition("=")
+    source = source or camera_id
+    return int(camera_id), int(source) if source.isdigit() else source
 
-    # send offer to server
-    payload = {
-        "sdp": pc.localDescription.sdp,
-        "type": pc.localDescription.type,
-        "camera_id": camera_index
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(server_url, json=payload) as resp:
-            if resp.status == 200:
-                res_data = await resp.json()
-                answer = RTCSessionDescription(sdp=res_data["sdp"], type=res_data["type"])
-                await pc.setRemoteDescription(answer)
-                logger.info("Connection established! Streaming video...")
-            else:
-                logger.error(f"Failed to connect: {resp.status} {await resp.text()}")
-                await pc.close()
-                return
-
-    # keep running until connection fails
-    while True:
-        await asyncio.sleep(1)
-        if pc.connectionState == "failed":
-            logger.error("Connection failed")
-            break
-
-    await pc.close()
-    track.stop()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Camera Node (Push)")
     parser.add_argument("--server", default="http://localhost:8000/offer", help="Server URL")
-    parser.add_argument("--camera", type=int, default=0, help="Camera Index")
+    parser.add_argument("--camera", action="append", type=parse_camera, default=None, metavar="ID[=SOURCE]",
+                        help="Camera to stream, repeat for several (default: device 0 as camera 0)")
+    parser.add_argument("--tracks-per-connection", type=int, default=0,
+                        help="Cameras sharing one peer connection (default: all)")
+    parser.add_argument("--mode", choices=("auto", "full", "idle"), default="auto",
+                        help="auto drops to keep-alive rate while the scene is static")
+    parser.add_argument("--keepalive-fps", type=float, default=1.0, help="Frame rate while static")
+    parser.add_argument("--idle-scale", type=float, default=1.0, help="Resolution scale while static")
+    parser.add_argument("--motion-threshold", type=float, default=4.0,
+                        help="Mean thumbnail difference (0-255) that counts as motion")
+    parser.add_argument("--synthetic", choices=PATTERNS, default=None,
+                        help="Stream a generated scene instead of a camera")
+    parser.add_argument("--replay", default=None, help="Stream a looping video file instead of a camera")
+    parser.add_argument("--width", type=int, default=640, help="Synthetic/replay frame width")
+    parser.add_argument("--height", type=int, default=480, help="Synthetic/replay frame height")
+    parser.add_argument("--fps", type=float, default=30, help="Synthetic/replay frame rate")
     args = parser.parse_args()
 
-    asyncio.run(run(args.server, args.camera))
+    tracks = {}
+    for camera_id, source in args.camera or [(0, 0)]:
+        # motion is judged per camera, so every track gets its own gate
+        gate = MotionGate(threshold=args.motion_threshold, keepalive_fps=args.keepalive_fps)
+        gate.configure(mode=args.mode, idle_scale=args.idle_scale)
+        if args.synthetic or args.replay:
+            tracks[camera_id] = SyntheticStreamTrack(args.width, args.height, args.fps,
+                                                     pattern=args.synthetic or "static", replay=args.replay,
+                                                     seed=camera_id, gate=gate)
+        else:
+            tracks[camera_id] = CameraStreamTrack(source, gate=gate)
+    asyncio.run(CameraNode(args.server, tracks, args.tracks_per_connection).run())
@@ -0,0 +1,249 @@
+"""
+Connections of a camera node that serves several cameras.
+
+Cameras are grouped into connections of up to `tracks_per_connection`
+tracks. Each connection is one RTCPeerConnection with a video track per
+camera and one shared control channel, so eight cameras cost one DTLS
+handshake instead of eight. The offer tells the server which transceiver
+(by mid) carries which camera id.
+
+A connection that fails, closes or never gets connected is torn down and
+renegotiated with exponential backoff and jitter. The first retry comes
+after a fraction of a second, so a network blip costs about one offer/answer
+round trip. A server that vanished without closing the connection is noticed
+by its RTCP receiver reports stopping, well before ICE gives up on it.
+Tracks and their capture threads outlive their connections. Per-track
+health (send and capture rate, bitrate, RTT, gate mode) is logged and sent
+to the server over the control channel.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import random
+import time
+from typing import Dict, List
+
+import aiohttp
+from aiortc import MediaStreamTrack, RTCPeerConnection, RTCSessionDescription
+
+logger = logging.getLogger("camera_node")
+
+INITIAL_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+STABLE_AFTER = 10.0  # seconds connected before the backoff starts over
+CONNECT_TIMEOUT = 15.0  # offer round trip plus ICE/DTLS
+HEALTH_INTERVAL = 5.0
+PEER_TIMEOUT = 5.0  # seconds without RTCP receiver reports before the server is presumed gone
+
+
+class NodeConnection:
+    """
+    One peer connection carrying `tracks` (camera id -> track), kept up
+    until cancelled.
+    """
+    def __init__(self, server_url: str, tracks: Dict[int, MediaStreamTrack], session: aiohttp.ClientSession,
+                 name: str = "connection"):
+        self.server_url = server_url
+        self.tracks = tracks
+        self.session = session
+        self.name = name
+        self.pc = None
+        self.control = None
+        self.reconnects = 0
+        self._senders = {}  # camera_id -> RTCRtpSender
+        self._last = {}  # camera_id -> (time, frames sent, frames captured, bytes sent)
+        self._heard_from = None  # last receiver report from the server
+
+    @property
+    def state(self) -> str:
+        return self.pc.connectionState if self.pc is not None else "closed"
+
+    async def run(self) -> None:
+        backoff = INITIAL_BACKOFF
+        while True:
+            connected_at = None
+            try:
+                await self._connect()
+                connected_at = time.monotonic()
+                await self._serve()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                logger.error("%s: %s", self.name, e or type(e).__name__)
+            finally:
+                await self._close()
+
+            if connected_at is not None and time.monotonic() - connected_at >= STABLE_AFTER:
+                backoff = INITIAL_BACKOFF
+            delay = random.uniform(backoff / 2, backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            self.reconnects += 1
+            logger.info("%s: reconnecting in %.1f s", self.name, delay)
+            await asyncio.sleep(delay)
+
+    async def _connect(self) -> None:
+        self.pc = pc = RTCPeerConnection()
+        self._senders = {camera_id: pc.addTrack(track) for camera_id, track in self.tracks.items()}
+
+        # the server can override the bandwidth mode over this channel
+        self.control = pc.createDataChannel("control")
+        self.control.on("message", self._on_control)
+
+        offer = await pc.createOffer()
+        await pc.setLocalDescription(offer)
+        mids = {
+            transceiver.mid: camera_id
+            for camera_id, sender in self._senders.items()
+            for transceiver in pc.getTransceivers() if transceiver.sender is sender
+        }
+        payload = {
+            "sdp": pc.localDescription.sdp,
+            "type": pc.localDescription.type,
+            "camera_id": next(iter(self.tracks)),
+            "tracks": mids,
+        }
+
+        logger.info("%s: connecting cameras %s to %s", self.name, sorted(self.tracks), self.server_url)
+        timeout = aiohttp.ClientTimeout(total=CONNECT_TIMEOUT)
+        async with self.session.post(self.server_url, json=payload, timeout=timeout) as resp:
+            if resp.status != 200:
+                raise ConnectionError(f"offer rejected: {resp.status} {await resp.text()}")
+            answer = await resp.json()
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=answer["sdp"], type=answer["type"]))
+
+        started = time.monotonic()
+        while pc.connectionState != "connected":
+            if pc.connectionState in ("failed", "closed"):
+                raise ConnectionError(f"connection {pc.connectionState}")
+            if time.monotonic() - started > CONNECT_TIMEOUT:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(0.1)
+        now = time.monotonic()
+        self._last = {camera_id: (now, track.frames_sent, self._captured(track), 0)
+                      for camera_id, track in self.tracks.items()}
+        self._heard_from = datetime.datetime.now(datetime.timezone.utc)
+        logger.info("%s: connected, streaming %d camera(s)", self.name, len(self.tracks))
+
+    async def _serve(self) -> None:
+        """
+        Checks that the server is still there every second and reports
+        health until the connection goes down.
+        """
+        down = asyncio.Event()
+
+        @self.pc.on("connectionstatechange")
+        def on_state():
+            if self.pc is not None and self.pc.connectionState in ("failed", "closed"):
+                down.set()
+
+        next_report = time.monotonic() + HEALTH_INTERVAL
+        while not down.is_set():
+            try:
+                await asyncio.wait_for(down.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+            if await self._silence() > PEER_TIMEOUT:
+                raise ConnectionError(f"no receiver reports for {PEER_TIMEOUT:.0f} s")
+            if time.monotonic() >= next_report:
+                next_report += HEALTH_INTERVAL
+                await self._report_health()
+        raise ConnectionError(f"connection {self.state}")
+
+    async def _silence(self) -> float:
+        """
+        Seconds since the server last sent a receiver report for any track.
+        """
+        for sender in self._senders.values():
+            for stats in (await sender.getStats()).values():
+                if stats.type == "remote-inbound-rtp":
+                    self._heard_from = max(self._heard_from, stats.timestamp)
+        return (datetime.datetime.now(datetime.timezone.utc) - self._heard_from).total_seconds()
+
+    async def _close(self) -> None:
+        pc, self.pc, self.control = self.pc, None, None
+        if pc is not None:
+            await pc.close()
+
+    def _on_control(self, message) -> None:
+        try:
+            body = json.loads(message)
+            camera_id = body.pop("camera_id", None)
+            targets = [self.tracks[camera_id]] if camera_id is not None else list(self.tracks.values())
+            for track in targets:
+                if track.gate is None:
+                    logger.warning("Track has no bandwidth gate, ignoring control message")
+                    continue
+                track.gate.configure(**body)
+                logger.info("Stream mode set to %s", track.gate.mode)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error("Bad control message %r: %s", message, e)
+
+    async def _report_health(self) -> None:
+        health = {camera_id: await self._track_health(camera_id, track) for camera_id, track in self.tracks.items()}
+        for camera_id, h in health.items():
+            logger.info(
+                "Camera %s: capture %.1f fps, sent %.1f fps, %.0f kbps (%s, %s)%s",
+                camera_id, h["capture_fps"], h["sent_fps"], h["kbps"], h["mode"],
+                "active" if h["active"] else "static",
+                "" if h["capture_connected"] else " (reconnecting)",
+            )
+        if self.control is not None and self.control.readyState == "open":
+            self.control.send(json.dumps({"type": "health", "connection": self.state,
+                                          "reconnects": self.reconnects, "cameras": health}))
+
+    @staticmethod
+    def _captured(track) -> int:
+        capture = getattr(track, "capture", None)
+        return capture.frames_captured if capture is not None else track.frames_sent
+
+    async def _track_health(self, camera_id: int, track) -> dict:
+        now = time.monotonic()
+        capture = getattr(track, "capture", None)
+        captured = self._captured(track)
+        bytes_sent, rtt = 0, None
+        sender = self._senders.get(camera_id)
+        if sender is not None:
+            for stats in (await sender.getStats()).values():
+                if stats.type == "outbound-rtp":
+                    bytes_sent = stats.bytesSent
+                elif stats.type == "remote-inbound-rtp" and stats.roundTripTime is not None:
+                    rtt = round(stats.roundTripTime * 1000, 1)
+        last_time, last_sent, last_captured, last_bytes = self._last[camera_id]
+        self._last[camera_id] = (now, track.frames_sent, captured, bytes_sent)
+        elapsed = max(now - last_time, 1e-6)
+        gate = track.gate
+        return {
+            "capture_fps": round((captured - last_captured) / elapsed, 1),
+            "sent_fps": round((track.frames_sent - last_sent) / elapsed, 1),
+            "kbps": round((bytes_sent - last_bytes) * 8 / 1000 / elapsed, 1),
+            "rtt_ms": rtt,
+            "capture_connected": capture.connected if capture is not None else True,
+            "mode": gate.mode if gate is not None else "full",
+            "active": gate.active if gate is not None else True,
+        }
+
+
+class CameraNode:
+    """
+    Streams `tracks` (camera id -> track) to one server, with at most
+    `tracks_per_connection` tracks per peer connection (0: all on one).
+    """
+    def __init__(self, server_url: str, tracks: Dict[int, MediaStreamTrack], tracks_per_connection: int = 0):
+        self.server_url = server_url
+        self.tracks = tracks
+        self.tracks_per_connection = tracks_per_connection or len(tracks) or 1
+        self.connections: List[NodeConnection] = []
+
+    async def run(self) -> None:
+        camera_ids = sorted(self.tracks)
+        size = self.tracks_per_connection
+        async with aiohttp.ClientSession() as session:
+            self.connections = [
+                NodeConnection(self.server_url, {cid: self.tracks[cid] for cid in camera_ids[i:i + size]},
+                               session, name=f"connection {i // size}")
+                for i in range(0, len(camera_ids), size)
+            ]
+            try:
+                await asyncio.gather(*(connection.run() for connection in self.connections))
+            finally:
+                for track in self.tracks.values():
+                    track.stop()
@@ -1,4 +1,5 @@
-import asyncio
+import threading
+import time
 import cv2
 from aiortc import VideoStreamTrack
 from av import VideoFrame
@@ -7,29 +8,199 @@ import logging
 
 logger = logging.getLogger("camera_stream")
 
-class CameraStreamTrack(VideoStreamTrack):
-    def __init__(self, camera_index=0):
-        super().__init__()
-        self.cap = cv2.VideoCapture(camera_index)
+STREAM_MODES = ("auto", "full", "idle")
+
+
+class CaptureThread(threading.Thread):
+    """
+    Reads the camera on its own thread into a triple-buffered latest-frame slot.
+
+    The capture side always has a buffer to write into and the consumer always
+    holds a stable one, so neither waits on the other and no frame is
+    allocated per read.
+    """
+    MAX_FAILED_READS = 10
+    MAX_BACKOFF = 5.0
+
+    def __init__(self, camera_index=0, width=640, height=480):
+        super().__init__(name=f"capture-{camera_index}", daemon=True)
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.cap = None
+        self.connected = False
+        self.frames_captured = 0
+
+        self._buffers = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(3)]
+        self._write, self._ready, self._read = 0, 1, 2
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._running = True
+
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.camera_index)
         if not self.cap.isOpened():
-            logger.error(f"Could not open camera {camera_index}")
+            logger.error(f"Could not open camera {self.camera_index}")
+            return False
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return True
+
+    def run(self):
+        backoff = 0.5
+        failed_reads = 0
+        while self._running:
+            if not self.connected:
+                self.connected = self._open()
+                if not self.connected:
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.MAX_BACKOFF)
+                    continue
+                backoff = 0.5
+                failed_reads = 0
+
+            ret, frame = self.cap.read(self._buffers[self._write])
+            if not ret:
+                failed_reads += 1
+                if failed_reads >= self.MAX_FAILED_READS:
+                    logger.warning(f"Camera {self.camera_index} stopped delivering frames, reconnecting")
+                    self.cap.release()
+                    self.connected = False
+                continue
+            failed_reads = 0
+
+            # opencv hands back a new array if the camera ignored our size
+            self._buffers[self._write] = frame
+            with self._lock:
+                self._write, self._ready = self._ready, self._write
+                self._fresh = True
+            self.frames_captured += 1
+
+        if self.cap is not None:
+            self.cap.release()
+
+    def latest(self):
+        """
+        Returns the newest frame (or None before the first one) and whether
+        it is new since the previous call. Does not block on the camera.
+        """
+        with self._lock:
+            fresh = self._fresh
+            if fresh:
+                self._read, self._ready = self._ready, self._read
+                self._fresh = False
+        if self.frames_captured == 0:
+            return None, False
+        return self._buffers[self._read], fresh
+
+    def stop(self):
+        self._running = False
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=2.0)
+
+
+class MotionGate:
+    """
+    Decides whether a frame is worth sending, to save uplink bandwidth.
+
+    Each fresh frame is shrunk to a tiny grayscale thumbnail and compared to
+    the previous one. While the scene is static only a keep-alive frame is
+    sent every `1 / keepalive_fps` seconds (optionally downscaled); the first
+    frame that differs goes out straight away and full rate is kept for
+    `hold` seconds. Mode "full" always sends, "idle" never leaves keep-alive.
+    """
+    THUMBNAIL_SIZE = (32, 24)
+
+    def __init__(self, threshold=4.0, hold=2.0, keepalive_fps=1.0, idle_scale=1.0):
+        self.mode = "auto"
+        self.threshold = threshold
+        self.hold = hold
+        self.keepalive_fps = keepalive_fps
+        self.idle_scale = idle_scale
+        self.active = True
+        self._thumbnail = None
+        self._last_motion = time.monotonic()
+        self._last_sent = 0.0
+
+    def configure(self, mode=None, threshold=None, hold=None, keepalive_fps=None, idle_scale=None):
+        if mode is not None:
+            if mode not in STREAM_MODES:
+                raise ValueError(f"unknown stream mode {mode!r}")
+            self.mode = mode
+        if threshold is not None:
+            self.threshold = float(threshold)
+        if hold is not None:
+            self.hold = float(hold)
+        if keepalive_fps is not None:
+            self.keepalive_fps = max(0.01, float(keepalive_fps))
+        if idle_scale is not None:
+            self.idle_scale = min(1.0, max(0.1, float(idle_scale)))
+
+    def _motion(self, frame):
+        small = cv2.resize(frame, self.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+        previous, self._thumbnail = self._thumbnail, small
+        if previous is None:
+            return True
+        return float(np.abs(small - previous).mean()) > self.threshold
+
+    def should_send(self, frame, fresh):
+        now = time.monotonic()
+        if fresh and frame is not None and self._motion(frame):
+            self._last_motion = now
+
+        if self.mode == "full":
+            self.active = True
+        elif self.mode == "idle":
+            self.active = False
         else:
-            # default to 640x480
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            self.active = now - self._last_motion < self.hold
+
+        if self.active or now - self._last_sent >= 1.0 / self.keepalive_fps:
+            self._last_sent = now
+            return True
+        return False
+
+    def shape(self, frame):
+        """
+        Downscales keep-alive frames when an idle scale is set.
+        """
+        if self.active or self.idle_scale >= 1.0:
+            return frame
+        return cv2.resize(frame, None, fx=self.idle_scale, fy=self.idle_scale,
+                          interpolation=cv2.INTER_AREA)
+
+
+class CameraStreamTrack(VideoStreamTrack):
+    def __init__(self, camera_index=0, width=640, height=480, gate=None):
+        super().__init__()
+        self.camera_index = camera_index
+        self.capture = CaptureThread(camera_index, width, height)
+        self.capture.start()
+        self.gate = gate or MotionGate()
+
+        # sent while the camera is (re)connecting, allocated once
+        self.blank_frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.frames_sent = 0
 
     async def recv(self):
-        pts, time_base = await self.next_timestamp()
-        ret, frame = self.cap.read()
-        if not ret:
-            # return empty numpy frame if read fails
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        # ticks stay at full rate so motion is picked up within one frame;
+        # skipped ticks just leave a gap in the pts
+        while True:
+            pts, time_base = await self.next_timestamp()
+            frame, fresh = self.capture.latest()
+            if frame is None or not self.capture.connected:
+                frame, fresh = self.blank_frame, False
+            if self.gate.should_send(frame, fresh):
+                break
+        frame = self.gate.shape(frame)
 
         new_frame = VideoFrame.from_ndarray(frame, format="bgr24")
         new_frame.pts = pts
         new_frame.time_base = time_base
+        self.frames_sent += 1
         return new_frame
 
     def stop(self):
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
\ No newline at end of file
+        super().stop()
+        self.capture.stop()
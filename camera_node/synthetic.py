@@ -0,0 +1,178 @@
+import asyncio
+import fractions
+import time
+import cv2
+from aiortc import VideoStreamTrack
+from av import VideoFrame
+import numpy as np
+import logging
+
+logger = logging.getLogger("synthetic_stream")
+
+PATTERNS = ("static", "walker", "bounce", "bursts")
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+# capture-time stamp drawn into the top-left corner of each frame
+STAMP_SYNC = (1, 0, 1, 0)
+STAMP_BITS = 48 # microseconds, wraps after ~8.9 years
+STAMP_BLOCK = 8 # pixels per bit
+
+
+def stamp_timestamp(frame, timestamp):
+    """
+    Draws `timestamp` (seconds) as a row of black/white blocks so it
+    survives encoding and can be read back on the server.
+    """
+    bits = list(STAMP_SYNC) + [((int(timestamp * 1e6) >> i) & 1) for i in range(STAMP_BITS)]
+    block = min(STAMP_BLOCK, frame.shape[1] // len(bits))
+    for i, bit in enumerate(bits):
+        frame[:block, i * block:(i + 1) * block] = 255 if bit else 0
+
+
+def read_timestamp(frame):
+    """
+    Reads a stamp drawn by `stamp_timestamp`, or returns None if the frame
+    has no (readable) stamp. Only the lower 48 bits of the time are kept,
+    so the result is completed from the local clock.
+    """
+    total = len(STAMP_SYNC) + STAMP_BITS
+    block = min(STAMP_BLOCK, frame.shape[1] // total)
+    if block < 2 or frame.shape[0] < block:
+        return None
+    centres = frame[block // 2, block // 2:total * block:block]
+    if centres.ndim > 1:
+        centres = centres.mean(axis=1)
+    bits = (centres[:total] > 127).astype(np.int64)
+    if tuple(bits[:len(STAMP_SYNC)]) != STAMP_SYNC:
+        return None
+    value = int((bits[len(STAMP_SYNC):] << np.arange(STAMP_BITS)).sum())
+    now_us = int(time.time() * 1e6)
+    high = now_us - (now_us & ((1 << STAMP_BITS) - 1))
+    return (high + value) / 1e6
+
+
+class SyntheticSource:
+    """
+    Generates frames with a scripted motion pattern, or replays a video file.
+
+    Patterns: "static" (noise only), "walker" (one box crossing the frame),
+    "bounce" (several bouncing boxes) and "bursts" (walker for 3 s every
+    10 s, static otherwise).
+    """
+    def __init__(self, width=640, height=480, pattern="walker", replay=None, seed=0):
+        if pattern not in PATTERNS:
+            raise ValueError(f"unknown pattern {pattern!r}, expected one of {PATTERNS}")
+        self.width = width
+        self.height = height
+        self.pattern = pattern
+        self.rng = np.random.default_rng(seed)
+        self.replay = cv2.VideoCapture(replay) if replay else None
+
+        tiles = self.rng.integers(40, 200, size=(height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+        self.background = np.ascontiguousarray(
+            np.kron(tiles, np.ones((16, 16, 1), dtype=np.uint8))[:height, :width]
+        )
+        self.frame = np.empty_like(self.background)
+
+        count = 4 if pattern == "bounce" else 1
+        self.size = np.column_stack([
+            self.rng.integers(width // 12, width // 5, count),
+            self.rng.integers(height // 8, height // 3, count),
+        ])
+        self.pos = self.rng.uniform(0, 1, (count, 2)) * (np.array([width, height]) - self.size)
+        self.vel = self.rng.uniform(0.3, 1, (count, 2)) * np.array([width, height]) / 90
+        self.colours = self.rng.integers(0, 255, (count, 3))
+
+    def _replay_frame(self):
+        ok, frame = self.replay.read()
+        if not ok:
+            self.replay.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.replay.read()
+        if not ok:
+            return None
+        if frame.shape[:2] != (self.height, self.width):
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def read(self, elapsed):
+        """
+        Returns the frame for `elapsed` seconds into the stream. The array is
+        reused between calls.
+        """
+        if self.replay is not None:
+            frame = self._replay_frame()
+            if frame is not None:
+                return frame
+
+        np.copyto(self.frame, self.background)
+        # a little sensor noise on a few rows keeps the scene from being perfectly flat
+        row = int(self.rng.integers(0, self.height))
+        self.frame[row] = self.rng.integers(0, 255, self.frame[row].shape, dtype=np.uint8)
+
+        moving = self.pattern in ("walker", "bounce") or (
+            self.pattern == "bursts" and elapsed % 10.0 < 3.0
+        )
+        if not moving:
+            return self.frame
+
+        limit = np.array([self.width, self.height]) - self.size
+        self.pos += self.vel
+        if self.pattern == "bounce":
+            bounce = (self.pos < 0) | (self.pos > limit)
+            self.vel[bounce] *= -1
+            self.pos = np.clip(self.pos, 0, limit)
+        else:
+            self.pos %= np.maximum(limit, 1)
+
+        for (x, y), (w, h), colour in zip(self.pos.astype(int), self.size, self.colours):
+            self.frame[y:y + h, x:x + w] = colour
+        return self.frame
+
+
+class SyntheticStreamTrack(VideoStreamTrack):
+    """
+    Stand-in for CameraStreamTrack that needs no camera.
+
+    Frames are generated at `fps` and carry their capture time as a stamp
+    (see `read_timestamp`) so end-to-end latency can be measured.
+    """
+    def __init__(self, width=640, height=480, fps=30, pattern="walker", replay=None,
+                 seed=0, gate=None, stamp=True):
+        super().__init__()
+        self.source = SyntheticSource(width, height, pattern, replay, seed)
+        self.fps = fps
+        self.gate = gate
+        self.stamp = stamp
+        self.frames_sent = 0
+        self._start = None
+        self._frame_index = 0
+
+    async def _next_frame_time(self):
+        if self._start is None:
+            self._start = time.time()
+        else:
+            self._frame_index += 1
+            wait = self._start + self._frame_index / self.fps - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return time.time() - self._start
+
+    async def recv(self):
+        while True:
+            elapsed = await self._next_frame_time()
+            frame = self.source.read(elapsed)
+            if self.gate is None or self.gate.should_send(frame, True):
+                break
+        if self.gate is not None:
+            frame = self.gate.shape(frame)
+
+        if self.stamp:
+            frame = frame.copy()
+            stamp_timestamp(frame, time.time())
+
+        new_frame = VideoFrame.from_ndarray(frame, format="bgr24")
+        new_frame.pts = int(elapsed * VIDEO_CLOCK_RATE)
+        new_frame.time_base = VIDEO_TIME_BASE
+        self.frames_sent += 1
+        return new_frame
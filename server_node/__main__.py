@@ -1,13 +1,86 @@
 """Main entry point for the server node application."""
+import argparse
+import asyncio
+import logging
 import sys
-from PyQt5.QtWidgets import QApplication
-from server_node.gui.app import App
+from server_node.startup import profile
+
+
+def parse_size(value):
+    """
+    "1920x1080" -> (1920, 1080).
+    """
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}") from e
+    return width, height
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera Server Node")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run ingest, processing and recording without the Qt GUI")
+    parser.add_argument("--config", default=None,
+                        help="Settings file for headless mode (default: server_settings.json)")
+    parser.add_argument("--host", default="0.0.0.0", help="Signaling server host")
+    parser.add_argument("--port", type=int, default=8000, help="Signaling server port")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Spread camera ingest over this many worker processes (0: in-process)")
+    parser.add_argument("--max-frame-size", type=parse_size, default=None, metavar="WxH",
+                        help="Largest camera frame shown with --workers (default: 1920x1080)")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="Print import and startup stage timings once the server is up")
+    args = parser.parse_args()
+
+    if args.startup_profile:
+        milestones = ("server listening", "pipeline loaded")
+        profile.enable(*milestones if args.headless else ("window shown",) + milestones)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.headless:
+        # pick the file store before anything touches config, so Qt is never imported
+        from server_node import config
+        with profile.stage("configure"):
+            config.configure(headless=True, path=args.config)
+
+    pool = None
+    if args.workers > 0:
+        with profile.stage("start workers"):
+            from server_node.backend.sharding import ShardPool
+            pool = ShardPool(args.workers, max_frame_size=args.max_frame_size).start()
+
+    try:
+        if args.headless:
+            with profile.stage("import server"):
+                from server_node import headless
+            asyncio.run(headless.run(args.host, args.port))
+            return
+
+        with profile.stage("import gui"):
+            from PyQt5.QtCore import QTimer
+            from PyQt5.QtWidgets import QApplication
+            from server_node.gui.app import App
+
+        with profile.stage("create QApplication"):
+            app = QApplication(sys.argv)
+        with profile.stage("build window"):
+            window = App(args.host, args.port)
+        with profile.stage("show window"):
+            window.show()
+        # runs once the event loop has handled the first show and paint
+        QTimer.singleShot(0, lambda: profile.mark("window shown"))
+        exit_code = app.exec_()
+    finally:
+        # the report still comes out if a milestone never did
+        profile.finish()
+        if pool is not None:
+            pool.stop()
+    sys.exit(exit_code)
+
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = App()
-    window.show()
-    sys.exit(app.exec_())
+    main()
 
 # non-cope TODO list:
 # - figure out logs
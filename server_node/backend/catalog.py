@@ -0,0 +1,482 @@
+"""
+SQLite catalog of recorded segments and motion events.
+
+VideoRecorder registers every segment it writes together with the byte
+offset of each fragment (segments are fragmented mp4 that start a fragment
+on every keyframe), and FrameProcessor adds an event row, its boxes and a
+small JPEG thumbnail whenever motion starts. Writes go through one
+background thread in batched transactions, so the hot paths only enqueue.
+Range queries hit (camera_id, ts) indexes and stay sub-millisecond with
+millions of events.
+"""
+import logging
+import os
+import queue
+import sqlite3
+import struct
+import threading
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .overlay import draw_boxes
+
+logger = logging.getLogger("catalog")
+
+DEFAULT_PATH = os.path.join("recordings", "catalog.db")
+THUMBNAIL_WIDTH = 160
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    camera_id INTEGER NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    start_ts REAL NOT NULL,
+    end_ts REAL,
+    width INTEGER,
+    height INTEGER,
+    bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS segments_camera_time ON segments (camera_id, start_ts);
+CREATE INDEX IF NOT EXISTS segments_time ON segments (start_ts);
+
+CREATE TABLE IF NOT EXISTS fragments (
+    segment_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    byte_offset INTEGER NOT NULL,
+    PRIMARY KEY (segment_id, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    camera_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    end_ts REAL,
+    confidence REAL,
+    labels TEXT,
+    zones TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS events_camera_time ON events (camera_id, ts);
+CREATE INDEX IF NOT EXISTS events_time ON events (ts);
+
+CREATE TABLE IF NOT EXISTS boxes (
+    event_id INTEGER NOT NULL,
+    track_id INTEGER,
+    x INTEGER, y INTEGER, w INTEGER, h INTEGER
+);
+CREATE INDEX IF NOT EXISTS boxes_event ON boxes (event_id);
+
+CREATE TABLE IF NOT EXISTS thumbnails (
+    event_id INTEGER PRIMARY KEY,
+    jpeg BLOB NOT NULL
+);
+"""
+
+
+def _boxes(data: bytes, start: int, end: int):
+    """
+    Yields (type, payload start, box end) for the mp4 boxes in data[start:end].
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _box_at(f, offset: int, file_size: int) -> Optional[Tuple[bytes, int, int]]:
+    """
+    (type, payload start, box end) of the box at `offset` of an open mp4,
+    reading only its header. None past the end or for a box cut off at the
+    end of a file that is still being written.
+    """
+    if offset + 8 > file_size:
+        return None
+    f.seek(offset)
+    header = f.read(16)
+    size, kind = struct.unpack_from(">I4s", header)
+    length = 8
+    if size == 1:
+        size = struct.unpack_from(">Q", header, 8)[0]
+        length = 16
+    elif size == 0:
+        size = file_size - offset
+    if size < length or offset + size > file_size:
+        return None
+    return kind, offset + length, offset + size
+
+
+def _read(f, start: int, end: int) -> bytes:
+    f.seek(start)
+    return f.read(end - start)
+
+
+def _timescale(moov: bytes) -> Optional[int]:
+    """
+    Timescale of the (single, video) track in a moov payload.
+    """
+    for trak, trak_start, trak_end in _boxes(moov, 0, len(moov)):
+        if trak != b"trak":
+            continue
+        for mdia, mdia_start, mdia_end in _boxes(moov, trak_start, trak_end):
+            if mdia != b"mdia":
+                continue
+            for mdhd, mdhd_start, _ in _boxes(moov, mdia_start, mdia_end):
+                if mdhd == b"mdhd":
+                    version = moov[mdhd_start]
+                    return struct.unpack_from(">I", moov, mdhd_start + (20 if version else 12))[0]
+    return None
+
+
+def _decode_time(moof: bytes) -> Optional[int]:
+    """
+    Base media decode time (tfdt) of a moof payload, in track timescale units.
+    """
+    for traf, traf_start, traf_end in _boxes(moof, 0, len(moof)):
+        if traf != b"traf":
+            continue
+        for tfdt, tfdt_start, _ in _boxes(moof, traf_start, traf_end):
+            if tfdt == b"tfdt":
+                version = moof[tfdt_start]
+                return struct.unpack_from(">Q" if version else ">I", moof, tfdt_start + 4)[0]
+    return None
+
+
+def _indexed_moofs(f, file_size: int) -> Optional[List[int]]:
+    """
+    Offsets of the moof boxes listed in the mfra box a finished file ends
+    with, found through the mfro box in its last 16 bytes. None if the file
+    has no mfra, e.g. while it is still being written.
+    """
+    if file_size < 16:
+        return None
+    size, kind, _, mfra_size = struct.unpack(">I4sII", _read(f, file_size - 16, file_size))
+    if kind != b"mfro" or size != 16 or not 16 < mfra_size <= file_size:
+        return None
+    mfra = _read(f, file_size - mfra_size, file_size)
+    if mfra[4:8] != b"mfra":
+        return None
+    moofs = set()
+    for tfra, start, _ in _boxes(mfra, 8, len(mfra)):
+        if tfra != b"tfra":
+            continue
+        version = mfra[start]
+        sizes, entries = struct.unpack_from(">II", mfra, start + 8)
+        # time and moof offset, then the traf, trun and sample numbers of 1-4 bytes each
+        entry_size = (16 if version else 8) + sum(((sizes >> shift) & 3) + 1 for shift in (4, 2, 0))
+        moof_field = ">Q" if version else ">I"
+        moof_offset = start + 16 + (8 if version else 4)
+        for i in range(entries):
+            moofs.add(struct.unpack_from(moof_field, mfra, moof_offset + i * entry_size)[0])
+    return sorted(moofs)
+
+
+def fragment_index(path: str) -> Tuple[int, List[Tuple[float, int]]]:
+    """
+    Indexes a fragmented mp4 and returns the size of its init section
+    (ftyp + moov) and (start time in seconds, byte offset) of every moof.
+
+    Only box headers and the small boxes are read, never the media data:
+    the moofs are found through the mfra index at the end of a finished
+    file, or by seeking from box header to box header.
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        timescale = 1000
+        init_size = 0
+        moofs = []
+        offset = 0
+        box = _box_at(f, offset, file_size)
+        while box is not None:
+            kind, payload, end = box
+            if kind == b"moov":
+                init_size = end
+                timescale = _timescale(_read(f, payload, end)) or timescale
+                indexed = _indexed_moofs(f, file_size)
+                if indexed is not None:
+                    moofs = [(moof, _box_at(f, moof, file_size)) for moof in indexed]
+                    break
+            elif kind == b"moof":
+                moofs.append((offset, box))
+            offset = end
+            box = _box_at(f, offset, file_size)
+
+        fragments = []
+        for moof, box in moofs:
+            if box is None or box[0] != b"moof":
+                continue
+            decode_time = _decode_time(_read(f, box[1], box[2]))
+            if decode_time is not None:
+                fragments.append((decode_time / timescale, moof))
+    return init_size, fragments
+
+
+def thumbnail(frame: np.ndarray, boxes=(), width: int = THUMBNAIL_WIDTH, quality: int = 70) -> Optional[bytes]:
+    height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    draw_boxes(small, boxes, scale=width / frame.shape[1])
+    ok, encoded = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+class Catalog:
+    """
+    Catalog database. Writers call the `add_*`/`end_*` methods from any
+    thread; readers call `events`, `segments` etc., each thread using its
+    own connection.
+    """
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+            # catalogs created before detection zones existed
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(events)")}
+            if "zones" not in columns:
+                connection.execute("ALTER TABLE events ADD COLUMN zones TEXT")
+        self._writes = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name="catalog-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+            connection.row_factory = sqlite3.Row
+        return connection
+
+    # writes
+
+    def add_segment(self, camera_id: int, path: str, start: float, width: int, height: int) -> None:
+        self._writes.put((
+            "INSERT OR REPLACE INTO segments (camera_id, path, start_ts, width, height) VALUES (?, ?, ?, ?, ?)",
+            (camera_id, path, start, width, height),
+        ))
+
+    def end_segment(self, path: str, end: float) -> None:
+        """
+        Records the end of a closed segment and indexes its fragments.
+        """
+        self._writes.put(("end_segment", (path, end)))
+
+    def add_event(self, camera_id: int, timestamp: float, confidence: float, labels=(),
+                  boxes=(), frame: np.ndarray = None, zones=()) -> None:
+        """
+        Records the start of a motion event. `boxes` are (track_id, (x, y,
+        w, h)) pairs, `zones` the names of the detection zones the motion
+        is in; the thumbnail is encoded on the writer thread.
+        """
+        self._writes.put(("add_event", (camera_id, timestamp, confidence, ",".join(labels),
+                                        list(boxes), frame, ",".join(zones))))
+
+    def end_event(self, camera_id: int, timestamp: float, end: float) -> None:
+        self._writes.put(("UPDATE events SET end_ts = ? WHERE camera_id = ? AND ts = ?",
+                          (end, camera_id, timestamp)))
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """
+        Waits until everything queued so far is committed.
+        """
+        done = threading.Event()
+        self._writes.put(("flush", done))
+        done.wait(timeout)
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            flushed = []
+            try:
+                with connection:
+                    for statement, args in batch:
+                        if statement == "flush":
+                            flushed.append(args)
+                        elif statement == "add_event":
+                            self._insert_event(connection, *args)
+                        elif statement == "end_segment":
+                            self._end_segment(connection, *args)
+                        else:
+                            connection.execute(statement, args)
+            except sqlite3.Error as e:
+                logger.error("Catalog write failed: %s", e)
+            for done in flushed:
+                done.set()
+
+    @staticmethod
+    def _insert_event(connection, camera_id, timestamp, confidence, labels, boxes, frame, zones):
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO events (camera_id, ts, confidence, labels, zones) VALUES (?, ?, ?, ?, ?)",
+            (camera_id, timestamp, confidence, labels, zones),
+        )
+        if not cursor.rowcount:
+            return
+        event_id = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO boxes (event_id, track_id, x, y, w, h) VALUES (?, ?, ?, ?, ?, ?)",
+            [(event_id, track_id, *box) for track_id, box in boxes],
+        )
+        jpeg = thumbnail(frame, [box for _, box in boxes]) if frame is not None else None
+        if jpeg is not None:
+            connection.execute("INSERT INTO thumbnails (event_id, jpeg) VALUES (?, ?)", (event_id, jpeg))
+
+    @staticmethod
+    def _end_segment(connection, path, end):
+        row = connection.execute("SELECT id, start_ts FROM segments WHERE path = ?", (path,)).fetchone()
+        if row is None or not os.path.exists(path):
+            return
+        segment_id, start = row
+        try:
+            _, fragments = fragment_index(path)
+        except (OSError, struct.error) as e:
+            logger.error("Could not index %s: %s", path, e)
+            fragments = []
+        connection.execute("UPDATE segments SET end_ts = ?, bytes = ? WHERE id = ?",
+                           (end, os.path.getsize(path), segment_id))
+        connection.executemany(
+            "INSERT OR REPLACE INTO fragments (segment_id, ts, byte_offset) VALUES (?, ?, ?)",
+            [(segment_id, start + offset_time, offset) for offset_time, offset in fragments],
+        )
+
+    # reads
+
+    def events(self, camera_id: int = None, start: float = None, end: float = None,
+               label: str = None, limit: int = 100, zone: str = None) -> List[dict]:
+        """
+        Events in [start, end), newest first.
+        """
+        clauses, args = [], []
+        if camera_id is not None:
+            clauses.append("camera_id = ?")
+            args.append(camera_id)
+        if start is not None:
+            clauses.append("ts >= ?")
+            args.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            args.append(end)
+        if label:
+            clauses.append("(',' || labels || ',') LIKE ?")
+            args.append(f"%,{label},%")
+        if zone:
+            clauses.append("(',' || zones || ',') LIKE ?")
+            args.append(f"%,{zone},%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader.execute(
+            f"SELECT id, camera_id, ts, end_ts, confidence, labels, zones FROM events {where} "
+            "ORDER BY ts DESC LIMIT ?", (*args, limit),
+        ).fetchall()
+        return [self._event_row(row) for row in rows]
+
+    @staticmethod
+    def _event_row(row: sqlite3.Row) -> dict:
+        return dict(row, labels=[l for l in (row["labels"] or "").split(",") if l],
+                    zones=[z for z in (row["zones"] or "").split(",") if z])
+
+    def event(self, event_id: int) -> Optional[dict]:
+        row = self._reader.execute(
+            "SELECT id, camera_id, ts, end_ts, confidence, labels, zones FROM events WHERE id = ?", (event_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        boxes = self._reader.execute(
+            "SELECT track_id, x, y, w, h FROM boxes WHERE event_id = ?", (event_id,)
+        ).fetchall()
+        event = self._event_row(row)
+        event["boxes"] = [dict(box) for box in boxes]
+        event["segment"] = self.segment_at(row["camera_id"], row["ts"])
+        return event
+
+    def thumbnail(self, event_id: int) -> Optional[bytes]:
+        row = self._reader.execute("SELECT jpeg FROM thumbnails WHERE event_id = ?", (event_id,)).fetchone()
+        return row["jpeg"] if row else None
+
+    def segments(self, camera_id: int = None, start: float = None, end: float = None,
+                 limit: int = 100) -> List[dict]:
+        """
+        Segments overlapping [start, end), newest first.
+        """
+        clauses, args = [], []
+        if camera_id is not None:
+            clauses.append("camera_id = ?")
+            args.append(camera_id)
+        if end is not None:
+            clauses.append("start_ts < ?")
+            args.append(end)
+        if start is not None:
+            clauses.append("(end_ts IS NULL OR end_ts >= ?)")
+            args.append(start)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader.execute(
+            f"SELECT * FROM segments {where} ORDER BY start_ts DESC LIMIT ?", (*args, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def segment(self, segment_id: int) -> Optional[dict]:
+        row = self._reader.execute("SELECT * FROM segments WHERE id = ?", (segment_id,)).fetchone()
+        return dict(row) if row else None
+
+    def segment_at(self, camera_id: int, timestamp: float) -> Optional[int]:
+        """
+        Id of the segment of `camera_id` that covers `timestamp`, if any.
+        """
+        row = self._reader.execute(
+            "SELECT id, end_ts FROM segments WHERE camera_id = ? AND start_ts <= ? "
+            "ORDER BY start_ts DESC LIMIT 1", (camera_id, timestamp),
+        ).fetchone()
+        if row is None or (row["end_ts"] is not None and row["end_ts"] < timestamp):
+            return None
+        return row["id"]
+
+    def seek(self, segment_id: int, timestamp: float) -> Optional[Tuple[float, int]]:
+        """
+        (fragment start time, byte offset) of the last fragment starting at
+        or before `timestamp`, i.e. the keyframe to start decoding from.
+        """
+        row = self._reader.execute(
+            "SELECT ts, byte_offset FROM fragments WHERE segment_id = ? AND ts <= ? "
+            "ORDER BY ts DESC LIMIT 1", (segment_id, timestamp),
+        ).fetchone()
+        if row is None:
+            row = self._reader.execute(
+                "SELECT ts, byte_offset FROM fragments WHERE segment_id = ? ORDER BY ts LIMIT 1", (segment_id,)
+            ).fetchone()
+        return (row["ts"], row["byte_offset"]) if row else None
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def shared(path: str = DEFAULT_PATH) -> Catalog:
+    """
+    Process-wide catalog, opened on first use.
+    """
+    global _catalog  # pylint: disable=global-statement
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog(path)
+    return _catalog
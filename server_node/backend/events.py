@@ -0,0 +1,66 @@
+"""
+Plain-Python event bus connecting the ingest pipeline to its consumers.
+
+The backend publishes from the event loop and from worker threads; the Qt
+GUI, the headless runner and anything else subscribe without the backend
+knowing about them.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable
+
+logger = logging.getLogger("events")
+
+# topics published by the backend
+STREAM_ADDED = "stream_added"  # camera_id
+STREAM_REMOVED = "stream_removed"  # camera_id
+MOTION = "motion"  # MotionEvent
+TRACK_ENDED = "track_ended"  # TrackEvent
+
+
+class EventBus:
+    """
+    Topic-based publish/subscribe that is safe to use from any thread.
+
+    `subscribe` callbacks run synchronously in the publishing thread and
+    must be quick. `subscribe_queue` delivers into an asyncio.Queue on the
+    given loop instead, for consumers that live in a coroutine.
+    """
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, callback: Callable[[Any], None]) -> None:
+        with self._lock:
+            self._subscribers[topic].append(callback)
+
+    def unsubscribe(self, topic: str, callback: Callable[[Any], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers[topic]:
+                self._subscribers[topic].remove(callback)
+
+    def subscribe_queue(self, topic: str, loop: asyncio.AbstractEventLoop,
+                        maxsize: int = 256) -> asyncio.Queue:
+        """
+        Returns a queue that receives `topic` payloads on `loop`; events are
+        dropped while the queue is full.
+        """
+        events = asyncio.Queue(maxsize=maxsize)
+
+        def put(payload):
+            if not events.full():
+                events.put_nowait(payload)
+
+        self.subscribe(topic, lambda payload: loop.call_soon_threadsafe(put, payload))
+        return events
+
+    def publish(self, topic: str, payload: Any = None) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers[topic])
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error("Subscriber to %s failed: %s", topic, e)
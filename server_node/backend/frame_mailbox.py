@@ -0,0 +1,66 @@
+"""
+Latest-frame-wins mailbox for handing frames between threads.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("frame_mailbox")
+
+
+class FrameMailbox:
+    """
+    Holds only the newest frame per camera.
+
+    Producers `post` from any thread and never block; a slow consumer simply
+    sees fewer frames instead of a growing backlog. Overwritten frames are
+    counted per camera. A frame travels with an optional overlay (boxes to
+    draw over it) so producers can post frames they share with other
+    consumers without drawing on them.
+
+    Listeners see every posted frame as it arrives, in the posting thread,
+    for consumers other than the one that takes frames out (remote viewers).
+    A failing listener is logged and never reaches the poster, so a viewer
+    can't stop a camera's receive loop.
+    """
+    def __init__(self):
+        self._frames: Dict[int, Tuple[np.ndarray, Any]] = {}
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[int, np.ndarray, Any], None]] = []
+        self.overwritten: Dict[int, int] = {}
+
+    def add_listener(self, callback: Callable[[int, np.ndarray, Any], None]) -> None:
+        """
+        Calls `callback(camera_id, frame, overlay)` on every post. It must
+        be quick and must not modify the frame.
+        """
+        self._listeners.append(callback)
+
+    def post(self, camera_id: int, frame: np.ndarray, overlay=None) -> None:
+        """
+        Replaces the pending frame of `camera_id` with `frame`. The frame
+        must not be modified after posting.
+        """
+        with self._cond:
+            if camera_id in self._frames:
+                self.overwritten[camera_id] = self.overwritten.get(camera_id, 0) + 1
+            self._frames[camera_id] = (frame, overlay)
+            self._cond.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(camera_id, frame, overlay)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error("Frame listener for camera %s failed: %s", camera_id, e)
+
+    def take_all(self, timeout: Optional[float] = None) -> Dict[int, Tuple[np.ndarray, Any]]:
+        """
+        Waits up to `timeout` for at least one frame, then empties the
+        mailbox. Returns camera_id -> (frame, overlay).
+        """
+        with self._cond:
+            if not self._frames:
+                self._cond.wait(timeout)
+            frames, self._frames = self._frames, {}
+            return frames
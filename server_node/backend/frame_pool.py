@@ -0,0 +1,103 @@
+"""
+Reusable frame buffers for the receive and display paths.
+
+At 1080p a frame is a 6 MB array, and allocating a fresh one for every
+decode, copy and colour conversion adds up to gigabytes per second of
+allocator churn across a camera wall. A FramePool keeps a few preallocated
+arrays and hands one out again once nothing references it any more.
+Consumers (processing lane, recorder queue, display mailbox, renderer) hold
+the array like any other; dropping the last reference is what returns it,
+so there is no release call to forget and a buffer that is still being read
+is never reused.
+"""
+import sys
+from typing import TYPE_CHECKING, Tuple
+
+import cv2
+import numpy as np
+
+if TYPE_CHECKING:
+    from av import VideoFrame  # only the receive path hands in frames; displays need no PyAV
+
+
+def _free_refcount() -> int:
+    # what sys.getrefcount reports for an array only the pool's list holds
+    buffers = [np.empty(0)]
+    return sys.getrefcount(buffers[0])
+
+
+FREE_REFCOUNT = _free_refcount()
+
+
+class FramePool:
+    """
+    Up to `capacity` arrays of one shape and dtype.
+
+    `acquire` is meant to be called from a single thread (the receive loop
+    of a camera, the renderer); any thread may hold and drop the arrays.
+    When every buffer is in use it falls back to a plain allocation, which
+    is counted in `misses` and not kept.
+    """
+    def __init__(self, capacity: int = 8):
+        self.capacity = capacity
+        self.shape = None
+        self.dtype = None
+        self._buffers = []
+        self.allocated = 0
+        self.misses = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """
+        Returns an array of `shape` that nothing else references. Its
+        contents are stale; the caller overwrites it.
+        """
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        if shape != self.shape or dtype != self.dtype:
+            # buffers of the old shape stay valid for whoever still holds them
+            self._buffers = []
+            self.shape, self.dtype = shape, dtype
+        for index in range(len(self._buffers)):
+            if sys.getrefcount(self._buffers[index]) <= FREE_REFCOUNT:
+                return self._buffers[index]
+
+        buffer = np.empty(shape, dtype)
+        if len(self._buffers) < self.capacity:
+            self._buffers.append(buffer)
+            self.allocated += 1
+        else:
+            self.misses += 1
+        return buffer
+
+    @property
+    def in_use(self) -> int:
+        return sum(sys.getrefcount(self._buffers[i]) > FREE_REFCOUNT for i in range(len(self._buffers)))
+
+
+class BgrConverter:
+    """
+    Converts decoded frames to BGR arrays taken from a pool.
+
+    Decoders hand out yuv420p; its planes are copied into one reused I420
+    buffer and colour-converted straight into a pooled array, so a frame
+    costs no allocation in steady state. Other pixel formats go through
+    PyAV's own conversion.
+    """
+    def __init__(self, capacity: int = 12):
+        self.pool = FramePool(capacity)
+        self._yuv = None
+
+    def convert(self, frame: "VideoFrame") -> np.ndarray:
+        width, height = frame.width, frame.height
+        if frame.format.name != "yuv420p" or width % 2 or height % 2:
+            return frame.to_ndarray(format="bgr24")
+
+        if self._yuv is None or self._yuv.shape != (height * 3 // 2, width):
+            self._yuv = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        flat = self._yuv.reshape(-1)
+        offset = 0
+        for plane, (rows, cols) in zip(frame.planes, ((height, width), (height // 2, width // 2),
+                                                      (height // 2, width // 2))):
+            source = np.frombuffer(plane, np.uint8)[:rows * plane.line_size].reshape(rows, plane.line_size)
+            flat[offset:offset + rows * cols].reshape(rows, cols)[:] = source[:, :cols]
+            offset += rows * cols
+        return cv2.cvtColor(self._yuv, cv2.COLOR_YUV2BGR_I420, dst=self.pool.acquire((height, width, 3)))
@@ -1,67 +1,311 @@
 import cv2
 import numpy as np
 import time
-import collections
+import functools
+import logging
+from dataclasses import dataclass
 from server_node import config
+from .metrics import metrics
+from .overlay import Overlay
+from . import motion_detection
+from .tracker import Tracker
+from .zones import parse_zones, zone_crop, zone_mask, zones_at
+
+logger = logging.getLogger("frame_processor")
+
+
+@dataclass(frozen=True)
+class MotionEvent:
+    """
+    Emitted on every processed frame whose motion confidence passes the
+    threshold. `started` is True only for the first frame of a new event.
+    `labels` lists the object classes that confirmed the motion when an
+    object filter is set, `tracks` the confirmed tracks in this frame and
+    `zones` the include zones they are in.
+    """
+    camera_id: int
+    timestamp: float
+    confidence: float
+    started: bool
+    labels: tuple = ()
+    tracks: tuple = ()
+    zones: tuple = ()
+
+
+@dataclass(frozen=True)
+class TrackEvent:
+    """
+    Emitted when a confirmed track disappears, with how long it was seen.
+    """
+    camera_id: int
+    track_id: int
+    first_seen: float
+    last_seen: float
+    dwell: float
+
+
+@functools.lru_cache(maxsize=None)
+def structuring_element(size: int) -> np.ndarray:
+    """
+    Elliptical kernel for the noise-removing open, built once per size.
+    """
+    return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
 
 
 class FrameProcessor:
     COOLDOWN_PERIOD = 2.0
     MOTION_CONFIDENCE_THRESHOLD = 0.7
+    KERNEL_SIZE = 7 # at full resolution
+    PREFILTER_SIZE = (32, 24) # thumbnail compared by the pre-filter
+    KNN_IDLE_INTERVAL = 10 # skipped frames between background model updates
+    OBJECT_HOLD = 1.0 # seconds a matching detection keeps confirming motion
 
-    def __init__(self, camera_id: int):
+    def __init__(self, camera_id: int, catalog=None):
         self.camera_id = camera_id
+        self.catalog = catalog # events are recorded here when given
         self.frameBackground = cv2.createBackgroundSubtractorKNN()
-        self.motionBuffer = collections.deque(maxlen=5)
+        self.detectionShape = None
+        self.tracker = Tracker()
+        self.motionConfidence = 0.0
         self.motionLogged = False
         self.lastMotionTime = 0
+        self.lastMotionSeen = 0
+        self.eventStart = None # timestamp of the open catalog event
         self.startTime = time.time()
         self.oneOrMoreContours = False
+        self.motionListeners = []
+        self.trackListeners = []
+        self.last_boxes = [] # boxes of the latest processed frame, for frames that skip detection
+        self.last_labels = [] # track ids drawn next to last_boxes
+        self.last_tracks = [] # tracks seen in the latest processed frame
+        self.overlay = Overlay() # last_boxes/last_labels as one immutable value for displays
+        self.zones = () # detection zones of this camera
+        self.frameSize = None # (width, height) of the last processed frame
+        self.scaledFrame = None # detection buffers, reused from frame to frame
+        self.grayFrame = None
+        self.prefilterReference = None # thumbnail of the last frame the background model saw
+        self.prefilterIdle = 0 # consecutive short-circuited frames
+        self.framesSeen = 0
+        self.framesSkipped = 0
+        self.objectConfirmedUntil = 0
+        self.lastObjects = [] # Detections that passed the class filter
+
+    def add_motion_listener(self, callback) -> None:
+        """
+        Registers `callback(MotionEvent)`; it runs on the processing thread.
+        """
+        self.motionListeners.append(callback)
+
+    def add_track_listener(self, callback) -> None:
+        """
+        Registers `callback(TrackEvent)` for confirmed tracks that ended.
+        """
+        self.trackListeners.append(callback)
+
+    def process(self, frame: np.ndarray, settings=None, timestamp: float = None) -> np.ndarray:
+        """
+        Detects and tracks motion in `frame` and emits events. The frame is
+        only read; its boxes are published as `overlay`. Live callers use
+        the current settings and clock; offline analysis passes its own
+        settings and the frame's recording time.
+        """
+        if settings is None:
+            settings = config.runtime.snapshot
+        boxes = self.detect(frame, settings)
+        now = time.time() if timestamp is None else timestamp
+        tracks, ended = self.tracker.update(boxes, now)
+        self.last_tracks = tracks
+        self.last_boxes = [track.box for track in tracks]
+        self.last_labels = [f"#{track.track_id}" for track in tracks]
+        self.overlay = Overlay(tuple(self.last_boxes), tuple(self.last_labels))
+        for track in ended:
+            event = TrackEvent(self.camera_id, track.track_id, track.first_seen, track.last_seen, track.dwell)
+            for callback in self.trackListeners:
+                callback(event)
+
+        # with an object filter, motion only counts once the detector confirms it
+        classes = motion_detection.parse_classes(settings.object_classes)
+        batcher = motion_detection.shared_batcher(settings.object_model) if classes else None
+        if batcher is None:
+            classes = frozenset()  # no model to check the classes with
+        elif boxes:
+            batcher.submit(self.camera_id, frame, boxes, functools.partial(self.on_objects, classes, now))
+        confirmed = not classes or now < self.objectConfirmedUntil
+
+        self.oneOrMoreContours = len(boxes) > 0 and confirmed
+        # persistent tracks, not single-frame blobs, make up the confidence
+        self.motionConfidence = self.tracker.confidence(now) if confirmed else 0.0
+
+        self.motion_detection(frame, now)
+
+        return frame
+
+    def on_objects(self, classes: frozenset, timestamp: float, detections: list) -> None:
+        """
+        Detector results for the motion frame taken at `timestamp`, called
+        from the batcher thread. The hold runs on the frames' clock, so it
+        also works for offline analysis.
+        """
+        matched = [d for d in detections if d.label in classes]
+        if matched:
+            self.lastObjects = matched
+            self.objectConfirmedUntil = max(self.objectConfirmedUntil, timestamp + self.OBJECT_HOLD)
+
+    def detect(self, frame: np.ndarray, settings) -> list:
+        """
+        Returns motion bounding boxes as (x, y, w, h) in full-frame pixels.
+
+        With detection zones, only the rectangle around the include zones
+        is looked at and motion outside the zones is masked out. Detection
+        runs on a copy downscaled by `settings.detection_scale` (and
+        converted to grayscale if `settings.detection_grayscale`); the
+        boxes are mapped back so they can be drawn on the original frame.
+        """
+        height, width = frame.shape[:2]
+        self.frameSize = (width, height)
+        self.zones = parse_zones(settings.detection_zones).get(self.camera_id, ())
+        left = top = 0
+        if self.zones:
+            left, top, crop_w, crop_h = zone_crop(self.zones, width, height)
+            if crop_w == 0 or crop_h == 0:
+                return []
+            frame = frame[top:top + crop_h, left:left + crop_w]
+
+        scale = settings.detection_scale
+        small = frame
+        if 0 < scale < 1.0:
+            small = self.scaledFrame = cv2.resize(frame, None, dst=self.scaledFrame, fx=scale, fy=scale,
+                                                  interpolation=cv2.INTER_AREA)
+        else:
+            scale = 1.0
+        if settings.detection_grayscale and small.ndim == 3:
+            small = self.grayFrame = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.grayFrame)
+
+        # the background model only works on one input shape
+        if small.shape != self.detectionShape:
+            self.frameBackground = cv2.createBackgroundSubtractorKNN()
+            self.detectionShape = small.shape
+            self.prefilterReference = None
+
+        self.framesSeen += 1
+        metrics.count("prefilter_frames", self.camera_id)
+        if self.prefilter(small, settings.prefilter_threshold):
+            self.framesSkipped += 1
+            metrics.count("prefilter_skipped", self.camera_id)
+            self.prefilterIdle += 1
+            if self.prefilterIdle % self.KNN_IDLE_INTERVAL == 0:
+                # keep the background model following slow scene changes
+                self.frameBackground.apply(small)
+                self.prefilterReference = self.thumbnail(small)
+            return []
+        self.prefilterIdle = 0
 
-    def process(self, frame: np.ndarray) -> np.ndarray:
-        frameMotion = self.frameBackground.apply(frame)
+        frameMotion = self.frameBackground.apply(small)
 
         # binary threshold of light gray pixels
         _, frameFiltered = cv2.threshold(
             frameMotion,
-            config.settings.value("Binary Threshold", 100, type=int),
+            settings.binary_threshold,
             255,
             cv2.THRESH_BINARY
         )
+        if self.zones:
+            mask = zone_mask(self.zones, width, height, (small.shape[1], small.shape[0]))
+            if mask is not None:
+                cv2.bitwise_and(frameFiltered, mask, dst=frameFiltered)
 
         # erodes then dilates pixel blobs to remove noise
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+        kernel = structuring_element(max(3, int(round(self.KERNEL_SIZE * scale)) | 1))
         frameEroded = cv2.morphologyEx(frameFiltered, cv2.MORPH_OPEN, kernel)
 
         # search for object contours
         contours, _ = cv2.findContours(frameEroded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        self.oneOrMoreContours = False
+        # contour size is configured in full-resolution pixels
+        minArea = settings.contour_size * scale * scale
+        boxes = []
         for contour in contours:
-            if cv2.contourArea(contour) > config.settings.value("Contour Size", 500, type=int):
-                self.oneOrMoreContours = True
+            if cv2.contourArea(contour) > minArea:
                 x, y, w, h = cv2.boundingRect(contour)
-                frame = cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+                if scale != 1.0:
+                    x, y = int(x / scale), int(y / scale)
+                    w, h = int(np.ceil(w / scale)), int(np.ceil(h / scale))
+                boxes.append((x + left, y + top, w, h))
 
-        self.motion_detection()
+        # while anything moves every frame goes through the full pipeline
+        self.prefilterReference = None if boxes else self.thumbnail(small)
+        return boxes
 
-        return frame
+    def thumbnail(self, small: np.ndarray) -> np.ndarray:
+        return cv2.resize(small, self.PREFILTER_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def prefilter(self, small: np.ndarray, threshold: int) -> bool:
+        """
+        First detection stage: True if the frame is close enough to the last
+        frame the background model saw that the expensive stages can be
+        skipped. Compares block means (a tiny thumbnail); any block whose
+        mean moved by more than `threshold` levels lets the frame through.
+        """
+        if threshold <= 0 or self.prefilterReference is None:
+            return False
+        change = np.abs(self.thumbnail(small) - self.prefilterReference)
+        return int(change.max()) <= threshold
+
+    @property
+    def skip_ratio(self) -> float:
+        """
+        Fraction of frames the pre-filter short-circuited.
+        """
+        return self.framesSkipped / self.framesSeen if self.framesSeen else 0.0
 
-    def motion_detection(self):
-        self.motionBuffer.append(self.oneOrMoreContours)
-        motionConfidencePercentage = sum(self.motionBuffer) / len(self.motionBuffer)
-        currentTime = time.time()
+    def zones_of(self, tracks) -> tuple:
+        """
+        Include zones the centres of `tracks` are in, sorted by name.
+        """
+        if not self.zones or self.frameSize is None:
+            return ()
+        width, height = self.frameSize
+        names = set()
+        for track in tracks:
+            x, y, w, h = track.box
+            names.update(zones_at(self.zones, (x + w / 2) / width, (y + h / 2) / height))
+        return tuple(sorted(names))
+
+    def motion_detection(self, frame: np.ndarray = None, currentTime: float = None):
+        motionConfidencePercentage = self.motionConfidence
+        if currentTime is None:
+            currentTime = time.time()
 
         if motionConfidencePercentage >= self.MOTION_CONFIDENCE_THRESHOLD:
+            started = False
             if not self.motionLogged and currentTime - self.lastMotionTime > self.COOLDOWN_PERIOD:
                 elapsed = currentTime - self.startTime
                 hours = int(elapsed // 3600)
                 mins = int((elapsed % 3600) // 60)
                 sec = int(elapsed % 60)
-                print(f"Movement detected on camera {self.camera_id} at {hours}:{mins}:{sec}")
+                logger.info("Movement detected on camera %s at %d:%d:%d", self.camera_id, hours, mins, sec)
 
                 self.motionLogged = True
                 self.lastMotionTime = currentTime
+                started = True
+
+            labels = tuple(sorted({d.label for d in self.lastObjects})) \
+                if currentTime < self.objectConfirmedUntil else ()
+            tracks = tuple(self.tracker.confirmed(self.last_tracks))
+            zones = self.zones_of(tracks)
+            event = MotionEvent(self.camera_id, currentTime, motionConfidencePercentage, started, labels, tracks,
+                                zones)
+            for callback in self.motionListeners:
+                callback(event)
+
+            self.lastMotionSeen = currentTime
+            if started and self.catalog is not None:
+                self.eventStart = currentTime
+                self.catalog.add_event(self.camera_id, currentTime, motionConfidencePercentage, labels,
+                                       [(t.track_id, t.box) for t in tracks], frame, zones)
 
         elif currentTime - self.lastMotionTime > self.COOLDOWN_PERIOD:
             self.motionLogged = False
+            if self.eventStart is not None and self.catalog is not None:
+                self.catalog.end_event(self.camera_id, self.eventStart, self.lastMotionSeen)
+            self.eventStart = None
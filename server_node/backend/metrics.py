@@ -0,0 +1,192 @@
+"""
+Low-overhead hot-path instrumentation.
+
+Stages record their durations into per-camera histograms with fixed
+buckets; an observation is a bisect and a few integer adds. The registry
+renders itself in the Prometheus text format for `/metrics`, and a small
+sampling profiler can dump collapsed stacks on demand.
+"""
+import bisect
+import collections
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# upper bounds in seconds, "+Inf" is implicit
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# pipeline stages, in frame order
+RECV = "recv"
+TO_NDARRAY = "to_ndarray"
+PROCESS = "process"
+RECORDER_WRITE = "recorder_write"
+GUI_EMIT = "gui_emit"
+RENDER = "render"
+PAINT = "paint"
+
+EWMA_ALPHA = 0.1
+
+
+class Histogram:
+    """
+    Cumulative-on-render histogram plus a moving average for overlays.
+
+    Updates are not locked: each (stage, camera) is written from one thread
+    in practice, and a rare lost increment is acceptable for telemetry.
+    """
+    __slots__ = ("counts", "total", "count", "recent")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = None
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        recent = self.recent
+        self.recent = seconds if recent is None else recent + EWMA_ALPHA * (seconds - recent)
+
+    def state(self) -> tuple:
+        return list(self.counts), self.total, self.count
+
+    def merge(self, state: tuple) -> None:
+        counts, total, count = state
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += total
+        self.count += count
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.started = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter_ns() - self.started) * 1e-9)
+        return False
+
+
+class Metrics:
+    """
+    Registry of stage histograms and counters keyed by camera id.
+    """
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, int], Histogram] = {}
+        self._counters: Dict[Tuple[str, int], int] = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str, camera_id: int) -> Histogram:
+        key = (stage, camera_id)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, stage: str, camera_id: int, seconds: float) -> None:
+        self.histogram(stage, camera_id).observe(seconds)
+
+    def timer(self, stage: str, camera_id: int) -> _Timer:
+        """
+        Context manager that records the duration of its block.
+        """
+        return _Timer(self.histogram(stage, camera_id))
+
+    def count(self, name: str, camera_id: int, amount: int = 1) -> None:
+        self._counters[(name, camera_id)] += amount
+
+    def counter(self, name: str, camera_id: int) -> int:
+        return self._counters.get((name, camera_id), 0)
+
+    def recent(self, stage: str, camera_id: int) -> Optional[float]:
+        """
+        Moving average duration of a stage in seconds, or None if unseen.
+        """
+        histogram = self._histograms.get((stage, camera_id))
+        return histogram.recent if histogram is not None else None
+
+    def snapshot(self) -> dict:
+        """
+        Picklable copy of all values, for merging across processes.
+        """
+        with self._lock:
+            histograms = {key: h.state() for key, h in self._histograms.items()}
+        return {"histograms": histograms, "counters": dict(self._counters)}
+
+    def render(self, others: Iterable[dict] = (), gauges: Dict[str, Dict[int, float]] = None) -> str:
+        """
+        Prometheus text exposition of this registry merged with `others`
+        (snapshots from other processes) plus per-camera `gauges`.
+        """
+        merged: Dict[Tuple[str, int], Histogram] = {}
+        counters: Dict[Tuple[str, int], int] = collections.defaultdict(int)
+        for snapshot in [self.snapshot(), *others]:
+            for key, state in snapshot["histograms"].items():
+                merged.setdefault(key, Histogram()).merge(state)
+            for key, value in snapshot["counters"].items():
+                counters[key] += value
+
+        lines = [
+            "# HELP camera_stage_seconds Time spent in each pipeline stage per frame",
+            "# TYPE camera_stage_seconds histogram",
+        ]
+        bounds = [repr(b) for b in BUCKETS] + ["+Inf"]
+        for (stage, camera_id), histogram in sorted(merged.items()):
+            labels = f'stage="{stage}",camera="{camera_id}"'
+            cumulative = 0
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'camera_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"camera_stage_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"camera_stage_seconds_count{{{labels}}} {histogram.count}")
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE camera_{name}_total counter")
+            for (counter, camera_id), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'camera_{name}_total{{camera="{camera_id}"}} {value}')
+
+        for name, values in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE camera_{name} gauge")
+            for camera_id, value in sorted(values.items()):
+                lines.append(f'camera_{name}{{camera="{camera_id}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def sample_profile(seconds: float = 5.0, interval: float = 0.005) -> str:
+    """
+    Samples the stacks of all threads for `seconds` and returns them in the
+    collapsed format ("frame;frame;frame count") used by flame graph tools.
+    Blocking; run it in a worker thread.
+    """
+    stacks = collections.Counter()
+    me = threading.get_ident()
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names.update({t.ident: t.name for t in threading.enumerate()})
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident == me:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(parts))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
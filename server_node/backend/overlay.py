@@ -0,0 +1,36 @@
+"""
+Boxes drawn over displayed frames.
+
+Kept apart from frame_processor so displays (the GUI, the MJPEG relay,
+catalog thumbnails) can draw boxes without loading the detection pipeline.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Overlay:
+    """
+    Boxes and labels of a camera's latest processed frame. Displays draw it
+    over their own copy of the frame, so frames are never drawn on in place
+    and can be shared with the recorder and processing without copies.
+    """
+    boxes: tuple = ()
+    labels: tuple = ()
+
+
+def draw_boxes(frame: np.ndarray, boxes, labels=None, scale: float = 1.0) -> np.ndarray:
+    """
+    Draws motion boxes (x, y, w, h) onto `frame` in place and returns it,
+    with an optional text label above each box. `scale` maps box
+    coordinates onto a resized frame.
+    """
+    for i, box in enumerate(boxes):
+        x, y, w, h = (int(v * scale) for v in box) if scale != 1.0 else box
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+        label = labels[i] if labels and i < len(labels) else None
+        if label:
+            cv2.putText(frame, label, (x, max(12, y - 4)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    return frame
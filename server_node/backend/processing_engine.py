@@ -0,0 +1,159 @@
+"""
+Processing engine that runs FrameProcessor work off the signaling event loop.
+
+Each camera gets its own lane. A lane runs at most one frame at a time on a
+shared, bounded thread pool, so the KNN background model of a camera is only
+ever touched by one worker at a time. While a lane is busy it keeps only the
+newest pending frame; older pending frames are dropped and counted.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger("processing_engine")
+
+
+@dataclass(frozen=True)
+class LaneStats:
+    """
+    Point-in-time counters for a single camera lane.
+    """
+    camera_id: int
+    queue_depth: int
+    submitted: int
+    processed: int
+    dropped: int
+
+
+class _Lane:
+    """
+    Per-camera slot holding the frame in flight and the newest pending frame.
+    """
+    def __init__(self, camera_id: int, process: Callable[[np.ndarray], np.ndarray],
+                 on_result: Callable[[int, np.ndarray], None]):
+        self.camera_id = camera_id
+        self.process = process
+        self.on_result = on_result
+        self.busy = False
+        self.pending: Optional[np.ndarray] = None
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.closed = False
+
+
+class ProcessingEngine:
+    """
+    Hands frames to a bounded thread pool, one serial lane per camera.
+
+    OpenCV releases the GIL inside its heavy calls, so a thread pool gives
+    real parallelism across cameras without pickling frames to processes.
+    """
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="frame-worker"
+        )
+        self._lanes: Dict[int, _Lane] = {}
+        self._lock = threading.Lock()
+
+    def register(self, camera_id: int, process: Callable[[np.ndarray], np.ndarray],
+                 on_result: Callable[[int, np.ndarray], None]) -> None:
+        """
+        Creates the lane for a camera. `on_result` is called from a worker thread.
+        """
+        with self._lock:
+            old = self._lanes.get(camera_id)
+            if old is not None:
+                old.closed = True
+            self._lanes[camera_id] = _Lane(camera_id, process, on_result)
+
+    def unregister(self, camera_id: int) -> None:
+        """
+        Removes a camera lane; a frame already in flight is allowed to finish.
+        """
+        with self._lock:
+            lane = self._lanes.pop(camera_id, None)
+            if lane is not None:
+                lane.closed = True
+                lane.pending = None
+
+    def submit(self, camera_id: int, frame: np.ndarray) -> bool:
+        """
+        Queues a frame for processing without blocking.
+
+        Returns False if the frame replaced an older pending frame that was
+        dropped, True otherwise.
+        """
+        with self._lock:
+            lane = self._lanes.get(camera_id)
+            if lane is None or lane.closed:
+                return False
+            lane.submitted += 1
+            if lane.busy:
+                replaced = lane.pending is not None
+                if replaced:
+                    lane.dropped += 1
+                lane.pending = frame
+                return not replaced
+            lane.busy = True
+        self._executor.submit(self._run, lane, frame)
+        return True
+
+    def busy(self, camera_id: int) -> bool:
+        """
+        True while a frame of this camera is being processed or pending.
+        """
+        lane = self._lanes.get(camera_id)
+        return lane is not None and lane.busy
+
+    def _run(self, lane: _Lane, frame: np.ndarray) -> None:
+        try:
+            result = lane.process(frame)
+            if not lane.closed:
+                lane.on_result(lane.camera_id, result)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Processing failed for camera %s: %s", lane.camera_id, e)
+
+        with self._lock:
+            lane.processed += 1
+            frame = lane.pending
+            lane.pending = None
+            if frame is None:
+                lane.busy = False
+                return
+        # requeue behind other lanes so one busy camera can't hog a worker
+        self._executor.submit(self._run, lane, frame)
+
+    def stats(self) -> Dict[int, LaneStats]:
+        """
+        Returns per-camera queue depth and dropped-frame counts.
+        """
+        with self._lock:
+            return {
+                cid: LaneStats(
+                    camera_id=cid,
+                    queue_depth=int(lane.busy) + int(lane.pending is not None),
+                    submitted=lane.submitted,
+                    processed=lane.processed,
+                    dropped=lane.dropped,
+                )
+                for cid, lane in self._lanes.items()
+            }
+
+    def shutdown(self) -> None:
+        """
+        Stops accepting frames and waits for in-flight work.
+        """
+        with self._lock:
+            for lane in self._lanes.values():
+                lane.closed = True
+                lane.pending = None
+            self._lanes.clear()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,152 @@
+"""
+Load-aware scheduling of detection work across cameras.
+
+Instead of processing every n-th frame of every camera, the scheduler shares
+a CPU budget (a fraction of the processing engine's workers) between all
+cameras. Each camera gets a processing rate proportional to its weight:
+cameras with recent motion weigh `motion_priority` times more than idle
+ones, and idle cameras keep a floor rate so new motion is still noticed.
+Rates are capped at the camera's input fps and re-planned a few times a
+second from measured per-frame processing cost, so load is shed gradually
+as cameras are added or frames get more expensive.
+"""
+import threading
+import time
+from typing import Dict
+
+from .metrics import metrics, PROCESS
+
+REPLAN_INTERVAL = 0.5  # seconds between rate allocations
+MOTION_HOLD = 3.0  # seconds a camera counts as active after its last motion event
+DEFAULT_COST = 0.02  # assumed seconds per processed frame until measured
+FPS_ALPHA = 0.1
+
+
+class _CameraState:
+    __slots__ = ("last_frame", "interval", "last_motion", "credit", "rate")
+
+    def __init__(self):
+        self.last_frame = None
+        self.interval = None  # moving average seconds between input frames
+        self.last_motion = float("-inf")
+        self.credit = 1.0  # process the first frame right away
+        self.rate = None  # allocated frames per second, None until planned
+
+
+class AdaptiveScheduler:
+    """
+    Decides per incoming frame whether a camera's frame should be processed.
+
+    `should_process` is called from the receive loop of every camera and is
+    a few float operations; the allocation itself runs every
+    REPLAN_INTERVAL seconds.
+    """
+    def __init__(self, capacity: float):
+        self.capacity = capacity  # processing seconds available per second
+        self._cameras: Dict[int, _CameraState] = {}
+        self._lock = threading.Lock()
+        self._next_plan = 0.0
+
+    def remove(self, camera_id: int) -> None:
+        with self._lock:
+            self._cameras.pop(camera_id, None)
+
+    def note_motion(self, camera_id: int, timestamp: float = None) -> None:
+        """
+        Marks a camera as showing motion; called from the motion listeners.
+        """
+        state = self._cameras.get(camera_id)
+        if state is not None:
+            state.last_motion = time.monotonic() if timestamp is None else timestamp
+
+    def rate(self, camera_id: int) -> float:
+        """
+        Currently allocated processing rate of a camera in frames per second.
+        """
+        state = self._cameras.get(camera_id)
+        if state is None or state.rate is None:
+            return 0.0
+        return state.rate
+
+    def should_process(self, camera_id: int, settings, now: float = None) -> bool:
+        """
+        Records an input frame and returns True if it is due for processing.
+        Credit accrues at the allocated rate, so any rate up to the input fps
+        is met on average, not just whole fractions of it.
+        """
+        now = time.monotonic() if now is None else now
+        state = self._cameras.get(camera_id)
+        if state is None:
+            with self._lock:
+                state = self._cameras.setdefault(camera_id, _CameraState())
+
+        if state.last_frame is not None:
+            elapsed = now - state.last_frame
+            state.interval = elapsed if state.interval is None \
+                else state.interval + FPS_ALPHA * (elapsed - state.interval)
+            if state.rate is not None:
+                state.credit += state.rate * elapsed
+        state.last_frame = now
+
+        if now >= self._next_plan:
+            self._plan(settings, now)
+
+        due = state.credit >= 1.0
+        if due:
+            state.credit -= 1.0
+        # at most one frame of backlog, a stalled camera can't burst later
+        state.credit = min(state.credit, 1.0)
+        return due
+
+    def _plan(self, settings, now: float) -> None:
+        """
+        Water-fills the budget: rates proportional to weight, each camera
+        between its floor and its input fps, total cost within budget.
+        """
+        with self._lock:
+            if now < self._next_plan:
+                return
+            self._next_plan = now + REPLAN_INTERVAL
+            budget = self.capacity * settings.processing_budget / 100
+
+            demands = {}
+            for camera_id, state in self._cameras.items():
+                if state.interval is None or state.interval <= 0:
+                    continue
+                fps = 1.0 / state.interval
+                cost = metrics.recent(PROCESS, camera_id) or DEFAULT_COST
+                weight = settings.motion_priority if now - state.last_motion < MOTION_HOLD else 1.0
+                floor = min(fps, settings.idle_process_fps)
+                demands[camera_id] = (fps, max(cost, 1e-4), weight, floor)
+            if not demands:
+                return
+
+            # floors first; if even they don't fit, scale them down evenly
+            floor_cost = sum(floor * cost for _, cost, _, floor in demands.values())
+            if floor_cost >= budget:
+                shrink = budget / floor_cost if floor_cost > 0 else 0.0
+                for camera_id, (_, _, _, floor) in demands.items():
+                    self._cameras[camera_id].rate = floor * shrink
+                return
+
+            # share the rest by weight, re-sharing what capped cameras don't use
+            rates = {camera_id: floor for camera_id, (_, _, _, floor) in demands.items()}
+            remaining = budget - floor_cost
+            open_ids = set(demands)
+            while open_ids and remaining > 1e-9:
+                weighted_cost = sum(demands[c][2] * demands[c][1] for c in open_ids)
+                share = remaining / weighted_cost  # extra fps per unit weight
+                capped = set()
+                for camera_id in open_ids:
+                    fps, cost, weight, _ = demands[camera_id]
+                    extra = min(share * weight, fps - rates[camera_id])
+                    rates[camera_id] += extra
+                    remaining -= extra * cost
+                    if rates[camera_id] >= fps - 1e-9:
+                        capped.add(camera_id)
+                if not capped:
+                    break
+                open_ids -= capped
+
+            for camera_id, rate in rates.items():
+                self._cameras[camera_id].rate = rate
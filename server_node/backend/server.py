@@ -1,31 +1,129 @@
 """
 Backend server module handling WebRTC connections and video processing.
+
+Only what it takes to answer offers is imported up front. The per-camera
+pipeline (detection, recording and the catalog) is loaded by
+`load_pipeline` once the server listens, or by the first track or
+catalog request if that comes sooner.
 """
 import logging
 import asyncio
+import json
+import threading
+import time
+from typing import TYPE_CHECKING
+import cv2
 import numpy as np
 import uvicorn
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
 from av import VideoFrame
-from PyQt5.QtCore import QThread, pyqtSignal, QObject  # pylint: disable=no-name-in-module
 from server_node import config
-from .frame_processor import FrameProcessor
-from .video_recorder import VideoRecorder
+from server_node.startup import profile
+from . import events
+from .frame_pool import BgrConverter
+from .metrics import metrics, sample_profile, RECV, TO_NDARRAY, PROCESS, GUI_EMIT
+from .processing_engine import ProcessingEngine
+from .scheduler import AdaptiveScheduler
+from .streams import StreamConnectManager, stream_manager  # pylint: disable=unused-import
+from .viewer_relay import BOUNDARY, ViewerRelay
+
+if TYPE_CHECKING:
+    from .frame_processor import MotionEvent, TrackEvent
 
 logger = logging.getLogger("webrtc_server")
 
-class StreamConnectManager(QObject):
-    """
-    Manages signals for stream connection and frame updates.
-    """
-    stream_added = pyqtSignal(int)
-    frame_ready = pyqtSignal(int, np.ndarray)
-stream_manager = StreamConnectManager()
+# remote viewers watch the same decoded frames as the local display
+viewers = ViewerRelay()
+stream_manager.frames.add_listener(viewers.on_frame)
+engine = ProcessingEngine()
+scheduler = AdaptiveScheduler(capacity=engine.max_workers)
 pcs = set()
+peer_cameras = {}  # RTCPeerConnection -> camera ids it carries
+receivers = {}  # camera_id -> VideoReceiver currently feeding the camera's lane
+control_channels = {}  # camera_id -> RTCDataChannel opened by the camera node
+addressed_cameras = set()  # cameras on multi-camera nodes, whose control messages name the camera
+camera_health = {}  # camera_id -> latest health report from its node
+shard_pool = None  # set by sharding.ShardPool.start() in multi-process mode
 
 app = FastAPI()
 
+
+def load_pipeline() -> None:
+    """
+    Imports the per-camera pipeline: detection, recording and the catalog.
+    """
+    with profile.stage("load pipeline"):
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import catalog, frame_processor, video_recorder
+    profile.mark("pipeline loaded")
+
+
+def shared_catalog():
+    from . import catalog  # pylint: disable=import-outside-toplevel
+    return catalog.shared()
+
+
+RTP_WRAP = 1 << 32  # RTP timestamps are 32 bit
+MAX_CLOCK_DRIFT = 2.0  # seconds a mapped timestamp may stray from wall time
+
+
+class WallClock:
+    """
+    Maps a track's RTP timestamps to wall time.
+
+    The sender starts its RTP clock at a random value and it wraps about
+    every 13 hours at 90 kHz, so timestamps are unwrapped and anchored to
+    `time.time()` at the first frame. Frames keep their capture spacing
+    rather than their arrival jitter. The clock is anchored again if it
+    strays from wall time, e.g. after the sender restarted its clock.
+    """
+    def __init__(self):
+        self.offset = None
+        self.last_pts = None
+        self.wraps = 0
+
+    def stamp(self, frame: VideoFrame) -> float:
+        now = time.time()
+        if frame.pts is None or frame.time_base is None:
+            return now
+        if self.last_pts is not None and frame.pts < self.last_pts - RTP_WRAP // 2:
+            self.wraps += 1
+        self.last_pts = frame.pts
+        media_time = float((frame.pts + self.wraps * RTP_WRAP) * frame.time_base)
+        if self.offset is None or abs(self.offset + media_time - now) > MAX_CLOCK_DRIFT:
+            self.offset = now - media_time
+        return self.offset + media_time
+
+
+class StreamResolution:
+    """
+    Keeps a stream at one resolution.
+
+    Camera nodes drop to a lower resolution while their scene is static
+    (`idle_scale`). Scaling those frames back up keeps the background model,
+    the open recording segment and the displays on one size instead of
+    starting over on every switch. Idle frames come at the keep-alive rate,
+    so the resize is cheap. A larger frame or a different aspect ratio
+    becomes the new resolution.
+    """
+    ASPECT_TOLERANCE = 0.02
+
+    def __init__(self):
+        self.size = None  # (width, height)
+
+    def fit(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        if (width, height) == self.size:
+            return frame
+        if self.size is None or width * height > self.size[0] * self.size[1] \
+                or abs(width / height - self.size[0] / self.size[1]) > self.ASPECT_TOLERANCE:
+            self.size = (width, height)
+            return frame
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+
+
 class VideoReceiver:
     """
     Handles receiving and processing video frames from a WebRTC track.
@@ -33,76 +131,204 @@ class VideoReceiver:
     def __init__(self, track: MediaStreamTrack, camera_id: int):
         self.track = track
         self.camera_id = camera_id
-        self.processor = FrameProcessor(camera_id)
-        self.recorder = VideoRecorder()
+        # pylint: disable=import-outside-toplevel
+        from .frame_processor import FrameProcessor
+        from .video_recorder import VideoRecorder
+        self.processor = FrameProcessor(camera_id, catalog=shared_catalog())
+        self.recorder = VideoRecorder(camera_id, catalog=shared_catalog())
+        # decoded frames land in pooled buffers; the recorder, the processing
+        # lane and the display all share one array per frame and only read it
+        self.converter = BgrConverter()
+        self.clock = WallClock()
+        self.resolution = StreamResolution()
         self.frame_count = 0
-        self.last_processed = None
+        self.submitted_frame = 0
+        self.processor.add_motion_listener(self._on_motion)
+        self.processor.add_track_listener(self._on_track_ended)
+        self._process_time = metrics.histogram(PROCESS, camera_id)
+        self._emit_time = metrics.histogram(GUI_EMIT, camera_id)
+        engine.register(camera_id, self._process, self._on_processed)
+        receivers[camera_id] = self
+
+    def _process(self, frame: np.ndarray) -> np.ndarray:
+        started = time.perf_counter_ns()
+        processed = self.processor.process(frame)
+        self._process_time.observe((time.perf_counter_ns() - started) * 1e-9)
+        return processed
+
+    def _post(self, frame: np.ndarray, overlay=None):
+        started = time.perf_counter_ns()
+        stream_manager.frames.post(self.camera_id, frame, overlay)
+        self._emit_time.observe((time.perf_counter_ns() - started) * 1e-9)
+
+    def _on_processed(self, _camera_id: int, processed: np.ndarray):
+        """
+        Called from a processing worker once a frame is done. If newer
+        frames were already shown with the previous boxes, the result is
+        not shown; its boxes go out on the next frame instead.
+        """
+        if not config.runtime.snapshot.raw_view and self.submitted_frame == self.frame_count:
+            self._post(processed, self.processor.overlay)
+
+    def _on_motion(self, event: "MotionEvent"):
+        """
+        Motion opens or extends a clip when motion recording is on and
+        raises the camera's share of the processing budget.
+        """
+        self.recorder.trigger()
+        scheduler.note_motion(self.camera_id)
+        if event.started:
+            stream_manager.events.publish(events.MOTION, event)
+
+    def _on_track_ended(self, event: "TrackEvent"):
+        stream_manager.events.publish(events.TRACK_ENDED, event)
 
     async def run(self):
         """
         Continuously receives frames from the track and processes them.
         """
-        throttle_rate = config.settings.value("FRAME_THROTTLE_RATE", 1)
+        recv_time = metrics.histogram(RECV, self.camera_id)
+        convert_time = metrics.histogram(TO_NDARRAY, self.camera_id)
         while True:
             try:
+                started = time.perf_counter_ns()
                 frame: VideoFrame = await self.track.recv()
-                img = frame.to_ndarray(format="bgr24")
+                received = time.perf_counter_ns()
+                timestamp = self.clock.stamp(frame)
+                img = self.resolution.fit(self.converter.convert(frame))
+                recv_time.observe((received - started) * 1e-9)
+                convert_time.observe((time.perf_counter_ns() - received) * 1e-9)
 
                 self.frame_count += 1
+                # one attribute read per frame, ControlBar pushes new snapshots
+                settings = config.runtime.snapshot
 
-                # handle recording
-                # since this is async/threaded, direct config read is okay but might be racy.
-                # ideally we use a signal, but polling config for now is consistent with legacy app.
-                is_recording = config.settings.value("RECORDING_TOGGLE", False, type=bool)
-                if is_recording:
+                # handle recording, the manual toggle records everything
+                if settings.recording:
+                    self.recorder.disarm()
                     if not self.recorder.recording:
                         self.recorder.start_recording()
-                    self.recorder.add_frame(img)
+                elif settings.motion_recording:
+                    # clips are opened by motion events and closed after the post-roll
+                    self.recorder.arm()
+                    if self.recorder.recording and not self.recorder.in_clip:
+                        self.recorder.end_recording()
                 else:
+                    self.recorder.disarm()
                     if self.recorder.recording:
                         self.recorder.end_recording()
-                if config.settings.value("Raw View", True, type=bool):
-                    stream_manager.frame_ready.emit(self.camera_id, img)
-                else:
-                    if self.frame_count % throttle_rate == 0:
-                        processed = self.processor.process(img.copy())
-                        self.last_processed = processed
-                    else:
-                        processed = self.last_processed
-                    if processed is not None:
-                        stream_manager.frame_ready.emit(self.camera_id, processed)
+                self.recorder.add_frame(img, timestamp)
+
+                # motion recording needs detection even while showing the raw view
+                process_due = False
+                if not settings.raw_view or settings.motion_recording:
+                    # a due frame waits in the lane if it is busy; a newer one replaces it and counts as dropped
+                    process_due = scheduler.should_process(self.camera_id, settings)
+                if process_due:
+                    # processing runs on the engine's pool, result is emitted from there
+                    self.submitted_frame = self.frame_count
+                    engine.submit(self.camera_id, img)
+
+                if settings.raw_view:
+                    self._post(img)
+                elif not process_due:
+                    # fresh frame with the latest boxes, drawn by the display
+                    self._post(img, self.processor.overlay)
 
             except Exception as e:  # pylint: disable=broad-exception-caught
                 logger.error("Track ended or error for camera %s: %s", self.camera_id, e)
-                self.recorder.end_recording()
+                self.recorder.close()
+                # after a reconnect the camera's lane belongs to the new receiver
+                if receivers.get(self.camera_id) is self:
+                    del receivers[self.camera_id]
+                    engine.unregister(self.camera_id)
+                    scheduler.remove(self.camera_id)
+                    stream_manager.events.publish(events.STREAM_REMOVED, self.camera_id)
                 break
 
 @app.post("/offer")
 async def offer(request: Request):
     """
-    WebRTC offer endpoint. Initiates a peer connection.
+    WebRTC offer endpoint. Initiates a peer connection, in this process or
+    on the least loaded ingest worker when sharding is enabled.
     """
     params = await request.json()
+    if shard_pool is not None:
+        return await shard_pool.offer(params)
+    return await accept_offer(params)
+
+
+def offer_cameras(params: dict) -> set:
+    """
+    Camera ids an offer carries. Multi-camera nodes map each transceiver
+    mid to a camera in "tracks"; single-camera nodes only send "camera_id".
+    """
+    tracks = params.get("tracks")
+    if tracks:
+        return {int(camera_id) for camera_id in tracks.values()}
+    return {int(params.get("camera_id", 0))}
+
+
+async def accept_offer(params: dict) -> dict:
+    """
+    Creates the peer connection for an offer and returns the answer.
+    """
     camera_id = params.get("camera_id", 0) # we default to 0 if not provided
+    track_cameras = {str(mid): int(cid) for mid, cid in (params.get("tracks") or {}).items()}
+    cameras = offer_cameras(params)
+
+    # a reconnecting node replaces its old connection straight away
+    # instead of waiting for the old one to time out
+    for stale in [p for p, carried in peer_cameras.items() if carried & cameras]:
+        logger.info("Replacing connection of cameras %s", sorted(peer_cameras[stale]))
+        await stale.close()
 
     rtc_offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
 
     pc = RTCPeerConnection()
     pcs.add(pc)
+    peer_cameras[pc] = cameras
 
     @pc.on("track")
     def on_track(track):
-        logger.info(f"Received track {track.kind} from camera {camera_id}")
+        track_camera = camera_id
+        if track_cameras:
+            mid = next((t.mid for t in pc.getTransceivers() if t.receiver.track is track), None)
+            track_camera = track_cameras.get(mid)
+            if track_camera is None:
+                logger.warning("Ignoring track with unmapped mid %s", mid)
+                return
+        logger.info(f"Received track {track.kind} from camera {track_camera}")
         if track.kind == "video":
-            # notify GUI of new stream & start receiver
-            stream_manager.stream_added.emit(camera_id)
-            receiver = VideoReceiver(track, camera_id)
+            # notify subscribers of new stream & start receiver
+            stream_manager.events.publish(events.STREAM_ADDED, track_camera)
+            receiver = VideoReceiver(track, track_camera)
             asyncio.ensure_future(receiver.run())
 
+    opened_channels = []
+
+    @pc.on("datachannel")
+    def on_datachannel(channel):
+        if channel.label == "control":
+            for cid in cameras:
+                control_channels[cid] = channel
+                # older nodes apply every control message to their only camera
+                if track_cameras:
+                    addressed_cameras.add(cid)
+                else:
+                    addressed_cameras.discard(cid)
+            opened_channels.append(channel)
+            channel.on("message", on_node_message)
+
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
         if pc.connectionState in ("failed", "closed"):
             pcs.discard(pc)
+            peer_cameras.pop(pc, None)
+            # a reconnected camera may already have registered a newer channel
+            for cid in cameras:
+                if control_channels.get(cid) in opened_channels:
+                    control_channels.pop(cid, None)
 
     await pc.setRemoteDescription(rtc_offer)
     answer = await pc.createAnswer()
@@ -111,12 +337,249 @@ async def offer(request: Request):
     return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
 
 
-class SignalingServerWorker(QThread):
+def on_node_message(message) -> None:
     """
-    Worker thread to run the Uvicorn server for signaling.
+    Stores the per-track health reports camera nodes send over the control channel.
     """
-    def run(self):
-        """
-        Starts the uvicorn server.
-        """
-        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    try:
+        body = json.loads(message)
+        if body.get("type") != "health":
+            return
+        for cid, health in body["cameras"].items():
+            camera_health[int(cid)] = dict(health, connection=body.get("connection"),
+                                           reconnects=body.get("reconnects", 0), received=time.time())
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.warning("Bad message from camera node %r: %s", message, e)
+
+
+@app.post("/cameras/{camera_id}/stream_mode")
+async def set_stream_mode(camera_id: int, request: Request):
+    """
+    Overrides a camera node's bandwidth mode.
+
+    Body fields are passed through to the node's MotionGate, e.g.
+    {"mode": "full"} or {"mode": "auto", "keepalive_fps": 0.5}.
+    """
+    body = await request.json()
+    sent = shard_pool.send_control(camera_id, body) if shard_pool is not None \
+        else send_control(camera_id, body)
+    if not sent:
+        raise HTTPException(status_code=404, detail=f"No control channel for camera {camera_id}")
+    return {"camera_id": camera_id, "sent": True}
+
+
+def send_control(camera_id: int, body: dict) -> bool:
+    """
+    Sends a control message to a camera node connected to this process.
+    """
+    channel = control_channels.get(camera_id)
+    if channel is None or channel.readyState != "open":
+        return False
+    if camera_id in addressed_cameras:
+        # the channel is shared by every camera on the node
+        body = dict(body, camera_id=camera_id)
+    channel.send(json.dumps(body))
+    return True
+
+
+@app.get("/cameras/health")
+async def get_camera_health():
+    """
+    Latest per-track health reported by the camera nodes: capture and send
+    rate, bitrate, bandwidth mode and connection state.
+    """
+    if shard_pool is not None:
+        return await shard_pool.camera_health()
+    return health_report()
+
+
+def health_report() -> dict:
+    """
+    Health reports received by this process, keyed by camera id, with
+    their age in seconds.
+    """
+    now = time.time()
+    return {
+        str(cid): dict(health, age=round(now - health["received"], 1), streaming=cid in receivers)
+        for cid, health in camera_health.items()
+    }
+
+
+@app.get("/cameras/{camera_id}/mjpeg")
+async def camera_mjpeg(camera_id: int, boxes: bool = True, width: int = None, fps: float = None):
+    """
+    Live MJPEG stream of a camera for remote viewers, e.g. an <img> tag.
+    `boxes` draws the latest detection boxes, `width` scales the stream
+    down and `fps` caps this viewer's rate. Each camera is encoded once
+    per variant however many viewers watch it.
+    """
+    if width is not None and not 16 <= width <= 7680:
+        raise HTTPException(status_code=400, detail="width must be in [16, 7680]")
+    if fps is not None and fps <= 0:
+        raise HTTPException(status_code=400, detail="fps must be positive")
+    streaming = camera_id in receivers if shard_pool is None \
+        else any(camera_id in worker.cameras for worker in shard_pool.workers)
+    if not streaming:
+        raise HTTPException(status_code=404, detail=f"Camera {camera_id} is not streaming")
+    return StreamingResponse(viewers.stream(camera_id, boxes, width, fps),
+                             media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+                             headers={"Cache-Control": "no-store"})
+
+
+@app.get("/stats/processing")
+async def processing_stats():
+    """
+    Per-camera processing queue depth and dropped-frame counts.
+    """
+    if shard_pool is not None:
+        return await shard_pool.processing_stats()
+    return lane_stats()
+
+
+def lane_stats() -> dict:
+    """
+    Processing engine counters of this process, keyed by camera id.
+    """
+    def skipped_ratio(cid):
+        frames = metrics.counter("prefilter_frames", cid)
+        return round(metrics.counter("prefilter_skipped", cid) / frames, 3) if frames else 0.0
+
+    return {
+        str(cid): {
+            "queue_depth": s.queue_depth,
+            "submitted": s.submitted,
+            "processed": s.processed,
+            "dropped": s.dropped,
+            "scheduled_fps": round(scheduler.rate(cid), 2),
+            "prefilter_skipped_ratio": skipped_ratio(cid),
+        }
+        for cid, s in engine.stats().items()
+    }
+
+
+@app.get("/events")
+async def list_events(camera_id: int = None, start: float = None, end: float = None,
+                      label: str = None, limit: int = 100, zone: str = None):
+    """
+    Motion events from the catalog, newest first. Times are unix seconds;
+    `zone` keeps events that started in that detection zone.
+    """
+    return shared_catalog().events(camera_id, start, end, label, min(limit, 10000), zone)
+
+
+@app.get("/events/{event_id}")
+async def get_event(event_id: int):
+    """
+    One event with its boxes and the id of the segment that recorded it.
+    """
+    event = shared_catalog().event(event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail=f"No event {event_id}")
+    return event
+
+
+@app.get("/events/{event_id}/thumbnail")
+async def get_event_thumbnail(event_id: int):
+    jpeg = shared_catalog().thumbnail(event_id)
+    if jpeg is None:
+        raise HTTPException(status_code=404, detail=f"No thumbnail for event {event_id}")
+    return Response(jpeg, media_type="image/jpeg")
+
+
+@app.get("/segments")
+async def list_segments(camera_id: int = None, start: float = None, end: float = None, limit: int = 100):
+    """
+    Recorded segments overlapping the time range, newest first.
+    """
+    return shared_catalog().segments(camera_id, start, end, min(limit, 10000))
+
+
+def _seek(segment_id: int, t: float):
+    segment = shared_catalog().segment(segment_id)
+    if segment is None:
+        raise HTTPException(status_code=404, detail=f"No segment {segment_id}")
+    position = shared_catalog().seek(segment_id, t if t is not None else segment["start_ts"])
+    if position is None:
+        raise HTTPException(status_code=409, detail=f"Segment {segment_id} is not indexed yet")
+    first = shared_catalog().seek(segment_id, float("-inf"))
+    return segment, position, first[1]
+
+
+@app.get("/segments/{segment_id}/seek")
+async def seek_segment(segment_id: int, t: float = None):
+    """
+    Byte offset of the keyframe fragment at or before unix time `t`. A
+    player fetches bytes [0, init_size) plus [byte_offset, ...) of the file.
+    """
+    segment, (time_, offset), init_size = _seek(segment_id, t)
+    return {"segment_id": segment_id, "path": segment["path"], "time": time_,
+            "byte_offset": offset, "init_size": init_size}
+
+
+@app.get("/segments/{segment_id}/media")
+async def segment_media(segment_id: int, t: float = None):
+    """
+    Streams a segment as playable mp4 starting at the keyframe before `t`.
+    """
+    segment, (_, offset), init_size = _seek(segment_id, t)
+
+    def chunks(chunk_size=1 << 16):
+        with open(segment["path"], "rb") as f:
+            yield f.read(init_size)
+            f.seek(offset)
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    return StreamingResponse(chunks(), media_type="video/mp4")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Per-camera stage timings and counters in the Prometheus text format.
+    """
+    others = await shard_pool.metrics_snapshots() if shard_pool is not None else []
+    if shard_pool is not None:
+        stats = await shard_pool.processing_stats()
+    else:
+        stats = lane_stats()
+    gauges = {
+        "lane_queue_depth": {cid: lane["queue_depth"] for cid, lane in stats.items()},
+        "lane_dropped_frames": {cid: lane["dropped"] for cid, lane in stats.items()},
+        "mailbox_overwritten_frames": dict(stream_manager.frames.overwritten),
+        "relay_viewers": viewers.viewer_counts(),
+    }
+    return PlainTextResponse(metrics.render(others, gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(seconds: float = 5.0, interval: float = 0.005):
+    """
+    Samples every thread of the server process for `seconds` and returns
+    collapsed stacks, e.g. for flamegraph.pl or speedscope.
+    """
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 60]")
+    return await asyncio.to_thread(sample_profile, seconds, max(interval, 0.001))
+
+
+class SignalingServer(uvicorn.Server):
+    """
+    uvicorn server that loads the per-camera pipeline in the background as
+    soon as it listens, so the first track does not wait for it.
+    """
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        if self.started:
+            profile.mark("server listening")
+            threading.Thread(target=load_pipeline, name="load-pipeline", daemon=True).start()
+
+
+def create_server(host: str = "0.0.0.0", port: int = 8000, log_level: str = "info") -> uvicorn.Server:
+    """
+    Builds the uvicorn server for the signaling app without starting it.
+    """
+    return SignalingServer(uvicorn.Config(app, host=host, port=port, log_level=log_level))
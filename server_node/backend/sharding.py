@@ -0,0 +1,522 @@
+"""
+Multi-process ingest: camera connections are spread over worker processes.
+
+Each worker runs its own event loop with aiortc, decoding, FrameProcessor and
+VideoRecorder, so cameras are no longer limited to one GIL. The parent keeps
+the FastAPI app, forwards each `/offer` to the least loaded worker and gets
+display frames back through a shared-memory ring per worker instead of
+pickled arrays. Control messages, events and config updates travel over a
+multiprocessing pipe. A worker that crashes is started again; its cameras
+are dropped and reconnect to the live workers.
+"""
+import asyncio
+import dataclasses
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+from multiprocessing import connection, shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from server_node import config
+from . import events
+from .frame_pool import FramePool
+from .metrics import metrics
+
+logger = logging.getLogger("sharding")
+
+# per-slot metadata columns
+_SEQ, _CAMERA, _HEIGHT, _WIDTH, _CHANNELS, _TIMESTAMP_US, _OVERLAY = range(7)
+_META_COLUMNS = 7
+_HEADER_WORDS = 1  # total frames written
+OVERLAY_BYTES = 16 * 1024  # room after each frame for its pickled overlay
+DEFAULT_MAX_FRAME = (1920, 1080)
+CONFIG_POLL = 0.25  # seconds between checks for new settings while no frames come in
+RESPAWN_DELAY = 1.0  # seconds before a crashed worker is started again
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of frame slots in shared memory, one writer, one reader.
+
+    Each slot carries a sequence counter used as a seqlock: the writer makes
+    it odd while copying and even when done, and the reader discards a copy
+    if the counter was odd or changed underneath it. The reader therefore
+    never blocks the writer and a slow reader just skips frames.
+
+    A slot holds up to `slot_bytes` of frame followed by the frame's
+    overlay, so frames stay raw and readers decide whether to draw boxes.
+
+    The owner (the reader) also creates a pipe: the writer, which gets its
+    end as `notifier`, pokes it after every frame, so the reader can block
+    on `ready` instead of polling. Pokes never block the writer; a full
+    pipe already means the reader has something to wake up for.
+    """
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None, notifier=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        meta_bytes = (_HEADER_WORDS + slots * _META_COLUMNS) * 8
+        self._owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self._owner, size=meta_bytes + slots * (slot_bytes + OVERLAY_BYTES)
+        )
+        self.name = self.shm.name
+
+        words = np.ndarray((_HEADER_WORDS + slots * _META_COLUMNS,), dtype=np.int64, buffer=self.shm.buf)
+        self._header = words[:_HEADER_WORDS]
+        self._meta = words[_HEADER_WORDS:].reshape(slots, _META_COLUMNS)
+        self._data = np.ndarray((slots, slot_bytes + OVERLAY_BYTES), dtype=np.uint8, buffer=self.shm.buf,
+                                offset=meta_bytes)
+        if self._owner:
+            self._header[:] = 0
+            self._meta[:] = 0
+            self.ready, notifier = multiprocessing.Pipe(duplex=False)
+            os.set_blocking(self.ready.fileno(), False)
+        else:
+            self.ready = None
+            os.set_blocking(notifier.fileno(), False)
+        self.notifier = notifier
+        self._read_count = 0
+        self._pools: Dict[int, FramePool] = {}  # reader side, per camera
+        self._write_lock = threading.Lock()  # receive loop and processing threads both post
+        self.dropped = 0
+        self._oversized = set()  # cameras whose frames did not fit, logged once each
+
+    def post(self, camera_id: int, frame: np.ndarray, overlay=None) -> None:
+        """
+        Writes a frame and its overlay into the next slot. Same signature as
+        FrameMailbox.post, so a worker's receive pipeline can use the ring in
+        its place.
+        """
+        if frame.nbytes > self.slot_bytes:
+            self.dropped += 1
+            metrics.count("shard_oversized_frames", camera_id)
+            if camera_id not in self._oversized:
+                self._oversized.add(camera_id)
+                logger.error("Camera %s sends %dx%d frames, larger than the %d bytes of a shared frame slot; "
+                             "they are not displayed. Raise --max-frame-size.",
+                             camera_id, frame.shape[1], frame.shape[0], self.slot_bytes)
+            return
+        packed = pickle.dumps(overlay, pickle.HIGHEST_PROTOCOL) if overlay is not None else b""
+        if len(packed) > OVERLAY_BYTES:
+            packed = b""  # hundreds of boxes; show the frame without them
+        with self._write_lock:
+            count = int(self._header[0])
+            meta = self._meta[count % self.slots]
+
+            meta[_SEQ] += 1  # odd: write in progress
+            data = self._data[count % self.slots]
+            data[:frame.nbytes].reshape(frame.shape)[...] = frame
+            data[self.slot_bytes:self.slot_bytes + len(packed)] = np.frombuffer(packed, dtype=np.uint8)
+            height, width = frame.shape[:2]
+            meta[_CAMERA] = camera_id
+            meta[_HEIGHT] = height
+            meta[_WIDTH] = width
+            meta[_CHANNELS] = frame.shape[2] if frame.ndim == 3 else 1
+            meta[_TIMESTAMP_US] = int(time.time() * 1e6)
+            meta[_OVERLAY] = len(packed)
+            meta[_SEQ] += 1  # even: slot is consistent again
+            self._header[0] = count + 1
+        if not self._owner:
+            try:
+                os.write(self.notifier.fileno(), b"\0")
+            except BlockingIOError:
+                pass
+
+    def read_new(self) -> List[tuple]:
+        """
+        Returns (camera_id, frame, overlay) for every slot written since the last call
+        that could be copied consistently. Frames that were overwritten
+        before being read are skipped. Copies go into pooled buffers per
+        camera, so frames must not be modified by the caller either.
+        """
+        if self.ready is not None:
+            try:
+                os.read(self.ready.fileno(), 65536)  # drain the pokes for the frames read now
+            except BlockingIOError:
+                pass
+        written = int(self._header[0])
+        start = max(self._read_count, written - self.slots)
+        frames = []
+        for count in range(start, written):
+            index = count % self.slots
+            meta = self._meta[index]
+            seq = int(meta[_SEQ])
+            if seq % 2:
+                continue
+            camera_id, height, width, channels = (int(v) for v in meta[_CAMERA:_TIMESTAMP_US])
+            overlay_bytes = int(meta[_OVERLAY])
+            if height * width * channels > self.slot_bytes or not 0 <= overlay_bytes <= OVERLAY_BYTES:
+                continue  # metadata changed underneath us
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            pool = self._pools.setdefault(camera_id, FramePool())
+            data = pool.acquire(shape)
+            np.copyto(data.reshape(-1), self._data[index, :data.nbytes])
+            packed = self._data[index, self.slot_bytes:self.slot_bytes + overlay_bytes].tobytes()
+            if int(meta[_SEQ]) != seq:
+                continue  # torn read, the writer lapped us
+            frames.append((camera_id, data, pickle.loads(packed) if packed else None))
+        self._read_count = written
+        return frames
+
+    def close(self) -> None:
+        # drop our numpy views before closing the mapping
+        self._header = self._meta = self._data = None
+        self.shm.close()
+        self.notifier.close()
+        if self._owner:
+            self.ready.close()
+            self.shm.unlink()
+
+
+def _worker_main(index: int, conn, ring_name: str, notifier, slots: int, slot_bytes: int, snapshot: dict):
+    """
+    Entry point of an ingest worker process.
+    """
+    # Ctrl+C reaches the whole process group; the parent stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    config.configure(store=config.FileSettings(None))
+    config.runtime.publish(config.Snapshot(**snapshot))
+
+    # imported here so the parent only pays for aiortc in its own server module
+    from . import server  # pylint: disable=import-outside-toplevel
+    # a worker exists to take tracks, so it has no reason to defer the pipeline
+    server.load_pipeline()
+
+    ring = SharedFrameRing(slots, slot_bytes, name=ring_name, notifier=notifier)
+    # frames the receivers post for display go straight into shared memory
+    server.stream_manager.frames = ring
+    send_lock = threading.Lock()
+
+    def send(*message):
+        with send_lock:
+            conn.send(message)
+
+    for topic in (events.STREAM_ADDED, events.STREAM_REMOVED, events.MOTION, events.TRACK_ENDED):
+        server.stream_manager.events.subscribe(topic, lambda payload, t=topic: send("event", t, payload))
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        # a service manager stopping everything: shut down cleanly, the parent sees exit code 0
+        loop.add_signal_handler(signal.SIGTERM, messages.put_nowait, ("stop",))
+
+        def pump():
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    message = ("stop",)
+                loop.call_soon_threadsafe(messages.put_nowait, message)
+                if message[0] == "stop":
+                    return
+
+        threading.Thread(target=pump, name=f"shard-{index}-pipe", daemon=True).start()
+
+        while True:
+            message = await messages.get()
+            kind = message[0]
+            if kind == "offer":
+                _, request_id, params = message
+                try:
+                    answer = await server.accept_offer(params)
+                    send("answer", request_id, answer, None)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    send("answer", request_id, None, str(e))
+            elif kind == "config":
+                config.runtime.publish(config.Snapshot(**message[1]))
+            elif kind == "control":
+                _, camera_id, body = message
+                server.send_control(camera_id, body)
+            elif kind == "stats":
+                send("stats", message[1], server.lane_stats())
+            elif kind == "metrics":
+                send("stats", message[1], metrics.snapshot())
+            elif kind == "health":
+                send("stats", message[1], server.health_report())
+            elif kind == "stop":
+                break
+
+        await asyncio.gather(*(pc.close() for pc in list(server.pcs)), return_exceptions=True)
+        server.engine.shutdown()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        ring.close()
+
+
+class _Worker:
+    """
+    Parent-side handle of one ingest process.
+    """
+    def __init__(self, index: int, context, slots: int, slot_bytes: int):
+        self.index = index
+        self.ring = SharedFrameRing(slots, slot_bytes)
+        self.conn, child_conn = context.Pipe()
+        self.cameras = set()
+        self.pending_offers = 0
+        self.exited = False  # the process is gone; offers go to other workers
+        self.send_lock = threading.Lock()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(index, child_conn, self.ring.name, self.ring.notifier, slots, slot_bytes,
+                  dataclasses.asdict(config.runtime.snapshot)),
+            name=f"ingest-{index}",
+            daemon=True,
+        )
+
+    @property
+    def load(self) -> int:
+        return len(self.cameras) + self.pending_offers
+
+    def send(self, *message) -> None:
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class ShardPool:
+    """
+    Spreads camera connections over `workers` ingest processes.
+    """
+    def __init__(self, workers: int, slots: int = 16, max_frame_size: Optional[tuple] = None,
+                 offer_timeout: float = 15.0):
+        # frame slots fit BGR frames up to max_frame_size (width, height)
+        width, height = max_frame_size or DEFAULT_MAX_FRAME
+        self._slots = slots
+        self._slot_bytes = width * height * 3
+        self._context = multiprocessing.get_context("spawn")
+        self.workers = [_Worker(i, self._context, slots, self._slot_bytes) for i in range(workers)]
+        self.offer_timeout = offer_timeout
+        self._requests = itertools.count()
+        self._futures: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._readers = []
+        self._config_version = None
+
+    def start(self) -> "ShardPool":
+        """
+        Starts the worker processes and registers the pool with the server.
+        """
+        from . import server  # pylint: disable=import-outside-toplevel
+
+        self._running = True
+        self._config_version = config.runtime.version
+        for worker in self.workers:
+            self._start_worker(worker)
+        server.shard_pool = self
+        logger.info("Started %d ingest workers", len(self.workers))
+        return self
+
+    def _start_worker(self, worker: _Worker) -> None:
+        worker.process.start()
+        reader = threading.Thread(target=self._read_loop, args=(worker,),
+                                  name=f"shard-{worker.index}-reader", daemon=True)
+        reader.start()
+        self._readers.append(reader)
+
+    def _live_workers(self) -> List[_Worker]:
+        return [worker for worker in self.workers if not worker.exited]
+
+    def stop(self) -> None:
+        from . import server  # pylint: disable=import-outside-toplevel
+
+        server.shard_pool = None
+        self._running = False
+        for worker in self._live_workers():
+            try:
+                worker.send("stop")
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for reader in self._readers:
+            reader.join(timeout=1)
+        for worker in self.workers:
+            worker.ring.close()
+
+    def _pick_worker(self, cameras: set) -> _Worker:
+        # a reconnecting node goes back to the worker that has its cameras,
+        # which also closes the stale connection there
+        workers = self._live_workers()
+        if not workers:
+            raise RuntimeError("No ingest worker is running")
+        return min(workers, key=lambda w: (not w.cameras & cameras, w.load, w.index))
+
+    def _request(self, worker: _Worker, kind: str, *args) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request_id = next(self._requests)
+        with self._lock:
+            self._futures[request_id] = (loop, future, worker)
+        try:
+            worker.send(kind, request_id, *args)
+        except (BrokenPipeError, OSError):
+            self._resolve(request_id, None, f"Ingest worker {worker.index} exited")
+        return future
+
+    async def offer(self, params: dict) -> dict:
+        """
+        Hands an offer to the least loaded worker and returns its answer.
+        """
+        from . import server  # pylint: disable=import-outside-toplevel
+
+        cameras = server.offer_cameras(params)
+        worker = self._pick_worker(cameras)
+        worker.pending_offers += 1
+        try:
+            answer = await asyncio.wait_for(self._request(worker, "offer", params), self.offer_timeout)
+        finally:
+            worker.pending_offers -= 1
+        logger.info("Cameras %s assigned to ingest worker %d", sorted(cameras), worker.index)
+        return answer
+
+    def send_control(self, camera_id: int, body: dict) -> bool:
+        for worker in self._live_workers():
+            if camera_id in worker.cameras:
+                worker.send("control", camera_id, body)
+                return True
+        return False
+
+    async def processing_stats(self) -> dict:
+        stats = {}
+        workers = self._live_workers()
+        replies = [self._request(worker, "stats") for worker in workers]
+        for worker, reply in zip(workers, replies):
+            try:
+                for camera_id, lane in (await asyncio.wait_for(reply, 2.0)).items():
+                    stats[camera_id] = dict(lane, worker=worker.index)
+            except (asyncio.TimeoutError, RuntimeError):
+                logger.warning("Ingest worker %d did not report stats", worker.index)
+        return stats
+
+    async def camera_health(self) -> dict:
+        health = {}
+        workers = self._live_workers()
+        replies = [self._request(worker, "health") for worker in workers]
+        for worker, reply in zip(workers, replies):
+            try:
+                for camera_id, report in (await asyncio.wait_for(reply, 2.0)).items():
+                    health[camera_id] = dict(report, worker=worker.index)
+            except (asyncio.TimeoutError, RuntimeError):
+                logger.warning("Ingest worker %d did not report camera health", worker.index)
+        return health
+
+    async def metrics_snapshots(self) -> list:
+        """
+        Metrics registries of all workers, for merging into `/metrics`.
+        """
+        snapshots = []
+        workers = self._live_workers()
+        replies = [self._request(worker, "metrics") for worker in workers]
+        for worker, reply in zip(workers, replies):
+            try:
+                snapshots.append(await asyncio.wait_for(reply, 2.0))
+            except (asyncio.TimeoutError, RuntimeError):
+                logger.warning("Ingest worker %d did not report metrics", worker.index)
+        return snapshots
+
+    def _resolve(self, request_id: int, result, error) -> None:
+        with self._lock:
+            entry = self._futures.pop(request_id, None)
+        if entry is None:
+            return
+        loop, future, _ = entry
+
+        def settle():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+        loop.call_soon_threadsafe(settle)
+
+    def _handle(self, worker: _Worker, message: tuple) -> None:
+        from . import server  # pylint: disable=import-outside-toplevel
+
+        kind = message[0]
+        if kind == "answer":
+            _, request_id, answer, error = message
+            self._resolve(request_id, answer, error)
+        elif kind == "stats":
+            _, request_id, stats = message
+            self._resolve(request_id, stats, None)
+        elif kind == "event":
+            _, topic, payload = message
+            if topic == events.STREAM_ADDED:
+                worker.cameras.add(payload)
+            elif topic == events.STREAM_REMOVED:
+                worker.cameras.discard(payload)
+            server.stream_manager.events.publish(topic, payload)
+
+    def _read_loop(self, worker: _Worker) -> None:
+        from . import server  # pylint: disable=import-outside-toplevel
+
+        frames = server.stream_manager.frames
+        while self._running:
+            # sleeps until a message or a frame comes in; the timeout only picks up settings changes
+            ready = connection.wait([worker.conn, worker.ring.ready], CONFIG_POLL)
+            try:
+                while worker.conn in ready and worker.conn.poll():
+                    self._handle(worker, worker.conn.recv())
+            except (EOFError, OSError):
+                self._worker_exited(worker)
+                return
+
+            for camera_id, frame, overlay in worker.ring.read_new():
+                frames.post(camera_id, frame, overlay)
+
+            # ControlBar changes are pushed to every worker
+            version = config.runtime.version
+            if version != self._config_version:
+                self._config_version = version
+                snapshot = dataclasses.asdict(config.runtime.snapshot)
+                for other in self._live_workers():
+                    try:
+                        other.send("config", snapshot)
+                    except (BrokenPipeError, OSError):
+                        pass  # its reader thread handles the exit
+
+    def _worker_exited(self, worker: _Worker) -> None:
+        """
+        Cleans up after a worker process that went away. A clean exit (asked
+        to stop, or SIGTERM from a service manager shutting everything down)
+        is expected; a crashed worker is started again so its cameras can
+        reconnect.
+        """
+        from . import server  # pylint: disable=import-outside-toplevel
+
+        worker.exited = True
+        worker.process.join(timeout=5)
+        with self._lock:
+            orphaned = [request_id for request_id, (_, _, owner) in self._futures.items() if owner is worker]
+        for request_id in orphaned:
+            self._resolve(request_id, None, f"Ingest worker {worker.index} exited")
+        for camera_id in sorted(worker.cameras):
+            server.stream_manager.events.publish(events.STREAM_REMOVED, camera_id)
+        worker.cameras.clear()
+        if not self._running:
+            return
+        if worker.process.exitcode == 0:
+            logger.info("Ingest worker %d stopped", worker.index)
+            return
+
+        logger.error("Ingest worker %d exited with code %s, restarting it", worker.index, worker.process.exitcode)
+        time.sleep(RESPAWN_DELAY)
+        if not self._running:
+            return
+        replacement = _Worker(worker.index, self._context, self._slots, self._slot_bytes)
+        self.workers[self.workers.index(worker)] = replacement
+        self._start_worker(replacement)
+        worker.ring.close()
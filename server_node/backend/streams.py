@@ -0,0 +1,21 @@
+"""
+The backend's shared stream state, kept apart from the signaling server so
+consumers like the Qt window can hold on to it without importing FastAPI
+and aiortc.
+"""
+from .events import EventBus
+from .frame_mailbox import FrameMailbox
+
+
+class StreamConnectManager:
+    """
+    Holds the event bus for stream and motion events and the latest-frame
+    mailbox that viewers read from. Has no GUI dependency; the Qt app is
+    just one subscriber.
+    """
+    def __init__(self):
+        self.events = EventBus()
+        self.frames = FrameMailbox()
+
+
+stream_manager = StreamConnectManager()
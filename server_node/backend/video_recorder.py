@@ -1,49 +1,338 @@
-import datetime, cv2, os
+"""
+Per-camera recorder that encodes on its own writer thread.
+
+The receive loop only ever does a non-blocking put onto a bounded queue.
+The writer thread opens a PyAV H.264 encoder sized from the first frame,
+stamps frames with their capture time and rolls over to a new segment file
+every `segment_seconds`.
+
+In motion mode the recorder is "armed": the writer thread keeps the last few
+seconds as JPEGs in a memory-capped ring buffer, and a motion trigger opens a
+clip that starts with that pre-roll and runs until the post-roll expires.
+"""
+import collections
+import datetime
+import fractions
+import logging
+import os
+import queue
+import threading
+import time
+import av
+import cv2
+import numpy as np
 from server_node import config
+from .metrics import metrics, RECORDER_WRITE
+
+logger = logging.getLogger("video_recorder")
+
+RECORDINGS_DIR = "recordings"
+TIME_BASE = fractions.Fraction(1, 1000)
+FRAGMENT_FLAGS = "frag_keyframe+empty_moov+default_base_moof"
+KEYFRAME_INTERVAL = 60 # frames, the seek granularity
+DEFAULT_RATE = 30 # fps assumed until a few frames have come in
+RATE_WINDOW = 30 # frames the stream rate is measured over
+
+
+class _Segment:
+    """
+    One open output file and its encoder stream.
+    """
+    def __init__(self, path: str, width: int, height: int, start: float, rate: int = DEFAULT_RATE):
+        self.path = path
+        self.size = (width, height)
+        self.start = start
+        self.last_pts = -1
+        # fragmented mp4 with a fragment per keyframe: readable while still
+        # being written, and the catalog can seek by fragment byte offset
+        self.container = av.open(path, mode="w", options={"movflags": FRAGMENT_FLAGS})
+        self.stream = self.container.add_stream("h264", rate=rate)
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.codec_context.time_base = TIME_BASE
+        self.stream.codec_context.gop_size = KEYFRAME_INTERVAL
+
+    def write(self, frame: np.ndarray, timestamp: float):
+        video_frame = av.VideoFrame.from_ndarray(np.ascontiguousarray(frame), format="bgr24")
+        # timestamps come from the capture clock, so playback speed is right
+        # whatever rate the camera actually delivered
+        pts = max(int((timestamp - self.start) * 1000), self.last_pts + 1)
+        video_frame.pts = pts
+        video_frame.time_base = TIME_BASE
+        self.last_pts = pts
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    @property
+    def end(self) -> float:
+        return self.start + max(0, self.last_pts) / 1000
+
+    def close(self):
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+
+class PreRollBuffer:
+    """
+    Ring buffer of JPEG-compressed frames bounded by age and total bytes.
+    """
+    def __init__(self, seconds: float, max_bytes: int, quality: int = 80):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.size_bytes = 0
+        self._frames = collections.deque()  # (timestamp, jpeg bytes)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def push(self, frame: np.ndarray, timestamp: float) -> None:
+        """
+        Compresses and appends a frame, evicting the oldest ones over budget.
+        """
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        self._frames.append((timestamp, encoded))
+        self.size_bytes += encoded.nbytes
+
+        while self._frames and (
+            self.size_bytes > self.max_bytes
+            or timestamp - self._frames[0][0] > self.seconds
+        ):
+            _, old = self._frames.popleft()
+            self.size_bytes -= old.nbytes
+
+    def drain(self):
+        """
+        Yields the buffered frames oldest first as (frame, timestamp) and empties the buffer.
+        """
+        frames, self._frames = self._frames, collections.deque()
+        self.size_bytes = 0
+        for timestamp, encoded in frames:
+            yield cv2.imdecode(encoded, cv2.IMREAD_COLOR), timestamp
+
+    def clear(self) -> None:
+        self._frames.clear()
+        self.size_bytes = 0
+
 
 class VideoRecorder():
-    def __init__(self):
+    """
+    Records the frames of one camera into segmented mp4 files.
+    """
+    def __init__(self, camera_id: int = 0, segment_seconds: float = None, queue_size: int = 64,
+                 catalog=None):
+        self.camera_id = camera_id
+        self.catalog = catalog # segments are registered here when given
+        self.segment_seconds = segment_seconds or config.runtime.snapshot.recording_segment_seconds
         self.recording = False
-        self.video = None
-        os.makedirs("recordings", exist_ok=True)
-        self.fps = 15 # half of camera's fps? idk
+        self.armed = False
+        self.dropped = 0
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
 
-    def start_recording(self):
-        if not self.recording:
-            self.recording = True
-            self.timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.output_file_name = f"recordings/motion_{self.timestamp}.mp4"
-            self.codec = cv2.VideoWriter_fourcc(*'mp4v')
-            
-            width = config.settings.value("CAMERA_WIDTH", type=int)
-            height = config.settings.value("CAMERA_HEIGHT", type=int)
-
-            # fallback if config is 0, but we need explicit size for writer
-            # this logic might need improvement if stream resolutions are different (maybe for grid recording? TODO)
-            if width == 0: width = 640
-            if height == 0: height = 480
-
-            self.video = cv2.VideoWriter(
-                self.output_file_name, 
-                self.codec, 
-                self.fps,
-                (width, height)
+        settings = config.runtime.snapshot
+        self.pre_roll = PreRollBuffer(
+            settings.pre_roll_seconds,
+            settings.pre_roll_max_mb * 1024 * 1024
+        )
+        self._clip_until = None
+        self._lock = threading.Lock()
+
+        # bumped on every start/stop so the writer can tell sessions apart
+        self._generation = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = None
+        self._recent = collections.deque(maxlen=RATE_WINDOW) # timestamps of the latest frames
+
+    @property
+    def in_clip(self) -> bool:
+        """
+        True while a motion clip is open.
+        """
+        return self._clip_until is not None
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._writer_loop,
+                name=f"recorder-{self.camera_id}",
+                daemon=True
             )
+            self._thread.start()
 
-            if not self.video.isOpened():
-                print(f"Error: Failed to open video writer for {self.output_file_name}")
-                self.recording = False
-                return
-    
-    def add_frame(self, frame):
-        if self.recording and self.video:
-            # resize if needed to match writer resolution
-            # TODO: should probably initialize writer on first frame
-            pass 
-            self.video.write(frame)
+    def start_recording(self):
+        with self._lock:
+            if not self.recording:
+                self._generation += 1
+                self.recording = True
+                self._ensure_writer()
+
+    def arm(self):
+        """
+        Enables motion mode: frames are kept as pre-roll until `trigger`.
+        """
+        if not self.armed:
+            settings = config.runtime.snapshot
+            self.pre_roll.seconds = settings.pre_roll_seconds
+            self.pre_roll.max_bytes = settings.pre_roll_max_mb * 1024 * 1024
+            self.armed = True
+            self._ensure_writer()
+
+    def disarm(self):
+        """
+        Leaves motion mode; an open motion clip is closed.
+        """
+        if self.armed:
+            self.armed = False
+            if self._clip_until is not None:
+                self._clip_until = None
+                self.end_recording()
+
+    def trigger(self):
+        """
+        Opens a motion clip, or extends the open one by the post-roll.
+
+        Safe to call from the processing thread.
+        """
+        if not self.armed:
+            return
+        self._clip_until = time.monotonic() + config.runtime.snapshot.post_roll_seconds
+        self.start_recording()
+
+    def add_frame(self, frame: np.ndarray, timestamp: float = None):
+        """
+        Hands a frame to the writer thread. Never blocks; drops when full.
+        `timestamp` is the capture time in unix seconds, now if not given.
+        """
+        clip_until = self._clip_until
+        if clip_until is not None and time.monotonic() > clip_until:
+            self._clip_until = None
+            self.end_recording()
+        if not (self.recording or self.armed):
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        # generation None marks a pre-roll frame rather than a recorded one
+        generation = self._generation if self.recording else None
+        try:
+            self._queue.put_nowait((generation, frame, timestamp))
+        except queue.Full:
+            self.dropped += 1
 
     def end_recording(self):
-        if self.recording and self.video:
-            self.recording = False
-            self.video.release()
-            self.video = None
+        with self._lock:
+            if self.recording:
+                self.recording = False
+                self._generation += 1
+
+    def close(self):
+        """
+        Stops recording and lets the writer thread finish the open segment.
+        """
+        self.disarm()
+        self.end_recording()
+        self._closed = True
+
+    def _segment_path(self) -> str:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(RECORDINGS_DIR, f"camera{self.camera_id}_{timestamp}.mp4")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(RECORDINGS_DIR, f"camera{self.camera_id}_{timestamp}_{suffix}.mp4")
+            suffix += 1
+        return path
+
+    def _frame_rate(self) -> int:
+        """
+        Rate the camera delivers at, measured from the latest timestamps.
+        """
+        if len(self._recent) < 2 or self._recent[-1] <= self._recent[0]:
+            return DEFAULT_RATE
+        return max(1, round((len(self._recent) - 1) / (self._recent[-1] - self._recent[0])))
+
+    def _open_segment(self, frame: np.ndarray, timestamp: float) -> _Segment:
+        height, width = frame.shape[:2]
+        # yuv420p needs even dimensions
+        width -= width % 2
+        height -= height % 2
+        path = self._segment_path()
+        logger.info("Camera %s recording to %s (%dx%d)", self.camera_id, path, width, height)
+        segment = _Segment(path, width, height, timestamp, self._frame_rate())
+        if self.catalog is not None:
+            self.catalog.add_segment(self.camera_id, path, timestamp, width, height)
+        return segment
+
+    def _close_segment(self, segment: _Segment):
+        try:
+            segment.close()
+        except av.error.FFmpegError as e:
+            logger.error("Failed to finalise %s: %s", segment.path, e)
+        if self.catalog is not None:
+            self.catalog.end_segment(segment.path, segment.end)
+
+    def _writer_loop(self):
+        write_time = metrics.histogram(RECORDER_WRITE, self.camera_id)
+        segment = None
+        segment_generation = None
+        while True:
+            try:
+                generation, frame, timestamp = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if segment is not None and (not self.recording or self._closed):
+                    self._close_segment(segment)
+                    segment = None
+                if self._closed:
+                    return
+                continue
+
+            self._recent.append(timestamp)
+            if generation is None:
+                if segment is not None:
+                    self._close_segment(segment)
+                    segment = None
+                if self.armed:
+                    self.pre_roll.push(frame, timestamp)
+                continue
+
+            height, width = frame.shape[:2]
+            if segment is not None and (
+                generation != segment_generation
+                or timestamp - segment.start >= self.segment_seconds
+                or (width - width % 2, height - height % 2) != segment.size
+            ):
+                self._close_segment(segment)
+                segment = None
+
+            try:
+                if segment is None:
+                    segment_generation = generation
+                    segment = self._start_clip(frame, timestamp)
+                started = time.perf_counter_ns()
+                segment.write(frame[:segment.size[1], :segment.size[0]], timestamp)
+                write_time.observe((time.perf_counter_ns() - started) * 1e-9)
+            except (av.error.FFmpegError, ValueError) as e:
+                logger.error("Camera %s recording error: %s", self.camera_id, e)
+                if segment is not None:
+                    self._close_segment(segment)
+                segment = None
+
+    def _start_clip(self, frame: np.ndarray, timestamp: float) -> _Segment:
+        """
+        Opens a segment, first writing any pre-roll that precedes `timestamp`.
+        """
+        if not len(self.pre_roll):
+            return self._open_segment(frame, timestamp)
+
+        segment = None
+        for buffered, buffered_ts in self.pre_roll.drain():
+            if buffered_ts >= timestamp:
+                continue
+            if segment is None:
+                segment = self._open_segment(frame, buffered_ts)
+            if buffered.shape[:2] == frame.shape[:2]:
+                segment.write(buffered[:segment.size[1], :segment.size[0]], buffered_ts)
+        return segment or self._open_segment(frame, timestamp)
@@ -0,0 +1,192 @@
+"""
+Fan-out of live camera feeds to remote viewers as MJPEG over HTTP.
+
+Viewers tap the display mailbox, so a feed is decoded exactly once by the
+ingest pipeline whoever watches it. Each watched variant of a camera
+(with or without boxes, at a given width) is JPEG-encoded once per frame
+by a single encoder, capped at `fps`, and every viewer of that variant is
+sent the same bytes. Viewers never queue: one that falls behind skips
+straight to the newest frame, and nothing a viewer does can slow down
+ingest, processing or the other viewers. Cameras nobody watches cost one
+dictionary lookup per frame.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from .metrics import metrics
+from .overlay import draw_boxes
+
+logger = logging.getLogger("viewer_relay")
+
+BOUNDARY = "frame"
+RELAY_ENCODE = "relay_encode"  # metrics stage
+
+FeedKey = Tuple[int, bool, Optional[int]]  # camera_id, boxes, width
+
+
+def encode(frame: np.ndarray, overlay, boxes: bool, width: Optional[int], quality: int) -> Optional[bytes]:
+    """
+    JPEG of a mailbox frame, scaled to `width` and with the overlay's boxes
+    drawn on a copy if asked for.
+    """
+    scale = 1.0
+    if width is not None and width != frame.shape[1]:
+        scale = width / frame.shape[1]
+        height = max(1, int(frame.shape[0] * scale))
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        frame = cv2.resize(frame, (width, height), interpolation=interpolation)
+    elif boxes and overlay is not None and overlay.boxes:
+        frame = frame.copy()  # mailbox frames are shared and read-only
+    if boxes and overlay is not None:
+        draw_boxes(frame, overlay.boxes, overlay.labels, scale)
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+class _Source:
+    """
+    Newest frame of a watched camera, handed from ingest threads to the
+    event loop.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.latest = (0, None, None)  # count, frame, overlay
+        self.feeds: Set["_Feed"] = set()
+        self._counter = itertools.count(1)
+        self._signalled = False
+
+    def post(self, frame: np.ndarray, overlay) -> None:
+        # any thread; at most one wake-up is in flight however fast frames come
+        self.latest = (next(self._counter), frame, overlay)
+        if not self._signalled:
+            self._signalled = True
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        self._signalled = False
+        for feed in self.feeds:
+            feed.wake.set()
+
+
+class _Feed:
+    """
+    One encoded variant of a camera and the viewers attached to it.
+    """
+    def __init__(self, key: FeedKey, source: _Source):
+        self.key = key
+        self.source = source
+        self.wake = asyncio.Event()
+        self.viewers: Set[asyncio.Event] = set()
+        self.jpeg: Optional[bytes] = None
+        self.seq = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self, fps: float, quality: int) -> None:
+        camera_id, boxes, width = self.key
+        encode_time = metrics.histogram(RELAY_ENCODE, camera_id)
+        encoded = 0
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            count, frame, overlay = self.source.latest
+            if count == encoded or frame is None:
+                continue
+            started = time.perf_counter()
+            jpeg = await asyncio.to_thread(encode, frame, overlay, boxes, width, quality)
+            elapsed = time.perf_counter() - started
+            encode_time.observe(elapsed)
+            encoded = count
+            if jpeg is not None:
+                self.jpeg, self.seq = jpeg, self.seq + 1
+                metrics.count("relay_encoded_frames", camera_id)
+                for viewer in self.viewers:
+                    viewer.set()
+            # frames arriving meanwhile just set `wake` again
+            await asyncio.sleep(max(0.0, 1.0 / fps - elapsed))
+
+
+class ViewerRelay:
+    """
+    Serves mailbox frames to any number of remote viewers. Attach it to
+    the mailbox the display reads from with `mailbox.add_listener(relay.on_frame)`.
+    """
+    def __init__(self, fps: float = 15.0, quality: int = 75):
+        self.fps = fps
+        self.quality = quality
+        self._sources: Dict[int, _Source] = {}  # watched cameras only
+        self._feeds: Dict[FeedKey, _Feed] = {}
+
+    def on_frame(self, camera_id: int, frame: np.ndarray, overlay=None) -> None:
+        """
+        Mailbox listener, called from ingest and processing threads.
+        """
+        source = self._sources.get(camera_id)
+        if source is not None:
+            source.post(frame, overlay)
+
+    def viewer_counts(self) -> Dict[int, int]:
+        counts = {}
+        for (camera_id, _, _), feed in self._feeds.items():
+            counts[camera_id] = counts.get(camera_id, 0) + len(feed.viewers)
+        return counts
+
+    def _attach(self, key: FeedKey, viewer: asyncio.Event) -> _Feed:
+        camera_id = key[0]
+        source = self._sources.get(camera_id)
+        if source is None:
+            source = self._sources[camera_id] = _Source(asyncio.get_running_loop())
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = self._feeds[key] = _Feed(key, source)
+            source.feeds.add(feed)
+            feed.task = asyncio.ensure_future(feed.run(self.fps, self.quality))
+            logger.info("Relaying camera %s (boxes=%s, width=%s)", *key)
+        feed.viewers.add(viewer)
+        if feed.jpeg is not None:
+            viewer.set()
+        return feed
+
+    def _detach(self, feed: _Feed, viewer: asyncio.Event) -> None:
+        feed.viewers.discard(viewer)
+        if feed.viewers:
+            return
+        # last viewer gone: stop encoding, and stop tapping the camera if unwatched
+        feed.task.cancel()
+        del self._feeds[feed.key]
+        source = feed.source
+        source.feeds.discard(feed)
+        if not source.feeds:
+            del self._sources[feed.key[0]]
+        logger.info("Stopped relaying camera %s (boxes=%s, width=%s)", *feed.key)
+
+    async def stream(self, camera_id: int, boxes: bool = True, width: Optional[int] = None,
+                     fps: Optional[float] = None) -> AsyncIterator[bytes]:
+        """
+        multipart/x-mixed-replace parts for one viewer, optionally capped
+        at a lower `fps` than the relay's. Ends when the client disconnects.
+        """
+        viewer = asyncio.Event()
+        feed = self._attach((camera_id, boxes, width), viewer)
+        sent = 0
+        try:
+            while True:
+                await viewer.wait()
+                viewer.clear()
+                if sent and feed.seq - sent > 1:
+                    metrics.count("relay_viewer_skipped_frames", camera_id, feed.seq - sent - 1)
+                sent, jpeg = feed.seq, feed.jpeg
+                started = time.perf_counter()
+                # a slow client only holds up this generator; newer frames
+                # replace each other in `feed` until it is ready again
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(jpeg)}\r\n\r\n").encode("ascii") + jpeg + b"\r\n"
+                if fps:
+                    await asyncio.sleep(max(0.0, 1.0 / fps - (time.perf_counter() - started)))
+        finally:
+            self._detach(feed, viewer)
@@ -0,0 +1,149 @@
+"""
+Per-camera detection zones.
+
+A zone is a named polygon that either includes or excludes part of a
+camera's view. Points are stored as fractions of the frame size, so zones
+survive resolution changes and the detection scale. The "Detection Zones"
+setting holds them as JSON, keyed by camera id:
+
+    {"3": [{"name": "driveway", "mode": "include", "points": [[0.1, 0.5], ...]},
+           {"name": "street", "mode": "exclude", "points": [...]}]}
+
+For detection, a camera's zones turn into a crop rectangle, the bounds
+of the include zones (the whole frame if there are none), and a mask over
+that crop with the include zones set and the exclude zones cleared. Both
+are cached per zone set and frame size, so they are only computed again
+when the zones or the resolution change.
+"""
+import functools
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("zones")
+
+ZONE_MODES = ("include", "exclude")
+
+
+@dataclass(frozen=True)
+class Zone:
+    """
+    One polygon with points (x, y) as fractions of the frame size.
+    """
+    name: str
+    mode: str
+    points: Tuple[Tuple[float, float], ...]
+
+    def pixels(self, width: int, height: int) -> np.ndarray:
+        return np.round(np.asarray(self.points, dtype=np.float32) * (width, height)).astype(np.int32)
+
+    def contains(self, x: float, y: float) -> bool:
+        """
+        Whether the point (as fractions of the frame size) lies inside.
+        """
+        polygon = np.asarray(self.points, dtype=np.float32)
+        return cv2.pointPolygonTest(polygon, (float(x), float(y)), False) >= 0
+
+
+@functools.lru_cache(maxsize=16)
+def parse_zones(value: str) -> Dict[int, Tuple[Zone, ...]]:
+    """
+    Turns the "Detection Zones" setting into camera id -> zones. Invalid
+    zones are logged and skipped.
+    """
+    if not value:
+        return {}
+    try:
+        cameras = json.loads(value)
+    except ValueError as e:
+        logger.error("Ignoring unreadable detection zones: %s", e)
+        return {}
+    zones = {}
+    for camera_id, entries in cameras.items():
+        parsed = []
+        for i, entry in enumerate(entries):
+            try:
+                zone = Zone(str(entry.get("name") or f"zone {i + 1}"), entry.get("mode", "include"),
+                            tuple((min(max(float(x), 0.0), 1.0), min(max(float(y), 0.0), 1.0))
+                                  for x, y in entry["points"]))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logger.error("Ignoring zone %d of camera %s: %s", i, camera_id, e)
+                continue
+            if zone.mode not in ZONE_MODES or len(zone.points) < 3:
+                logger.error("Ignoring zone %r of camera %s: needs a mode in %s and 3+ points",
+                             zone.name, camera_id, ZONE_MODES)
+                continue
+            parsed.append(zone)
+        if parsed:
+            zones[int(camera_id)] = tuple(parsed)
+    return zones
+
+
+def dump_zones(zones: Dict[int, Tuple[Zone, ...]]) -> str:
+    """
+    Inverse of `parse_zones`, for saving edited zones.
+    """
+    return json.dumps({
+        str(camera_id): [{"name": zone.name, "mode": zone.mode,
+                          "points": [[round(x, 4), round(y, 4)] for x, y in zone.points]}
+                         for zone in camera_zones]
+        for camera_id, camera_zones in sorted(zones.items()) if camera_zones
+    }, separators=(",", ":"))
+
+
+@functools.lru_cache(maxsize=64)
+def zone_crop(zones: Tuple[Zone, ...], width: int, height: int) -> Tuple[int, int, int, int]:
+    """
+    Bounding rectangle (x, y, w, h) of the include zones in a frame of
+    `width` x `height`, the whole frame if there are none. Empty (w or h
+    of 0) if the include zones have no area.
+    """
+    includes = [zone.pixels(width, height) for zone in zones if zone.mode == "include"]
+    if not includes:
+        return 0, 0, width, height
+    x, y, w, h = cv2.boundingRect(np.concatenate(includes))
+    x, y = min(max(0, x), width), min(max(0, y), height)
+    return x, y, max(0, min(w, width - x)), max(0, min(h, height - y))
+
+
+@functools.lru_cache(maxsize=64)
+def zone_mask(zones: Tuple[Zone, ...], width: int, height: int,
+              size: Tuple[int, int]) -> Optional[np.ndarray]:
+    """
+    Mask over the `zone_crop` of a `width` x `height` frame, rasterised at
+    `size` (the crop after detection scaling): 255 inside the include
+    zones and outside the exclude zones. None when every pixel counts, so
+    callers can skip masking altogether.
+    """
+    x, y, w, h = zone_crop(zones, width, height)
+    includes = [zone.pixels(width, height) for zone in zones if zone.mode == "include"]
+    excludes = [zone.pixels(width, height) for zone in zones if zone.mode == "exclude"]
+    # crop pixels -> mask pixels
+    factor = np.array([size[0] / max(w, 1), size[1] / max(h, 1)])
+    offset = np.array([x, y])
+
+    def fit(points):
+        return np.round((points - offset) * factor).astype(np.int32)
+
+    mask = np.zeros((size[1], size[0]), dtype=np.uint8) if includes \
+        else np.full((size[1], size[0]), 255, dtype=np.uint8)
+    if includes:
+        cv2.fillPoly(mask, [fit(points) for points in includes], 255)
+    if excludes:
+        cv2.fillPoly(mask, [fit(points) for points in excludes], 0)
+    if mask.all():
+        return None
+    mask.setflags(write=False)  # shared through the cache
+    return mask
+
+
+def zones_at(zones: Tuple[Zone, ...], x: float, y: float) -> Tuple[str, ...]:
+    """
+    Names of the include zones containing the point (as fractions of the
+    frame size).
+    """
+    return tuple(zone.name for zone in zones if zone.mode == "include" and zone.contains(x, y))
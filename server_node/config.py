@@ -1,12 +1,219 @@
-"""Configuration settings for the server node application."""
-from PyQt5 import QtCore  # pylint: disable=c-extension-no-member
+"""Configuration settings for the server node application.
 
-QtCore.QCoreApplication.setOrganizationName("2vyy")
-QtCore.QCoreApplication.setApplicationName("Camera Vision Project")
+`settings` (the persistent store) and `runtime` (the typed snapshot) are
+created on first use: QSettings for the GUI, or a JSON file when
+`configure(headless=True)` is called first, so headless servers never
+import Qt.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass, fields, replace
 
-settings = QtCore.QSettings()
+DEFAULT_SETTINGS_FILE = "server_settings.json"
+
+# values reset on every start
+STARTUP_VALUES = {
+    "CAMERA_WIDTH": 0,
+    "CAMERA_HEIGHT": 0,
+    "RECORDING_TOGGLE": False,
+}
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    Immutable, typed view of the runtime settings.
+
+    Hot-path code grabs `runtime.snapshot` once per frame and reads plain
+    attributes from it instead of going through QSettings.
+    """
+    version: int = 0
+    binary_threshold: int = 100
+    contour_size: int = 400
+    raw_view: bool = True
+    recording: bool = False
+    processing_budget: int = 80  # percent of the processing engine's workers
+    motion_priority: float = 4.0
+    idle_process_fps: float = 2.0
+    dark_mode: bool = True
+    camera_width: int = 0
+    camera_height: int = 0
+    display_fps: int = 30
+    display_scaling: str = "area"  # "area", "linear" or "nearest"
+    mosaic_view: bool = False  # composite every camera into one canvas
+    mosaic_page_size: int = 25
+    recording_segment_seconds: int = 300
+    motion_recording: bool = False
+    pre_roll_seconds: int = 5
+    post_roll_seconds: int = 5
+    pre_roll_max_mb: int = 32
+    detection_scale: float = 1.0
+    detection_grayscale: bool = False
+    object_classes: str = ""  # comma separated, e.g. "person, car"; empty counts any motion
+    object_model: str = ""  # YOLO ONNX file, needed for object_classes
+    prefilter_threshold: int = 6  # grey levels, 0 runs every frame through background subtraction
+    detection_zones: str = ""  # JSON polygons per camera, see backend.zones
+    stats_overlay: bool = False
+
+
+# snapshot field -> QSettings key used to persist it
+SETTINGS_KEYS = {
+    "binary_threshold": "Binary Threshold",
+    "contour_size": "Contour Size",
+    "raw_view": "Raw View",
+    "recording": "RECORDING_TOGGLE",
+    "processing_budget": "Processing Budget",
+    "motion_priority": "Motion Priority",
+    "idle_process_fps": "Idle Process FPS",
+    "dark_mode": "Dark Mode",
+    "camera_width": "CAMERA_WIDTH",
+    "camera_height": "CAMERA_HEIGHT",
+    "display_fps": "Display FPS",
+    "display_scaling": "Display Scaling",
+    "mosaic_view": "Mosaic View",
+    "mosaic_page_size": "Mosaic Page Size",
+    "recording_segment_seconds": "Recording Segment Seconds",
+    "motion_recording": "Motion Recording",
+    "pre_roll_seconds": "Pre-Roll Seconds",
+    "post_roll_seconds": "Post-Roll Seconds",
+    "pre_roll_max_mb": "Pre-Roll Max MB",
+    "detection_scale": "Detection Scale",
+    "detection_grayscale": "Detection Grayscale",
+    "prefilter_threshold": "Pre-Filter Threshold",
+    "detection_zones": "Detection Zones",
+    "object_classes": "Object Classes",
+    "object_model": "Object Model",
+    "stats_overlay": "Stats Overlay",
+}
+
+
+class FileSettings:
+    """
+    JSON-file settings store with the subset of the QSettings API we use.
+    With `path=None` it only lives in memory.
+    """
+    def __init__(self, path: str = DEFAULT_SETTINGS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._values = {}
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._values = json.load(f)
+
+    def value(self, key, default=None, type=None):  # pylint: disable=redefined-builtin
+        value = self._values.get(key, default)
+        if type is None or value is None:
+            return value
+        if type is bool and isinstance(value, str):
+            return value.lower() in ("1", "true", "yes", "on")
+        return type(value)
+
+    def setValue(self, key, value):  # pylint: disable=invalid-name
+        with self._lock:
+            self._values[key] = value
+        self.sync()
+
+    def sync(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = dict(self._values)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class RuntimeConfig:
+    """
+    Holds the current settings snapshot and publishes new versions.
+
+    Reading `snapshot` or `version` is a single attribute load, so it is safe
+    and cheap from any thread. `update` builds a new snapshot, bumps the
+    version and persists the changed values to QSettings.
+    """
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self.snapshot = self._load()
+
+    @property
+    def version(self) -> int:
+        """
+        Version of the current snapshot, bumped on every update.
+        """
+        return self.snapshot.version
+
+    def _load(self) -> Snapshot:
+        defaults = Snapshot()
+        values = {}
+        for field in fields(Snapshot):
+            key = SETTINGS_KEYS.get(field.name)
+            if key is None:
+                continue
+            default = getattr(defaults, field.name)
+            values[field.name] = self._store.value(key, default, type=type(default))
+        return Snapshot(**values)
+
+    def update(self, **changes) -> Snapshot:
+        """
+        Publishes a new snapshot with `changes` applied and persists them.
+        """
+        with self._lock:
+            snapshot = replace(self.snapshot, version=self.snapshot.version + 1, **changes)
+            self.snapshot = snapshot
+        for name, value in changes.items():
+            self._store.setValue(SETTINGS_KEYS[name], value)
+        return snapshot
+
+    def publish(self, snapshot: Snapshot) -> None:
+        """
+        Adopts a snapshot made elsewhere (e.g. by the parent process)
+        without persisting it.
+        """
+        with self._lock:
+            self.snapshot = snapshot
+
+
+def _open_store(headless: bool, path: str = None):
+    if headless:
+        return FileSettings(path or DEFAULT_SETTINGS_FILE)
+    from PyQt5 import QtCore  # pylint: disable=c-extension-no-member,import-outside-toplevel
+    QtCore.QCoreApplication.setOrganizationName("2vyy")
+    QtCore.QCoreApplication.setApplicationName("Camera Vision Project")
+    return QtCore.QSettings()
+
+
+def stored_snapshot(headless: bool = False, path: str = None) -> Snapshot:
+    """
+    The settings a server would start with, read without touching the
+    store: for offline tools that run next to a live server and must not
+    reset its startup values.
+    """
+    return RuntimeConfig(_open_store(headless, path)).snapshot
+
+
+def configure(headless: bool = False, path: str = None, store=None) -> None:
+    """
+    Creates `settings` and `runtime`. Call before anything reads them to
+    pick the file store (or pass a ready `store`); otherwise QSettings is
+    used on first access.
+    """
+    global settings, runtime  # pylint: disable=global-variable-undefined
+    if store is None:
+        store = _open_store(headless, path)
+
+    for key, value in STARTUP_VALUES.items():
+        store.setValue(key, value)
+
+    settings = store
+    runtime = RuntimeConfig(store)
+
+
+def __getattr__(name):
+    if name in ("settings", "runtime"):
+        configure()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-settings.setValue("FRAME_THROTTLE_RATE", 1)
-settings.setValue("CAMERA_WIDTH", 0)
-settings.setValue("CAMERA_HEIGHT", 0)
-settings.setValue("RECORDING_TOGGLE", False)
\ No newline at end of file
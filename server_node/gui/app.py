@@ -4,10 +4,11 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout
 from server_node import config
 from .control_bar import ControlBar
 from .camera_grid import CameraGrid
-from server_node.backend.server import SignalingServerWorker, stream_manager
+from .backend_bridge import QtEventBridge, SignalingServerWorker
+from server_node.backend.streams import stream_manager
 
 class App(QWidget):
-    def __init__(self) -> None:
+    def __init__(self, host: str = "0.0.0.0", port: int = 8000) -> None:
         super().__init__()
         self.setWindowTitle("Multi-Camera Monitoring (Push Server)")
         self.resize(1200, 700)
@@ -20,22 +21,24 @@ class App(QWidget):
         self.control_bar = ControlBar()
         main_layout.addWidget(self.control_bar)
 
-        self.camera_grid = CameraGrid()
+        self.camera_grid = CameraGrid(stream_manager.frames)
         main_layout.addWidget(self.camera_grid, 1)
 
         self.setLayout(main_layout)
 
         # Start Signaling Server
         # Start Signaling Server
-        self.signaling_worker = SignalingServerWorker()
+        self.signaling_worker = SignalingServerWorker(host, port)
         self.signaling_worker.start()
 
         # Connect Signals
         # Connect Signals
-        stream_manager.stream_added.connect(self.camera_grid.add_camera)
-        stream_manager.frame_ready.connect(self.camera_grid.update_image)
+        self.event_bridge = QtEventBridge(stream_manager.events, self)
+        self.event_bridge.stream_added.connect(self.camera_grid.add_camera)
+        self.event_bridge.stream_removed.connect(self.camera_grid.remove_camera)
 
     def closeEvent(self, event) -> None:
         config.settings.sync()
-        # self.signaling_worker.stop() # TODO: Graceful shutdown of uvicorn
+        self.camera_grid.stop_all_threads()
+        self.signaling_worker.stop()
         event.accept()
@@ -0,0 +1,61 @@
+"""
+Adapters that let the Qt GUI consume the Qt-free backend.
+"""
+import threading
+from PyQt5.QtCore import QObject, QThread, pyqtSignal  # pylint: disable=no-name-in-module
+from server_node.backend import events
+from server_node.startup import profile
+
+
+class QtEventBridge(QObject):
+    """
+    Re-emits event bus topics as Qt signals.
+
+    Bus callbacks run in whatever thread published the event; emitting a
+    signal from there queues the slot onto the GUI thread.
+    """
+    stream_added = pyqtSignal(int)
+    stream_removed = pyqtSignal(int)
+    motion_detected = pyqtSignal(object)
+
+    def __init__(self, bus, parent=None):
+        super().__init__(parent)
+        bus.subscribe(events.STREAM_ADDED, self.stream_added.emit)
+        bus.subscribe(events.STREAM_REMOVED, self.stream_removed.emit)
+        bus.subscribe(events.MOTION, self.motion_detected.emit)
+
+
+class SignalingServerWorker(QThread):
+    """
+    Worker thread to run the Uvicorn server for signaling.
+
+    The server module (FastAPI, aiortc) is imported on this thread, so the
+    window can come up while it loads.
+    """
+    def __init__(self, host: str = "0.0.0.0", port: int = 8000, parent=None):
+        super().__init__(parent)
+        self.host = host
+        self.port = port
+        self.server = None
+        self._stopping = False
+
+    def run(self):
+        """
+        Imports the server module and starts the uvicorn server.
+        """
+        threading.current_thread().name = "signaling-server"
+        with profile.stage("import server"):
+            from server_node.backend.server import create_server  # pylint: disable=import-outside-toplevel
+        self.server = create_server(self.host, self.port)
+        # stop() may have come while the server was loading
+        self.server.should_exit = self._stopping
+        self.server.run()
+
+    def stop(self):
+        """
+        Asks uvicorn to shut down and waits for the thread.
+        """
+        self._stopping = True
+        if self.server is not None:
+            self.server.should_exit = True
+        self.wait(5000)
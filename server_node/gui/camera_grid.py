@@ -1,32 +1,85 @@
-from PyQt5.QtWidgets import QWidget, QLabel, QGridLayout, QSizePolicy
-from PyQt5 import QtGui
-from PyQt5.QtCore import pyqtSlot, Qt
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QGridLayout, QMenu, QSizePolicy, QStackedLayout
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QPixmap
-import cv2, numpy as np
-from server_node.config import settings
+import time
+import numpy as np
+from server_node import config
+from server_node.backend.metrics import metrics, PAINT
+from .frame_renderer import FrameRenderer
+from .mosaic import Mosaic, MosaicView
 
 class CameraGrid(QWidget):
-    def __init__(self):
+    def __init__(self, frames):
         super().__init__()
-        self.camera_labels = {} # maps camera_id -> QLabel
-        self.grid_layout = QGridLayout()
-        self.setLayout(self.grid_layout)
-    
+        self.camera_ids = set()
+        self.camera_labels = {} # maps camera_id -> QLabel, created in tile mode only
+
+        # tile mode: one label per camera
+        self.tiles = QWidget(self)
+        self.grid_layout = QGridLayout(self.tiles)
+
+        # mosaic mode: every camera composited into one canvas
+        settings = config.runtime.snapshot
+        self.mosaic = Mosaic(settings.mosaic_page_size)
+        self.mosaic_view = MosaicView(self.mosaic, self)
+
+        self.stack = QStackedLayout()
+        self.stack.addWidget(self.tiles)
+        self.stack.addWidget(self.mosaic_view)
+        self.setLayout(self.stack)
+        self.mosaic_mode = None
+        self._apply_mode(settings)
+
+        # display rate: configured fps, capped at the monitor refresh rate
+        fps = settings.display_fps
+        screen = QApplication.primaryScreen()
+        if screen is not None and screen.refreshRate() > 0:
+            fps = min(fps, screen.refreshRate())
+
+        # colour conversion and scaling happen on the renderer thread,
+        # the GUI thread only blits finished images on each display tick
+        self.renderer = FrameRenderer(frames, fps, mosaic=self.mosaic)
+        self.renderer.start()
+
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self.update_images)
+        self.display_timer.start(int(1000 / max(1, fps)))
+
     def add_camera(self, camera_id):
-        if camera_id in self.camera_labels:
+        if camera_id in self.camera_ids:
             return # already added
+        self.camera_ids.add(camera_id)
+        self.renderer.add_camera(camera_id)
+        self.mosaic.add_camera(camera_id)
+        if not self.mosaic_mode:
+            self._add_label(camera_id)
+            self._arrange_cameras()
+
+    def remove_camera(self, camera_id):
+        """
+        Takes the tile of a disconnected camera off the screen.
+        """
+        if camera_id not in self.camera_ids:
+            return
+        self.camera_ids.discard(camera_id)
+        self.renderer.remove_camera(camera_id)
+        self.mosaic.remove_camera(camera_id)
+        label = self.camera_labels.pop(camera_id, None)
+        if label is not None:
+            label.setParent(None)
+            label.deleteLater()
+            self._arrange_cameras()
 
-        label = QLabel(self)
+    def _add_label(self, camera_id):
+        label = QLabel(self.tiles)
         label.setAlignment(Qt.AlignCenter)
         label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
         label.setStyleSheet("border: 1px solid gray; background-color: black;")
-        
         self.camera_labels[camera_id] = label
-        self._arrange_cameras()
 
     def _arrange_cameras(self):
         # clear layout (remove from view but don't delete widgets yet)
-        for i in reversed(range(self.grid_layout.count())): 
+        for i in reversed(range(self.grid_layout.count())):
             self.grid_layout.itemAt(i).widget().setParent(None)
 
         camera_ids = sorted(self.camera_labels.keys())
@@ -34,40 +87,77 @@ class CameraGrid(QWidget):
         if num_cameras == 0: return
 
         cols = int(np.ceil(np.sqrt(num_cameras))) # for camera grid layout
-        
+
         for i, cid in enumerate(camera_ids):
             label = self.camera_labels[cid]
+            label.setParent(self.tiles)
             row = i // cols
             col = i % cols
             self.grid_layout.addWidget(label, row, col)
-    
-    @pyqtSlot(int, np.ndarray)
-    def update_image(self, camera_index, frame) -> None:
-        if camera_index not in self.camera_labels:
-            self.add_camera(camera_index)
-
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        label = self.camera_labels.get(camera_index)
-        if label:
-            height, width, channels = rgb_frame.shape
-            bytes_per_line = channels * width
-
-            qt_image = QtGui.QImage(
-                rgb_frame.data, 
-                width, 
-                height, 
-                bytes_per_line, 
-                QtGui.QImage.Format_RGB888
-            )
-        
-            pixmap = QPixmap.fromImage(qt_image)
-            scaled_pixmap = pixmap.scaled(
-                label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            label.setPixmap(scaled_pixmap)
+
+    def _apply_mode(self, settings) -> None:
+        """
+        Switches between per-camera labels and the mosaic canvas.
+        """
+        self.mosaic.set_page_size(settings.mosaic_page_size)
+        if settings.mosaic_view == self.mosaic_mode:
+            return
+        self.mosaic_mode = settings.mosaic_view
+        if self.mosaic_mode:
+            self.stack.setCurrentWidget(self.mosaic_view)
+            self.mosaic_view.setFocus()
+        else:
+            # labels are only created once tile mode is actually shown
+            for camera_id in self.camera_ids - set(self.camera_labels):
+                self._add_label(camera_id)
+            self._arrange_cameras()
+            self.stack.setCurrentWidget(self.tiles)
+
+    def update_images(self) -> None:
+        """
+        Blits the images the renderer finished since the last display tick.
+        """
+        self._apply_mode(config.runtime.snapshot)
+        if self.mosaic_mode:
+            # Qt merges these into a single repaint of the changed tiles
+            for x, y, w, h in self.renderer.take_dirty():
+                self.mosaic_view.update(x, y, w, h)
+            return
+
+        for camera_index, image in self.renderer.take_ready().items():
+            if camera_index not in self.camera_labels:
+                self.add_camera(camera_index)
+            started = time.perf_counter_ns()
+            self.camera_labels[camera_index].setPixmap(QPixmap.fromImage(image))
+            metrics.observe(PAINT, camera_index, (time.perf_counter_ns() - started) * 1e-9)
+
+        # tile sizes feed back into the renderer for the next frames
+        for camera_index, label in self.camera_labels.items():
+            size = label.contentsRect().size()
+            self.renderer.set_target_size(camera_index, size.width(), size.height())
+
+    def camera_at(self, pos):
+        """
+        Camera shown at `pos` (grid coordinates), or None.
+        """
+        if self.mosaic_mode:
+            point = self.mosaic_view.mapFrom(self, pos)
+            return self.mosaic.camera_at(point.x(), point.y())
+        for camera_id, label in self.camera_labels.items():
+            if label.isVisible() and label.geometry().contains(label.parentWidget().mapFrom(self, pos)):
+                return camera_id
+        return None
+
+    def contextMenuEvent(self, event):  # pylint: disable=invalid-name
+        camera_id = self.camera_at(event.pos())
+        if camera_id is None:
+            return
+        menu = QMenu(self)
+        edit_zones = menu.addAction(f"Edit Detection Zones of Camera {camera_id}...")
+        if menu.exec_(event.globalPos()) == edit_zones:
+            from .zone_editor import ZoneEditor  # pylint: disable=import-outside-toplevel
+            ZoneEditor(camera_id, self.renderer.latest_frame(camera_id), self).exec_()
 
     def stop_all_threads(self):
-        pass # no local threads anymore
+        self.display_timer.stop()
+        self.renderer.stop()
@@ -1,6 +1,6 @@
 from PyQt5.QtCore import Qt, pyqtSignal  # pylint: disable=no-name-in-module
 from PyQt5.QtGui import QPalette, QColor  # pylint: disable=no-name-in-module
-from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QSpinBox, QHBoxLayout, QScrollArea, QGroupBox, QSizePolicy
+from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QSpinBox, QCheckBox, QComboBox, QLineEdit, QHBoxLayout, QScrollArea, QGroupBox, QSizePolicy
 from server_node import config
 
 class ControlBar(QWidget):
@@ -34,7 +34,7 @@ class ControlBar(QWidget):
         
         threshold_group = QGroupBox("Threshold")
         threshold_layout = QHBoxLayout(threshold_group)
-        self.threshold_spin_box = QSpinBox(minimum=0, maximum=255, value=config.settings.value("Binary Threshold", 100, type=int))
+        self.threshold_spin_box = QSpinBox(minimum=0, maximum=255, value=config.runtime.snapshot.binary_threshold)
         self.threshold_spin_box.setPrefix("Value: ")
         self.threshold_spin_box.valueChanged.connect(self.set_binary_threshold)
         threshold_layout.addWidget(self.threshold_spin_box)
@@ -42,24 +42,106 @@ class ControlBar(QWidget):
         
         contour_group = QGroupBox("Contour Settings")
         contour_layout = QHBoxLayout(contour_group)
-        self.min_contour_spin = QSpinBox(minimum=0, maximum=10000, value=config.settings.value("Contour Size", 400, type=int))
+        self.min_contour_spin = QSpinBox(minimum=0, maximum=10000, value=config.runtime.snapshot.contour_size)
         self.min_contour_spin.setPrefix("Min Area: ")
         self.min_contour_spin.valueChanged.connect(self.set_contour_size)
         contour_layout.addWidget(self.min_contour_spin)
         controls_layout.addWidget(contour_group)
 
+        detection_group = QGroupBox("Detection")
+        detection_layout = QHBoxLayout(detection_group)
+        self.detection_scale_spin = QSpinBox(minimum=10, maximum=100, value=int(round(config.runtime.snapshot.detection_scale * 100)))
+        self.detection_scale_spin.setPrefix("Scale: ")
+        self.detection_scale_spin.setSuffix("%")
+        self.detection_scale_spin.setSingleStep(5)
+        self.detection_scale_spin.valueChanged.connect(self.set_detection_scale)
+        detection_layout.addWidget(self.detection_scale_spin)
+        self.detection_grayscale_check = QCheckBox("Grayscale")
+        self.detection_grayscale_check.setChecked(config.runtime.snapshot.detection_grayscale)
+        self.detection_grayscale_check.toggled.connect(self.set_detection_grayscale)
+        detection_layout.addWidget(self.detection_grayscale_check)
+        self.prefilter_spin = QSpinBox(minimum=0, maximum=64, value=config.runtime.snapshot.prefilter_threshold)
+        self.prefilter_spin.setPrefix("Pre-Filter: ")
+        self.prefilter_spin.setSpecialValueText("Pre-Filter: Off")
+        self.prefilter_spin.valueChanged.connect(self.set_prefilter_threshold)
+        detection_layout.addWidget(self.prefilter_spin)
+        self.object_classes_edit = QLineEdit(config.runtime.snapshot.object_classes)
+        self.object_classes_edit.setPlaceholderText("Objects: any motion")
+        self.object_classes_edit.setToolTip("Only count motion confirmed as these classes, e.g. person, car;\n"
+                                            "needs an Object Model, without one any motion counts")
+        self.object_classes_edit.editingFinished.connect(self.set_object_classes)
+        detection_layout.addWidget(self.object_classes_edit)
+        controls_layout.addWidget(detection_group)
+
+        processing_group = QGroupBox("Processing")
+        processing_layout = QHBoxLayout(processing_group)
+        self.processing_budget_spin = QSpinBox(minimum=10, maximum=100, value=config.runtime.snapshot.processing_budget)
+        self.processing_budget_spin.setPrefix("CPU Budget: ")
+        self.processing_budget_spin.setSuffix("%")
+        self.processing_budget_spin.setSingleStep(5)
+        self.processing_budget_spin.valueChanged.connect(self.set_processing_budget)
+        processing_layout.addWidget(self.processing_budget_spin)
+        self.idle_fps_spin = QSpinBox(minimum=1, maximum=30, value=int(config.runtime.snapshot.idle_process_fps))
+        self.idle_fps_spin.setPrefix("Idle: ")
+        self.idle_fps_spin.setSuffix(" fps")
+        self.idle_fps_spin.valueChanged.connect(self.set_idle_process_fps)
+        processing_layout.addWidget(self.idle_fps_spin)
+        controls_layout.addWidget(processing_group)
+
         self.toggle_theme_button = QPushButton("Use Light Mode")
         self.toggle_theme_button.clicked.connect(self.toggle_theme)
         controls_layout.addWidget(self.toggle_theme_button)
 
-        self.is_recording = config.settings.value("RECORDING_TOGGLE", False, type=bool)
+        self.is_recording = config.runtime.snapshot.recording
         self.toggle_recording_button = QPushButton("Start Recording")
         self.toggle_recording_button.clicked.connect(self.toggle_recording)
         controls_layout.addWidget(self.toggle_recording_button)
+
+        self.toggle_motion_recording_button = QPushButton("Enable Motion Recording")
+        self.toggle_motion_recording_button.clicked.connect(self.toggle_motion_recording)
+        controls_layout.addWidget(self.toggle_motion_recording_button)
+
+        clip_group = QGroupBox("Motion Clips")
+        clip_layout = QHBoxLayout(clip_group)
+        self.pre_roll_spin = QSpinBox(minimum=0, maximum=60, value=config.runtime.snapshot.pre_roll_seconds)
+        self.pre_roll_spin.setPrefix("Pre-Roll: ")
+        self.pre_roll_spin.setSuffix(" s")
+        self.pre_roll_spin.valueChanged.connect(self.set_pre_roll)
+        clip_layout.addWidget(self.pre_roll_spin)
+        self.post_roll_spin = QSpinBox(minimum=0, maximum=300, value=config.runtime.snapshot.post_roll_seconds)
+        self.post_roll_spin.setPrefix("Post-Roll: ")
+        self.post_roll_spin.setSuffix(" s")
+        self.post_roll_spin.valueChanged.connect(self.set_post_roll)
+        clip_layout.addWidget(self.post_roll_spin)
+        controls_layout.addWidget(clip_group)
+
+        display_group = QGroupBox("Display")
+        display_layout = QHBoxLayout(display_group)
+        self.mosaic_check = QCheckBox("Mosaic")
+        self.mosaic_check.setToolTip("Draw all cameras into one canvas; double-click a tile to focus it")
+        self.mosaic_check.setChecked(config.runtime.snapshot.mosaic_view)
+        self.mosaic_check.toggled.connect(self.set_mosaic_view)
+        display_layout.addWidget(self.mosaic_check)
+        self.page_size_spin = QSpinBox(minimum=1, maximum=100, value=config.runtime.snapshot.mosaic_page_size)
+        self.page_size_spin.setPrefix("Per Page: ")
+        self.page_size_spin.valueChanged.connect(self.set_mosaic_page_size)
+        display_layout.addWidget(self.page_size_spin)
+        self.scaling_combo = QComboBox()
+        self.scaling_combo.addItems(["area", "linear", "nearest"])
+        self.scaling_combo.setToolTip("Tile scaling: area looks best, nearest is fastest")
+        self.scaling_combo.setCurrentText(config.runtime.snapshot.display_scaling)
+        self.scaling_combo.currentTextChanged.connect(self.set_display_scaling)
+        display_layout.addWidget(self.scaling_combo)
+        self.stats_overlay_check = QCheckBox("Stats Overlay")
+        self.stats_overlay_check.setChecked(config.runtime.snapshot.stats_overlay)
+        self.stats_overlay_check.toggled.connect(self.set_stats_overlay)
+        display_layout.addWidget(self.stats_overlay_check)
+        controls_layout.addWidget(display_group)
         
         self.update_view_button_text()
         self.update_theme_button_text()
         self.update_recording_button_text()
+        self.update_motion_recording_button_text()
 
         controls_layout.addStretch()
         
@@ -73,18 +155,16 @@ class ControlBar(QWidget):
         """
         Toggles the camera view between raw and processed modes.
         """
-        raw_view_toggled = not config.settings.value("Raw View", True, type=bool)
-        config.settings.setValue("Raw View", raw_view_toggled)
+        config.runtime.update(raw_view=not config.runtime.snapshot.raw_view)
         self.update_view_button_text()
 
     def toggle_theme(self):
-        light_mode_toggled = not config.settings.value("Dark Mode", True, type=bool)
-        config.settings.setValue("Dark Mode", light_mode_toggled)
+        config.runtime.update(dark_mode=not config.runtime.snapshot.dark_mode)
         self.set_theme()
         self.update_theme_button_text()
     
     def set_theme(self):
-        if config.settings.value("Dark Mode", True, type=bool):
+        if config.runtime.snapshot.dark_mode:
             self.toggle_theme_button.setText("Use Light Mode")
             # there has to be a better way to have simple dark mode than 500 lines of whatever this is
             QApplication.setStyle("Fusion")
@@ -114,30 +194,76 @@ class ControlBar(QWidget):
             QApplication.setPalette(QPalette())
 
     def set_binary_threshold(self):
-        config.settings.setValue("Binary Threshold", self.threshold_spin_box.value())
+        config.runtime.update(binary_threshold=self.threshold_spin_box.value())
 
     def set_contour_size(self):
-        config.settings.setValue("Contour Size", self.min_contour_spin.value())
+        config.runtime.update(contour_size=self.min_contour_spin.value())
+
+    def set_detection_scale(self):
+        config.runtime.update(detection_scale=self.detection_scale_spin.value() / 100)
+
+    def set_detection_grayscale(self, checked):
+        config.runtime.update(detection_grayscale=checked)
+
+    def set_prefilter_threshold(self):
+        config.runtime.update(prefilter_threshold=self.prefilter_spin.value())
+
+    def set_object_classes(self):
+        config.runtime.update(object_classes=self.object_classes_edit.text().strip())
+
+    def set_processing_budget(self):
+        config.runtime.update(processing_budget=self.processing_budget_spin.value())
+
+    def set_idle_process_fps(self):
+        config.runtime.update(idle_process_fps=float(self.idle_fps_spin.value()))
+
+    def set_stats_overlay(self, checked):
+        config.runtime.update(stats_overlay=checked)
+
+    def set_mosaic_view(self, checked):
+        config.runtime.update(mosaic_view=checked)
+
+    def set_mosaic_page_size(self):
+        config.runtime.update(mosaic_page_size=self.page_size_spin.value())
+
+    def set_display_scaling(self, scaling):
+        config.runtime.update(display_scaling=scaling)
 
     def toggle_recording(self):
         self.is_recording = not self.is_recording
-        config.settings.setValue("RECORDING_TOGGLE", self.is_recording)
+        config.runtime.update(recording=self.is_recording)
         self.recording_toggled.emit(self.is_recording)
         self.update_recording_button_text()
 
+    def toggle_motion_recording(self):
+        config.runtime.update(motion_recording=not config.runtime.snapshot.motion_recording)
+        self.update_motion_recording_button_text()
+
+    def set_pre_roll(self):
+        config.runtime.update(pre_roll_seconds=self.pre_roll_spin.value())
+
+    def set_post_roll(self):
+        config.runtime.update(post_roll_seconds=self.post_roll_spin.value())
+
+    def update_motion_recording_button_text(self):
+        self.toggle_motion_recording_button.setText(
+            "Disable Motion Recording" if config.runtime.snapshot.motion_recording
+            else "Enable Motion Recording"
+        )
+
     def update_recording_button_text(self):
         self.toggle_recording_button.setText(
             "Stop Recording" if self.is_recording else "Start Recording"
         )
 
     def update_view_button_text(self):
-        processed_view = config.settings.value("Raw View", True, type=bool)
+        processed_view = config.runtime.snapshot.raw_view
         self.toggle_view_button.setText(
             "Show Processed View" if processed_view else "Show Raw View"
         )
 
     def update_theme_button_text(self):
-        dark_mode = config.settings.value("Dark Mode", True, type=bool)
+        dark_mode = config.runtime.snapshot.dark_mode
         self.toggle_theme_button.setText(
             "Use Light Mode" if dark_mode else "Use Dark Mode"
         )
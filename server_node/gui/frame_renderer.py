@@ -0,0 +1,208 @@
+"""
+Background thread that turns raw BGR frames into display-ready QImages.
+
+Images wrap pooled BGR buffers (or the received frame itself when it needs
+no scaling or overlay) instead of owning a copy; each QImage keeps its
+array alive until the GUI has turned it into a pixmap. In mosaic mode the
+frames are composited into the shared Mosaic canvas instead.
+"""
+import threading
+import time
+import cv2
+import numpy as np
+from PyQt5.QtCore import QThread  # pylint: disable=no-name-in-module
+from PyQt5.QtGui import QImage  # pylint: disable=no-name-in-module
+from server_node import config
+from server_node.backend.frame_mailbox import FrameMailbox
+from server_node.backend.frame_pool import FramePool
+from server_node.backend.metrics import metrics, PROCESS, RENDER, PAINT
+from server_node.backend.overlay import draw_boxes
+
+OVERLAY_FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Display Scaling setting -> OpenCV interpolation for downscaling
+SCALING = {
+    "area": cv2.INTER_AREA,  # best quality, slowest
+    "linear": cv2.INTER_LINEAR,
+    "nearest": cv2.INTER_NEAREST,  # an order of magnitude cheaper than area
+}
+
+
+class FrameRenderer(QThread):
+    """
+    Downscales the latest frame of each camera and draws its boxes off the
+    GUI thread.
+
+    The GUI publishes the size of each tile with `set_target_size` and picks
+    up finished images with `take_ready`, so all it has to do is blit. With
+    a `mosaic` and the Mosaic View setting on, it draws into the mosaic
+    canvas and the GUI picks up the changed areas with `take_dirty`.
+    """
+    def __init__(self, mailbox: FrameMailbox, fps: float, mosaic=None, parent=None):
+        super().__init__(parent)
+        self.mailbox = mailbox
+        self.mosaic = mosaic
+        self.frame_interval = 1.0 / max(1.0, fps)
+        self._lock = threading.Lock()
+        self._targets = {}  # camera_id -> (width, height)
+        self._ready = {}  # camera_id -> QImage
+        self._dirty = []  # mosaic canvas rectangles changed since the last take_dirty
+        self._running = True
+        self._arrivals = {}  # camera_id -> (last arrival, moving average interval)
+        self._pools = {}  # camera_id -> FramePool of scaled images
+        self._latest = {}  # camera_id -> newest frame, for snapshots such as the zone editor
+        self._removed = set()  # disconnected cameras whose late frames are dropped
+
+    def set_target_size(self, camera_id: int, width: int, height: int) -> None:
+        """
+        Sets the tile size that frames of `camera_id` are scaled to fit.
+        """
+        with self._lock:
+            self._targets[camera_id] = (width, height)
+
+    def add_camera(self, camera_id: int) -> None:
+        with self._lock:
+            self._removed.discard(camera_id)
+
+    def remove_camera(self, camera_id: int) -> None:
+        """
+        Forgets a disconnected camera; frames still on their way are dropped
+        until it is added again.
+        """
+        with self._lock:
+            self._removed.add(camera_id)
+            self._targets.pop(camera_id, None)
+            self._ready.pop(camera_id, None)
+        self._latest.pop(camera_id, None)
+
+    def take_ready(self) -> dict:
+        """
+        Returns and clears the images finished since the last call.
+        """
+        with self._lock:
+            ready, self._ready = self._ready, {}
+            return ready
+
+    def latest_frame(self, camera_id: int):
+        """
+        The newest frame received for `camera_id`, or None. Read-only.
+        """
+        return self._latest.get(camera_id)
+
+    def take_dirty(self) -> list:
+        """
+        Returns and clears the mosaic rectangles drawn since the last call.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, []
+            return dirty
+
+    def stop(self) -> None:
+        """
+        Asks the thread to exit and waits for it.
+        """
+        self._running = False
+        self.wait()
+
+    def run(self):
+        while self._running:
+            started = time.monotonic()
+            frames = self.mailbox.take_all(timeout=0.1)
+            with self._lock:
+                removed = set(self._removed)
+            for camera_id in removed & frames.keys():
+                del frames[camera_id]
+            for camera_id, (frame, _) in frames.items():
+                self._latest[camera_id] = frame
+            settings = config.runtime.snapshot
+            interpolation = SCALING.get(settings.display_scaling, cv2.INTER_AREA)
+
+            if self.mosaic is not None and settings.mosaic_view:
+                if not frames and not self.mosaic.needs_layout:
+                    continue
+                render_started = time.perf_counter_ns()
+                texts = {cid: self._overlay_text(cid) for cid in frames} if settings.stats_overlay else {}
+                dirty = self.mosaic.draw(frames, texts, interpolation)
+                if frames:
+                    share = (time.perf_counter_ns() - render_started) * 1e-9 / len(frames)
+                    for camera_id in frames:
+                        metrics.observe(RENDER, camera_id, share)
+                with self._lock:
+                    self._dirty.extend(dirty)
+            else:
+                if not frames:
+                    continue
+
+                with self._lock:
+                    targets = dict(self._targets)
+
+                rendered = {}
+                for camera_id, (frame, boxes) in frames.items():
+                    render_started = time.perf_counter_ns()
+                    text = self._overlay_text(camera_id) if settings.stats_overlay else None
+                    pool = self._pools.setdefault(camera_id, FramePool(capacity=4))
+                    rendered[camera_id] = self._render(frame, targets.get(camera_id), boxes, text, pool,
+                                                       interpolation)
+                    metrics.observe(RENDER, camera_id, (time.perf_counter_ns() - render_started) * 1e-9)
+
+                with self._lock:
+                    self._ready.update((cid, image) for cid, image in rendered.items()
+                                       if cid not in self._removed)
+
+            # no point rendering faster than the display picks images up
+            remaining = self.frame_interval - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def _overlay_text(self, camera_id: int) -> str:
+        """
+        Display rate and recent stage latencies of a camera, e.g.
+        "29.8 fps | proc 12.1 ms | paint 0.4 ms".
+        """
+        now = time.monotonic()
+        last, interval = self._arrivals.get(camera_id, (None, None))
+        if last is not None:
+            interval = now - last if interval is None else interval + 0.1 * ((now - last) - interval)
+        self._arrivals[camera_id] = (now, interval)
+
+        parts = [f"{1.0 / interval:.1f} fps" if interval else "-- fps"]
+        for label, stage in (("proc", PROCESS), ("paint", PAINT)):
+            recent = metrics.recent(stage, camera_id)
+            if recent is not None:
+                parts.append(f"{label} {recent * 1000:.1f} ms")
+        return " | ".join(parts)
+
+    @staticmethod
+    def _render(frame: np.ndarray, target, boxes=None, overlay: str = None, pool: FramePool = None,
+                interpolation: int = cv2.INTER_AREA) -> QImage:
+        """
+        Scales `frame` to fit `target` and draws the boxes and stats text.
+        The source frame is shared with the recorder and processing, so
+        anything drawn goes onto a pooled copy, never onto the frame.
+        """
+        pool = pool or FramePool(capacity=1)
+        height, width = frame.shape[:2]
+        scale = 1.0
+        if target is not None and target[0] > 0 and target[1] > 0:
+            scale = min(target[0] / width, target[1] / height)
+
+        image = frame
+        if scale != 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            if scale > 1.0 and interpolation == cv2.INTER_AREA:
+                interpolation = cv2.INTER_LINEAR
+            image = cv2.resize(frame, size, dst=pool.acquire((size[1], size[0], 3)), interpolation=interpolation)
+        elif (boxes is not None and boxes.boxes) or overlay:
+            image = pool.acquire(frame.shape)
+            np.copyto(image, frame)
+
+        if boxes is not None:
+            draw_boxes(image, boxes.boxes, boxes.labels, scale)
+        if overlay:
+            cv2.putText(image, overlay, (6, 18), OVERLAY_FONT, 0.5, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(image, overlay, (6, 18), OVERLAY_FONT, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+        height, width = image.shape[:2]
+        qt_image = QImage(image.data, width, height, image.strides[0], QImage.Format_BGR888)
+        # QImage only borrows the memory; keep the array (and its pool slot) alive with it
+        qt_image.buffer = image
+        return qt_image
@@ -0,0 +1,266 @@
+"""
+Single-canvas mosaic view for large camera walls.
+
+Instead of one QLabel per camera, each rescaled and repainted on its own,
+every tile is composited into one preallocated canvas. A new frame is
+resized and written into its fixed slot, only the slots that changed are
+redrawn, and the widget repaints their union once per display tick. The
+canvas is 32-bit BGRX, Qt's native RGB32 layout, so painting it is a plain
+blit without a per-paint format conversion.
+
+Cameras beyond the page size go onto further pages and only the visible
+page is rendered at all; double-clicking a tile focuses that camera.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import Qt  # pylint: disable=no-name-in-module
+from PyQt5.QtGui import QImage, QPainter  # pylint: disable=no-name-in-module
+from PyQt5.QtWidgets import QWidget  # pylint: disable=no-name-in-module
+from server_node.backend.metrics import metrics, PAINT
+from server_node.backend.overlay import draw_boxes
+
+Rect = Tuple[int, int, int, int]  # x, y, w, h
+
+GAP = 2  # pixels between slots
+BACKGROUND = 40
+TEXT_FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class Mosaic:
+    """
+    Canvas and slot layout shared by the renderer thread, which draws
+    tiles, and the GUI thread, which paints the canvas and changes pages.
+    Pixels and layout are only touched with `lock` held; the renderer
+    scales and draws a tile outside it and only holds it for the copy into
+    the canvas, so a paint never waits for a resize.
+    """
+    def __init__(self, page_size: int = 25):
+        self.lock = threading.Lock()
+        self.page_size = max(1, page_size)
+        self.page = 0
+        self.focus = None
+        self.canvas = np.full((1, 1, 4), BACKGROUND, dtype=np.uint8)
+        self.cameras: List[int] = []
+        self.slots: Dict[int, Rect] = {}  # visible cameras only
+        self.needs_layout = True
+        self._size = (1, 1)
+        self._latest = {}  # camera_id -> (frame, overlay, text), to redraw after layout changes
+        self._tile_shapes = {}  # camera_id -> frame shape last drawn into its slot
+        self._scaled = {}  # camera_id -> reused BGR buffer the frame is resized into
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(len(self.cameras) / self.page_size))
+
+    def add_camera(self, camera_id: int) -> None:
+        with self.lock:
+            if camera_id not in self.cameras:
+                bisect.insort(self.cameras, camera_id)
+                self.needs_layout = True
+
+    def remove_camera(self, camera_id: int) -> None:
+        with self.lock:
+            if camera_id in self.cameras:
+                self.cameras.remove(camera_id)
+                self.needs_layout = True
+            self._latest.pop(camera_id, None)
+            self._scaled.pop(camera_id, None)
+
+    def resize(self, width: int, height: int) -> None:
+        with self.lock:
+            if (width, height) != self._size:
+                self._size = (max(1, width), max(1, height))
+                self.needs_layout = True
+
+    def set_page(self, page: int) -> None:
+        with self.lock:
+            page = min(max(0, page), self.pages - 1)
+            if page != self.page or self.focus is not None:
+                self.page, self.focus = page, None
+                self.needs_layout = True
+
+    def set_page_size(self, page_size: int) -> None:
+        with self.lock:
+            if page_size != self.page_size:
+                self.page_size = max(1, page_size)
+                self.needs_layout = True
+
+    def set_focus(self, camera_id: Optional[int]) -> None:
+        """
+        Shows only `camera_id` across the whole canvas, None goes back to the page.
+        """
+        with self.lock:
+            if camera_id != self.focus:
+                self.focus = camera_id
+                self.needs_layout = True
+
+    def camera_at(self, x: int, y: int) -> Optional[int]:
+        with self.lock:
+            for camera_id, (sx, sy, sw, sh) in self.slots.items():
+                if sx <= x < sx + sw and sy <= y < sy + sh:
+                    return camera_id
+        return None
+
+    def _layout(self) -> None:
+        """
+        Recomputes the slots for the current page and clears the canvas.
+        Called with the lock held.
+        """
+        width, height = self._size
+        if self.canvas.shape[:2] != (height, width):
+            self.canvas = np.empty((height, width, 4), dtype=np.uint8)
+        self.canvas[:] = BACKGROUND
+        self.page = min(self.page, self.pages - 1)
+        if self.focus in self.cameras:
+            visible = [self.focus]
+        else:
+            self.focus = None
+            visible = self.cameras[self.page * self.page_size:(self.page + 1) * self.page_size]
+
+        self.slots = {}
+        self._tile_shapes = {}
+        if visible:
+            cols = math.ceil(math.sqrt(len(visible)))
+            rows = math.ceil(len(visible) / cols)
+            slot_w, slot_h = width // cols, height // rows
+            for i, camera_id in enumerate(visible):
+                x, y = (i % cols) * slot_w, (i // cols) * slot_h
+                self.slots[camera_id] = (x, y, max(1, slot_w - GAP), max(1, slot_h - GAP))
+                self.canvas[y:y + slot_h - GAP, x:x + slot_w - GAP] = 0
+        if self.pages > 1 and self.focus is None:
+            label = f"page {self.page + 1}/{self.pages}"
+            cv2.putText(self.canvas, label, (6, height - 8), TEXT_FONT, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        self.needs_layout = False
+
+    def draw(self, frames: dict, texts: dict, interpolation: int) -> List[Rect]:
+        """
+        Composites new frames into their slots and returns the canvas
+        rectangles that changed. `frames` maps camera id -> (frame, overlay)
+        as taken from the mailbox; `texts` holds optional stats text per tile.
+        """
+        for camera_id in frames:
+            if camera_id not in self.cameras:
+                self.add_camera(camera_id)
+        for camera_id, (frame, overlay) in frames.items():
+            self._latest[camera_id] = (frame, overlay, texts.get(camera_id))
+
+        with self.lock:
+            relayout = self.needs_layout
+            if relayout:
+                self._layout()
+                redraw = list(self.slots)
+            else:
+                redraw = [camera_id for camera_id in frames if camera_id in self.slots]
+
+        dirty = []
+        for camera_id in redraw:
+            latest = self._latest.get(camera_id)
+            with self.lock:
+                slot = self.slots.get(camera_id)
+            if latest is None or slot is None:
+                continue
+            frame, overlay, text = latest
+            tile = self._scale_tile(camera_id, slot, frame, overlay, text, interpolation)
+            with self.lock:
+                if self.slots.get(camera_id) != slot:
+                    continue  # laid out again meanwhile; the next pass redraws everything
+                self._blit(camera_id, slot, frame.shape, tile)
+            dirty.append(slot)
+        if relayout:
+            return [(0, 0) + self._size]
+        return dirty
+
+    def _scale_tile(self, camera_id: int, slot: Rect, frame: np.ndarray, overlay, text: Optional[str],
+                    interpolation: int) -> np.ndarray:
+        """
+        Resizes a frame to fit its slot, keeping the aspect ratio, and draws
+        the boxes and stats text onto the resized copy.
+        """
+        _, _, w, h = slot
+        frame_h, frame_w = frame.shape[:2]
+        scale = min(w / frame_w, h / frame_h)
+        size = (max(1, int(frame_w * scale)), max(1, int(frame_h * scale)))
+        if interpolation == cv2.INTER_AREA and scale > 1.0:
+            interpolation = cv2.INTER_LINEAR
+        tile = self._scaled[camera_id] = cv2.resize(frame, size, dst=self._scaled.get(camera_id),
+                                                    interpolation=interpolation)
+        if overlay is not None:
+            draw_boxes(tile, overlay.boxes, overlay.labels, scale)
+        if text:
+            cv2.putText(tile, text, (6, 18), TEXT_FONT, 0.5, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(tile, text, (6, 18), TEXT_FONT, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+        return tile
+
+    def _blit(self, camera_id: int, slot: Rect, shape: tuple, tile: np.ndarray) -> None:
+        """
+        Copies a scaled tile into the centre of its slot. Called with the lock held.
+        """
+        x, y, w, h = slot
+        if self._tile_shapes.get(camera_id) != shape:
+            # the aspect ratio may have changed, clear the old letterbox bars
+            self.canvas[y:y + h, x:x + w] = 0
+            self._tile_shapes[camera_id] = shape
+        tile_h, tile_w = tile.shape[:2]
+        left, top = x + (w - tile_w) // 2, y + (h - tile_h) // 2
+        cv2.cvtColor(tile, cv2.COLOR_BGR2BGRA, dst=self.canvas[top:top + tile_h, left:left + tile_w])
+
+
+class MosaicView(QWidget):
+    """
+    Paints the mosaic canvas. Page Up/Down, the arrow keys or the mouse
+    wheel switch pages; double-click focuses a camera, Escape or another
+    double-click goes back.
+    """
+    def __init__(self, mosaic: Mosaic, parent=None):
+        super().__init__(parent)
+        self.mosaic = mosaic
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setFocusPolicy(Qt.StrongFocus)
+
+    def resizeEvent(self, event):  # pylint: disable=invalid-name
+        self.mosaic.resize(self.width(), self.height())
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):  # pylint: disable=invalid-name
+        started = time.perf_counter_ns()
+        rect = event.rect()
+        painter = QPainter(self)
+        with self.mosaic.lock:
+            canvas = self.mosaic.canvas
+            height, width = canvas.shape[:2]
+            image = QImage(canvas.data, width, height, canvas.strides[0], QImage.Format_RGB32)
+            painter.drawImage(rect, image, rect)
+            visible = list(self.mosaic.slots)
+        painter.end()
+        if visible:
+            # one paint covers every dirty tile; each camera gets its share
+            share = (time.perf_counter_ns() - started) * 1e-9 / len(visible)
+            for camera_id in visible:
+                metrics.observe(PAINT, camera_id, share)
+
+    def mouseDoubleClickEvent(self, event):  # pylint: disable=invalid-name
+        if self.mosaic.focus is not None:
+            self.mosaic.set_focus(None)
+        else:
+            self.mosaic.set_focus(self.mosaic.camera_at(event.x(), event.y()))
+
+    def keyPressEvent(self, event):  # pylint: disable=invalid-name
+        key = event.key()
+        if key in (Qt.Key_PageDown, Qt.Key_Right, Qt.Key_Down):
+            self.mosaic.set_page(self.mosaic.page + 1)
+        elif key in (Qt.Key_PageUp, Qt.Key_Left, Qt.Key_Up):
+            self.mosaic.set_page(self.mosaic.page - 1)
+        elif key == Qt.Key_Escape:
+            self.mosaic.set_focus(None)
+        else:
+            super().keyPressEvent(event)
+
+    def wheelEvent(self, event):  # pylint: disable=invalid-name
+        step = -1 if event.angleDelta().y() > 0 else 1
+        self.mosaic.set_page(self.mosaic.page + step)
@@ -0,0 +1,173 @@
+"""
+Dialog for drawing a camera's detection zones over its latest frame.
+"""
+from typing import List, Optional
+
+import numpy as np
+from PyQt5.QtCore import QPointF, QRectF, Qt  # pylint: disable=no-name-in-module
+from PyQt5.QtGui import QBrush, QColor, QImage, QPainter, QPen, QPolygonF  # pylint: disable=no-name-in-module
+from PyQt5.QtWidgets import (  # pylint: disable=no-name-in-module
+    QComboBox, QDialog, QDialogButtonBox, QHBoxLayout, QLabel, QLineEdit, QListWidget, QPushButton,
+    QSizePolicy, QVBoxLayout, QWidget,
+)
+from server_node import config
+from server_node.backend.zones import ZONE_MODES, Zone, dump_zones, parse_zones
+
+ZONE_COLOURS = {"include": QColor(0, 200, 0), "exclude": QColor(220, 0, 0)}
+
+
+class ZoneCanvas(QWidget):
+    """
+    Shows the frame letterboxed and the zones over it. Left clicks add
+    points to the polygon being drawn; a right click or double click closes
+    it and hands it to `on_polygon`.
+    """
+    def __init__(self, frame: Optional[np.ndarray], on_polygon, parent=None):
+        super().__init__(parent)
+        if frame is None:
+            frame = np.zeros((360, 640, 3), dtype=np.uint8)
+        frame = np.ascontiguousarray(frame)
+        height, width = frame.shape[:2]
+        self.image = QImage(frame.data, width, height, frame.strides[0], QImage.Format_BGR888).copy()
+        self.zones: List[Zone] = []
+        self.points = []  # polygon being drawn, as fractions of the frame
+        self.selected = None
+        self.on_polygon = on_polygon
+        self.setMinimumSize(480, 270)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setCursor(Qt.CrossCursor)
+
+    def _image_rect(self) -> QRectF:
+        scale = min(self.width() / self.image.width(), self.height() / self.image.height())
+        width, height = self.image.width() * scale, self.image.height() * scale
+        return QRectF((self.width() - width) / 2, (self.height() - height) / 2, width, height)
+
+    def _to_widget(self, rect: QRectF, points) -> QPolygonF:
+        return QPolygonF([QPointF(rect.x() + x * rect.width(), rect.y() + y * rect.height()) for x, y in points])
+
+    def paintEvent(self, event):  # pylint: disable=invalid-name
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), Qt.black)
+        rect = self._image_rect()
+        painter.drawImage(rect, self.image)
+        for index, zone in enumerate(self.zones):
+            colour = QColor(ZONE_COLOURS[zone.mode])
+            painter.setPen(QPen(colour, 3 if index == self.selected else 1.5))
+            colour.setAlpha(70)
+            painter.setBrush(QBrush(colour))
+            polygon = self._to_widget(rect, zone.points)
+            painter.drawPolygon(polygon)
+            painter.setPen(Qt.white)
+            painter.drawText(polygon.boundingRect().topLeft() + QPointF(4, 14), zone.name)
+        if self.points:
+            painter.setPen(QPen(QColor(255, 220, 0), 2))
+            painter.setBrush(Qt.NoBrush)
+            polygon = self._to_widget(rect, self.points)
+            painter.drawPolyline(polygon)
+            for point in polygon:
+                painter.drawEllipse(point, 3, 3)
+        painter.end()
+
+    def mousePressEvent(self, event):  # pylint: disable=invalid-name
+        if event.button() == Qt.RightButton:
+            self.close_polygon()
+            return
+        rect = self._image_rect()
+        x = (event.x() - rect.x()) / rect.width()
+        y = (event.y() - rect.y()) / rect.height()
+        if 0 <= x <= 1 and 0 <= y <= 1:
+            self.points.append((x, y))
+            self.update()
+
+    def mouseDoubleClickEvent(self, event):  # pylint: disable=invalid-name
+        self.close_polygon()
+
+    def close_polygon(self) -> None:
+        if len(self.points) >= 3:
+            self.on_polygon(tuple(self.points))
+        self.points = []
+        self.update()
+
+
+class ZoneEditor(QDialog):
+    """
+    Edits the include/exclude zones of one camera and saves them to the
+    "Detection Zones" setting.
+    """
+    def __init__(self, camera_id: int, frame: Optional[np.ndarray] = None, parent=None):
+        super().__init__(parent)
+        self.camera_id = camera_id
+        self.setWindowTitle(f"Detection Zones - Camera {camera_id}")
+        self.resize(1000, 600)
+
+        self.canvas = ZoneCanvas(frame, self.add_zone, self)
+        self.canvas.zones = list(parse_zones(config.runtime.snapshot.detection_zones).get(camera_id, ()))
+
+        self.zone_list = QListWidget()
+        self.zone_list.currentRowChanged.connect(self.select_zone)
+        self.name_edit = QLineEdit()
+        self.name_edit.setPlaceholderText("Name of the next zone")
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(ZONE_MODES)
+        self.mode_combo.setToolTip("include: only look for motion inside; exclude: ignore motion inside")
+        remove_button = QPushButton("Remove Zone")
+        remove_button.clicked.connect(self.remove_zone)
+        clear_button = QPushButton("Clear All")
+        clear_button.clicked.connect(self.clear_zones)
+        buttons = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.save)
+        buttons.rejected.connect(self.reject)
+
+        side = QVBoxLayout()
+        side.addWidget(QLabel("Click to add points,\nright-click to close the zone."))
+        side.addWidget(self.name_edit)
+        side.addWidget(self.mode_combo)
+        side.addWidget(self.zone_list, 1)
+        side.addWidget(remove_button)
+        side.addWidget(clear_button)
+        side.addWidget(buttons)
+
+        layout = QHBoxLayout(self)
+        layout.addWidget(self.canvas, 1)
+        layout.addLayout(side)
+        self._refresh()
+
+    def _refresh(self) -> None:
+        self.zone_list.clear()
+        for zone in self.canvas.zones:
+            self.zone_list.addItem(f"{zone.name} ({zone.mode})")
+        self.canvas.update()
+
+    def add_zone(self, points) -> None:
+        names = {zone.name for zone in self.canvas.zones}
+        name = self.name_edit.text().strip()
+        if not name or name in names:
+            name = next(f"zone {i}" for i in range(1, len(names) + 2) if f"zone {i}" not in names)
+        # zone names are stored comma separated with events
+        self.canvas.zones.append(Zone(" ".join(name.replace(",", " ").split()), self.mode_combo.currentText(),
+                                      points))
+        self.name_edit.clear()
+        self._refresh()
+
+    def select_zone(self, row: int) -> None:
+        self.canvas.selected = row if row >= 0 else None
+        self.canvas.update()
+
+    def remove_zone(self) -> None:
+        row = self.zone_list.currentRow()
+        if 0 <= row < len(self.canvas.zones):
+            del self.canvas.zones[row]
+            self.canvas.selected = None
+            self._refresh()
+
+    def clear_zones(self) -> None:
+        self.canvas.zones = []
+        self.canvas.selected = None
+        self._refresh()
+
+    def save(self) -> None:
+        zones = dict(parse_zones(config.runtime.snapshot.detection_zones))
+        zones[self.camera_id] = tuple(self.canvas.zones)
+        config.runtime.update(detection_zones=dump_zones(zones))
+        self.accept()
@@ -0,0 +1,49 @@
+"""Headless runner: ingest, processing and recording without Qt."""
+import asyncio
+import logging
+from server_node import config
+from server_node.backend import events
+from server_node.backend.server import create_server, engine, stream_manager
+
+logger = logging.getLogger("headless")
+
+
+async def log_events(bus: events.EventBus):
+    """
+    Default bus consumer when there is no GUI: log what happens.
+    """
+    loop = asyncio.get_running_loop()
+    added = bus.subscribe_queue(events.STREAM_ADDED, loop)
+    removed = bus.subscribe_queue(events.STREAM_REMOVED, loop)
+    motion = bus.subscribe_queue(events.MOTION, loop)
+    tracks = bus.subscribe_queue(events.TRACK_ENDED, loop)
+
+    async def drain(queue, describe):
+        while True:
+            logger.info(describe(await queue.get()))
+
+    await asyncio.gather(
+        drain(added, lambda cid: f"Camera {cid} connected"),
+        drain(removed, lambda cid: f"Camera {cid} disconnected"),
+        drain(motion, lambda e: f"Motion on camera {e.camera_id} ({e.confidence:.0%})"),
+        drain(tracks, lambda e: f"Object #{e.track_id} left camera {e.camera_id} after {e.dwell:.1f} s"),
+    )
+
+
+async def run(host: str = "0.0.0.0", port: int = 8000):
+    """
+    Serves /offer and runs the receive pipeline until interrupted.
+    """
+    settings = config.runtime.snapshot
+    logger.info(
+        "Headless server on %s:%s (settings: %s, recording=%s, motion recording=%s)",
+        host, port, config.settings.path, settings.recording, settings.motion_recording
+    )
+
+    server = create_server(host, port)
+    consumer = asyncio.ensure_future(log_events(stream_manager.events))
+    try:
+        await server.serve()
+    finally:
+        consumer.cancel()
+        engine.shutdown()
@@ -0,0 +1,266 @@
+"""
+Offline re-analysis of recorded footage.
+
+Runs FrameProcessor over recorded segments with one or more parameter sets
+to see how other settings would have done on past footage. Files are split
+into time chunks that are spread over a process pool; inside a worker the
+frames stream through a generator pipeline (decode -> optional rate limit
+-> one processor per parameter set), so each chunk is decoded once for the
+whole sweep.
+
+    python -m server_node.reanalysis recordings/*.mp4 \\
+        --param binary_threshold=80,100,120 --param contour_size=200,400 --workers 4
+
+Settings that are not swept are the server's stored ones (the GUI's, or a
+headless server's `--config` file), read without writing to them. The
+object filter stays off.
+
+Chunks start a few seconds early so the background model has settled when
+the chunk begins; events in that warm-up are discarded. An event that spans
+a chunk boundary can be reported once per chunk.
+"""
+import argparse
+import dataclasses
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Tuple
+
+import av
+import numpy as np
+
+from server_node import config
+from server_node.config import Snapshot
+
+SEGMENT_NAME = re.compile(r"camera(\d+)_(\d{8}_\d{6})")
+
+# settings `--param` refuses, and why
+UNSWEPT = {
+    "object_classes": "the object filter is off offline; its detector confirms motion asynchronously "
+                      "and is shared by all parameter sets of a camera, so results would depend on timing",
+    "object_model": "the object filter is off offline",
+    "detection_zones": "its JSON values contain commas, which separate the swept values",
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Chunk:
+    path: str
+    camera_id: int
+    file_start: float  # unix time of the first frame
+    start: float  # seconds into the file
+    end: float
+    warmup: float
+
+
+def segment_info(path: str) -> Tuple[int, float, float]:
+    """
+    Camera id, unix start time and duration of a recorded segment. The first
+    two come from the recorder's file name when possible.
+    """
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        if stream.duration is not None:
+            duration = float(stream.duration * stream.time_base)
+        elif container.duration is not None:
+            duration = container.duration / av.time_base
+        else:
+            duration = sum(1 for _ in container.demux(stream)) / float(stream.average_rate or 30)
+    match = SEGMENT_NAME.search(os.path.basename(path))
+    if match:
+        camera_id = int(match.group(1))
+        start = datetime.datetime.strptime(match.group(2), "%Y%m%d_%H%M%S").timestamp()
+    else:
+        camera_id = 0
+        start = os.path.getmtime(path) - duration
+    return camera_id, start, duration
+
+
+def plan_chunks(paths: List[str], chunk_seconds: float, warmup: float) -> List[Chunk]:
+    chunks = []
+    for path in paths:
+        camera_id, file_start, duration = segment_info(path)
+        for start in np.arange(0, max(duration, 1e-3), chunk_seconds):
+            chunks.append(Chunk(path, camera_id, file_start, float(start),
+                                float(min(start + chunk_seconds, duration + 1)), warmup))
+    return chunks
+
+
+def decode(path: str, start: float, end: float) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Yields (seconds into the file, BGR frame) for frames in [start, end).
+    """
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if start > 0:
+            container.seek(int(start / stream.time_base), stream=stream, backward=True)
+        for frame in container.decode(stream):
+            if frame.time is None or frame.time < start:
+                continue
+            if frame.time >= end:
+                return
+            yield frame.time, frame.to_ndarray(format="bgr24")
+
+
+def limit_rate(frames: Iterator[Tuple[float, np.ndarray]], fps: float) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Drops frames to at most `fps`, like the live scheduler processing a
+    camera at a reduced rate. `fps <= 0` passes everything through.
+    """
+    next_time = None
+    for timestamp, frame in frames:
+        if fps <= 0 or next_time is None or timestamp >= next_time:
+            next_time = timestamp + (1.0 / fps if fps > 0 else 0)
+            yield timestamp, frame
+
+
+def analyse_chunk(chunk: Chunk, parameter_sets: List[dict], fps: float = 0) -> List[dict]:
+    """
+    Worker entry point: runs every parameter set over one chunk and returns
+    one result dict per set.
+    """
+    from server_node.backend.frame_processor import FrameProcessor  # pylint: disable=import-outside-toplevel
+
+    settings = [Snapshot(**params) for params in parameter_sets]
+    processors = [FrameProcessor(chunk.camera_id) for _ in settings]
+    results = [{"events": [], "dwell": [], "frames": 0, "motion_frames": 0, "seconds": 0.0} for _ in settings]
+    begin = chunk.file_start + chunk.start
+
+    def collect(result):
+        def on_motion(event):
+            if event.started and event.timestamp >= begin:
+                result["events"].append({"camera_id": event.camera_id, "ts": event.timestamp,
+                                         "confidence": event.confidence,
+                                         "tracks": [t.track_id for t in event.tracks],
+                                         "zones": list(event.zones)})
+
+        def on_track_ended(event):
+            if event.last_seen >= begin:
+                result["dwell"].append(event.dwell)
+        return on_motion, on_track_ended
+
+    for processor, result in zip(processors, results):
+        on_motion, on_track_ended = collect(result)
+        processor.add_motion_listener(on_motion)
+        processor.add_track_listener(on_track_ended)
+
+    frames = limit_rate(decode(chunk.path, max(0.0, chunk.start - chunk.warmup), chunk.end), fps)
+    for offset, frame in frames:
+        timestamp = chunk.file_start + offset
+        counted = offset >= chunk.start
+        for processor, snapshot, result in zip(processors, settings, results):
+            started = time.perf_counter()
+            processor.process(frame, snapshot, timestamp)
+            if counted:
+                result["seconds"] += time.perf_counter() - started
+                result["frames"] += 1
+                result["motion_frames"] += bool(processor.last_boxes)
+
+    for processor, result in zip(processors, results):
+        result["prefilter_skipped"] = processor.framesSkipped
+        result["prefilter_frames"] = processor.framesSeen
+    return results
+
+
+def parameter_grid(base: dict, sweeps: List[str]) -> List[dict]:
+    """
+    Cartesian product of `--param name=v1,v2` options over `base`.
+    """
+    types = {field.name: type(field.default) for field in dataclasses.fields(Snapshot)}
+    axes = []
+    for sweep in sweeps:
+        name, _, values = sweep.partition("=")
+        name = name.strip()
+        if name not in types:
+            raise SystemExit(f"unknown setting {name!r}, expected one of {sorted(types)}")
+        if name in UNSWEPT:
+            raise SystemExit(f"{name} can't be swept: {UNSWEPT[name]}")
+        convert = types[name]
+        if convert is bool:
+            convert = lambda v: v.strip().lower() in ("1", "true", "yes", "on")  # pylint: disable=unnecessary-lambda-assignment
+        axes.append([(name, convert(value)) for value in values.split(",")])
+    return [dict(base, **dict(combo)) for combo in itertools.product(*axes)] or [dict(base)]
+
+
+def run(paths: List[str], parameter_sets: List[dict], workers: int, chunk_seconds: float,
+        warmup: float, fps: float) -> List[dict]:
+    chunks = plan_chunks(paths, chunk_seconds, warmup)
+    totals = [{"params": params, "events": [], "dwell": [], "frames": 0, "motion_frames": 0,
+               "seconds": 0.0, "prefilter_skipped": 0, "prefilter_frames": 0} for params in parameter_sets]
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(analyse_chunk, chunk, parameter_sets, fps): chunk for chunk in chunks}
+        for done, future in enumerate(as_completed(futures), 1):
+            chunk = futures[future]
+            for total, result in zip(totals, future.result()):
+                for key in ("events", "dwell"):
+                    total[key].extend(result[key])
+                for key in ("frames", "motion_frames", "seconds", "prefilter_skipped", "prefilter_frames"):
+                    total[key] += result[key]
+            print(f"[{done}/{len(chunks)}] {os.path.basename(chunk.path)} {chunk.start:.0f}-{chunk.end:.0f} s")
+
+    summaries = []
+    for total in totals:
+        total["events"].sort(key=lambda e: (e["camera_id"], e["ts"]))
+        frames = max(1, total["frames"])
+        summaries.append({
+            "params": total["params"],
+            "frames": total["frames"],
+            "events": len(total["events"]),
+            "motion_frame_ratio": total["motion_frames"] / frames,
+            "ms_per_frame": total["seconds"] * 1000 / frames,
+            "prefilter_skipped_ratio": total["prefilter_skipped"] / max(1, total["prefilter_frames"]),
+            "tracks": len(total["dwell"]),
+            "mean_dwell": float(np.mean(total["dwell"])) if total["dwell"] else 0.0,
+            "event_list": total["events"],
+        })
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run motion detection over recorded footage")
+    parser.add_argument("paths", nargs="+", help="Recorded mp4 segments")
+    parser.add_argument("--param", action="append", default=[],
+                        help="Setting to sweep, e.g. binary_threshold=80,100,120 (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=float, default=120, help="Seconds of footage per task")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds decoded before each chunk")
+    parser.add_argument("--fps", type=float, default=0, help="Analyse at most this many frames per second")
+    parser.add_argument("--output", help="Write results, including every event, to this JSON file")
+    parser.add_argument("--config", default=None,
+                        help="Settings file of a headless server to start from (default: the GUI's settings)")
+    args = parser.parse_args()
+
+    # unswept settings are the ones the server runs with, read without writing to its store
+    stored = config.stored_snapshot(headless=args.config is not None, path=args.config)
+    base = dict(dataclasses.asdict(stored), object_classes="")  # see UNSWEPT
+    parameter_sets = parameter_grid(base, args.param)
+    swept = sorted({name for sweep in args.param for name in [sweep.partition("=")[0].strip()]})
+
+    started = time.perf_counter()
+    summaries = run(args.paths, parameter_sets, args.workers, args.chunk, args.warmup, args.fps)
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{len(args.paths)} files, {len(parameter_sets)} parameter sets in {elapsed:.1f} s")
+    header = " ".join(f"{name:>18}" for name in swept)
+    print(f"{header} {'events':>7} {'motion':>7} {'tracks':>7} {'dwell s':>8} {'ms/frame':>9} {'skipped':>8}")
+    for summary in summaries:
+        values = " ".join(f"{str(summary['params'][name]):>18}" for name in swept)
+        print(f"{values} {summary['events']:>7} {summary['motion_frame_ratio']:>7.1%} {summary['tracks']:>7} "
+              f"{summary['mean_dwell']:>8.1f} {summary['ms_per_frame']:>9.2f} {summary['prefilter_skipped_ratio']:>8.1%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"paths": args.paths, "results": summaries}, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Startup timing for `--startup-profile`.
+
+`profile.enable()` times every module imported from then on, `stage`
+times a step of bringing the app up and `mark` notes when something
+became ready (window shown, server listening), from any thread. Once all
+the milestones passed to `enable` are marked the report is printed to
+stderr. Until `enable` is called all of it is a no-op, so the call sites
+stay in place in normal runs.
+"""
+import contextlib
+import importlib.abc
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+START = time.perf_counter()  # as close to interpreter start as we get without -X importtime
+TOP_IMPORTS = 20
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """
+    Wraps a module's loader to time executing it.
+    """
+    def __init__(self, loader, timer: "_ImportTimer"):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # the module only ever sees its real loader
+        module.__loader__ = module.__spec__.loader = self.loader
+        self.timer.run(module.__name__, self.loader.exec_module, module)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    First entry on `sys.meta_path`: asks the other finders and times the
+    loaders they return. Self time excludes nested imports.
+    """
+    def __init__(self):
+        self.imports: List[Tuple[str, float, float, str]] = []  # name, total, self, thread
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def run(self, name, exec_module, module) -> None:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # time spent in nested imports
+        started = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.imports.append((name, total, total - nested, threading.current_thread().name))
+
+
+class StartupProfile:
+    """
+    Collects import, stage and milestone timings of one startup.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stages: List[Tuple[str, float, float, str]] = []  # name, start, duration, thread
+        self.marks: Dict[str, float] = {}
+        self._imports = None
+        self._waiting = set()
+        self._lock = threading.Lock()
+
+    def enable(self, *milestones: str) -> None:
+        """
+        Starts timing imports; the report is printed once all `milestones`
+        have been marked.
+        """
+        self.enabled = True
+        self._waiting = set(milestones)
+        self._imports = _ImportTimer()
+        sys.meta_path.insert(0, self._imports)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, started - START, time.perf_counter() - started,
+                                threading.current_thread().name))
+
+    def mark(self, name: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - START)
+            self._waiting.discard(name)
+            done = not self._waiting and self._imports is not None
+        if done:
+            self.finish()
+
+    def finish(self) -> None:
+        """
+        Stops timing imports and prints the report.
+        """
+        with self._lock:
+            if self._imports is None:
+                return
+            timer, self._imports = self._imports, None
+            if timer in sys.meta_path:
+                sys.meta_path.remove(timer)
+        print(self.report(timer.imports), file=sys.stderr, flush=True)
+
+    def report(self, imports) -> str:
+        lines = ["Startup profile (seconds since start)", "  milestones:"]
+        for name, at in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f"    {at:8.3f}  {name}")
+        lines.append("  stages:")
+        for name, started, duration, thread in sorted(self.stages, key=lambda stage: stage[1]):
+            lines.append(f"    {started:8.3f}  {duration * 1000:8.1f} ms  {name} [{thread}]")
+        total = sum(self_time for _, _, self_time, _ in imports)
+        lines.append(f"  imports: {len(imports)} modules, {total * 1000:.1f} ms, slowest by own time:")
+        lines.append(f"    {'own ms':>8}  {'total ms':>8}  module")
+        for name, cumulative, self_time, thread in sorted(imports, key=lambda item: -item[2])[:TOP_IMPORTS]:
+            lines.append(f"    {self_time * 1000:8.1f}  {cumulative * 1000:8.1f}  {name} [{thread}]")
+        return "\n".join(lines)
+
+
+profile = StartupProfile()
@@ -0,0 +1,27 @@
+"""
+FrameMailbox delivery to the taker and to listeners.
+"""
+import logging
+
+import numpy as np
+
+from server_node.backend.frame_mailbox import FrameMailbox
+
+
+def test_failing_listener_does_not_reach_the_poster(caplog):
+    mailbox = FrameMailbox()
+    seen = []
+
+    def broken(camera_id, frame, overlay):
+        raise ValueError("encoder gone")
+
+    mailbox.add_listener(broken)
+    mailbox.add_listener(lambda camera_id, frame, overlay: seen.append(camera_id))
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    with caplog.at_level(logging.ERROR, logger="frame_mailbox"):
+        mailbox.post(2, frame)
+        mailbox.post(3, frame)
+
+    assert seen == [2, 3]
+    assert set(mailbox.take_all(timeout=0)) == {2, 3}
+    assert "encoder gone" in caplog.text
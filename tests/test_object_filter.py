@@ -0,0 +1,57 @@
+"""
+Object class filter: the no-model fallback and the confirmation hold.
+"""
+import dataclasses
+import logging
+
+import numpy as np
+import pytest
+
+from server_node.backend import motion_detection
+from server_node.backend.frame_processor import FrameProcessor
+from server_node.backend.motion_detection import Detection, Detector, ShapeDetector
+from server_node.config import Snapshot
+
+
+def moving_square(i: int) -> np.ndarray:
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    x = 20 + 6 * (i % 40)
+    frame[80:160, x:x + 50] = 255
+    return frame
+
+
+def motion_events(settings, frames: int = 60, fps: float = 10.0) -> list:
+    processor = FrameProcessor(camera_id=1)
+    events = []
+    processor.add_motion_listener(events.append)
+    for i in range(frames):
+        processor.process(moving_square(i), settings, timestamp=1000.0 + i / fps)
+    return events
+
+
+def test_detector_is_abstract():
+    with pytest.raises(TypeError):
+        Detector()  # pylint: disable=abstract-class-instantiated
+    assert ShapeDetector().detect(np.zeros((1, 320, 320, 3), np.uint8), [[(0, 0, 10, 30)]])[0][0].label == "person"
+
+
+def test_classes_without_model_count_any_motion(caplog):
+    unfiltered = motion_events(Snapshot())
+    with caplog.at_level(logging.WARNING, logger="motion_detection"):
+        filtered = motion_events(dataclasses.replace(Snapshot(), object_classes="person", object_model=""))
+    assert motion_detection.shared_batcher("") is None
+    assert unfiltered
+    assert [e.timestamp for e in filtered] == [e.timestamp for e in unfiltered]
+    assert "no object model" in caplog.text
+
+
+def test_object_hold_runs_on_the_frame_clock():
+    processor = FrameProcessor(camera_id=2)
+    person = Detection("person", 0.9, (0, 0, 10, 30))
+    processor.on_objects(frozenset({"person"}), 500.0, [person])
+    assert processor.objectConfirmedUntil == 500.0 + FrameProcessor.OBJECT_HOLD
+    # a late result for an older frame doesn't shorten the hold
+    processor.on_objects(frozenset({"person"}), 499.5, [person])
+    assert processor.objectConfirmedUntil == 500.0 + FrameProcessor.OBJECT_HOLD
+    processor.on_objects(frozenset({"car"}), 501.0, [person])
+    assert processor.objectConfirmedUntil == 500.0 + FrameProcessor.OBJECT_HOLD
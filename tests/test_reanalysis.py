@@ -0,0 +1,31 @@
+"""
+Parameter sets of the offline re-analysis.
+"""
+import json
+
+import pytest
+
+from server_node import config
+from server_node.reanalysis import parameter_grid
+
+
+def test_stored_settings_are_read_without_writing(tmp_path):
+    path = tmp_path / "server_settings.json"
+    path.write_text(json.dumps({"Contour Size": 321}))
+    snapshot = config.stored_snapshot(headless=True, path=str(path))
+    assert snapshot.contour_size == 321
+    assert json.loads(path.read_text()) == {"Contour Size": 321}
+
+
+def test_grid_sweeps_over_the_base():
+    grid = parameter_grid({"contour_size": 123, "binary_threshold": 100},
+                          ["binary_threshold=60,90", "detection_grayscale=true,0"])
+    assert [(p["binary_threshold"], p["detection_grayscale"]) for p in grid] == \
+        [(60, True), (60, False), (90, True), (90, False)]
+    assert {p["contour_size"] for p in grid} == {123}
+
+
+@pytest.mark.parametrize("name", ["object_classes", "object_model", "detection_zones"])
+def test_settings_that_cannot_be_swept_are_rejected(name):
+    with pytest.raises(SystemExit, match=f"{name} can't be swept"):
+        parameter_grid({}, [f"{name}=a,b"])
@@ -0,0 +1,85 @@
+"""
+Recorded segments and motion events share the wall clock, end to end
+through VideoReceiver with a track whose RTP clock starts at a random value.
+"""
+import asyncio
+import fractions
+import random
+import time
+
+import numpy as np
+import pytest
+from av import VideoFrame
+
+from server_node import config
+from server_node.backend import catalog
+
+
+class MovingSquareTrack:
+    """
+    Stands in for an aiortc track: 90 kHz RTP timestamps from a random
+    start, a square moving across the frame, then the connection drops.
+    """
+    kind = "video"
+
+    def __init__(self, frames: int, fps: float = 15.0):
+        self.frames = frames
+        self.fps = fps
+        self.start = random.getrandbits(32)
+        self.sent = 0
+
+    async def recv(self) -> VideoFrame:
+        if self.sent == self.frames:
+            raise ConnectionError("track ended")
+        await asyncio.sleep(1 / self.fps)
+        image = np.zeros((240, 320, 3), dtype=np.uint8)
+        x = 20 + 5 * (self.sent % 50)
+        image[80:160, x:x + 50] = 255
+        frame = VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = (self.start + int(self.sent * 90000 / self.fps)) % (1 << 32)
+        frame.time_base = fractions.Fraction(1, 90000)
+        self.sent += 1
+        return frame
+
+
+@pytest.fixture
+def recording_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(catalog, "_catalog", None)
+    config.configure(store=config.FileSettings(None))
+    config.runtime.update(recording=True, raw_view=False, motion_recording=False)
+    yield tmp_path
+
+
+@pytest.mark.usefixtures("recording_dir")
+def test_segments_and_events_are_on_the_wall_clock():
+    from server_node.backend import server  # pylint: disable=import-outside-toplevel
+
+    camera_id = 4711
+    receiver = server.VideoReceiver(MovingSquareTrack(frames=60), camera_id)
+    started = time.time()
+    asyncio.run(receiver.run())
+    stopped = time.time()
+
+    db = server.shared_catalog()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        db.flush()
+        segments = db.segments(camera_id)
+        if segments and segments[0]["end_ts"] is not None:
+            break
+        time.sleep(0.1)
+
+    assert len(segments) == 1
+    segment = segments[0]
+    assert started - 1 <= segment["start_ts"] <= segment["end_ts"] <= stopped + 1
+    assert segment["end_ts"] - segment["start_ts"] == pytest.approx(59 / 15.0, abs=0.5)
+
+    motion = db.events(camera_id)
+    assert motion
+    for row in motion:
+        event = db.event(row["id"])
+        assert event["segment"] == segment["id"]
+        fragment_ts, byte_offset = db.seek(segment["id"], event["ts"])
+        assert segment["start_ts"] <= fragment_ts <= event["ts"]
+        assert 0 < byte_offset < segment["bytes"]
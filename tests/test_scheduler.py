@@ -0,0 +1,51 @@
+"""
+AdaptiveScheduler rate allocation, driven by a fake clock.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from server_node.backend.scheduler import DEFAULT_COST, AdaptiveScheduler
+
+
+def settings(**overrides):
+    values = dict(processing_budget=100, motion_priority=4.0, idle_process_fps=2.0)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def processed_frames(scheduler, camera_id, fps, seconds, config, warmup=1.0):
+    """
+    Feeds `seconds` of frames after `warmup` seconds (the first plan needs
+    a measured input fps) and returns how many were due.
+    """
+    count = 0
+    for i in range(int(fps * (warmup + seconds))):
+        due = scheduler.should_process(camera_id, config, now=i / fps)
+        count += due and i >= fps * warmup
+    return count
+
+
+@pytest.mark.parametrize("allocated", [24.0, 17.5, 12.0, 7.3])
+def test_achieved_rate_matches_allocation(allocated):
+    # unmeasured cost is DEFAULT_COST per frame, so the capacity sets the rate
+    scheduler = AdaptiveScheduler(capacity=allocated * DEFAULT_COST)
+    camera_id = 9000 + int(allocated * 10)
+    frames = processed_frames(scheduler, camera_id, 30.0, 20.0, settings())
+    assert scheduler.rate(camera_id) == pytest.approx(allocated)
+    assert frames / 20.0 == pytest.approx(allocated, rel=0.03)
+
+
+def test_rate_is_capped_at_input_fps():
+    scheduler = AdaptiveScheduler(capacity=8.0)
+    frames = processed_frames(scheduler, 9100, 15.0, 10.0, settings())
+    assert frames == 150
+
+
+def test_stalled_camera_does_not_burst():
+    scheduler = AdaptiveScheduler(capacity=10 * DEFAULT_COST)
+    config = settings()
+    processed_frames(scheduler, 9200, 30.0, 5.0, config)
+    # a 10 s gap is worth one frame of backlog: the due frame and one more
+    due = [scheduler.should_process(9200, config, now=16.0 + i / 30.0) for i in range(3)]
+    assert due == [True, True, False]
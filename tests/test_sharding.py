@@ -0,0 +1,49 @@
+"""
+Shared frame ring wakeups and worker selection of the ingest pool.
+"""
+from multiprocessing import connection
+
+import numpy as np
+import pytest
+
+from server_node.backend.sharding import ShardPool, SharedFrameRing
+
+
+@pytest.fixture
+def ring():
+    owner = SharedFrameRing(4, 64 * 48 * 3)
+    writer = SharedFrameRing(4, 64 * 48 * 3, name=owner.name, notifier=owner.notifier)
+    yield owner, writer
+    writer.close()
+    owner.close()
+
+
+def test_reader_sleeps_until_a_frame_is_posted(ring):  # pylint: disable=redefined-outer-name
+    owner, writer = ring
+    assert connection.wait([owner.ready], 0.05) == []
+
+    frame = np.full((48, 64, 3), 7, dtype=np.uint8)
+    for _ in range(10):  # more than the ring holds; the pokes are drained together
+        writer.post(3, frame)
+    assert connection.wait([owner.ready], 1.0) == [owner.ready]
+    frames = owner.read_new()
+    assert [camera_id for camera_id, _, _ in frames] == [3] * 4
+    assert np.array_equal(frames[-1][1], frame)
+    assert connection.wait([owner.ready], 0.05) == []
+
+
+def test_offers_skip_exited_workers():
+    pool = ShardPool(3, slots=2, max_frame_size=(16, 16))
+    try:
+        pool.workers[0].cameras.add(7)
+        assert pool._pick_worker({7}) is pool.workers[0]  # pylint: disable=protected-access
+        pool.workers[0].exited = True
+        pool.workers[1].cameras.update({1, 2})
+        assert pool._pick_worker({7}) is pool.workers[2]  # pylint: disable=protected-access
+        for worker in pool.workers:
+            worker.exited = True
+        with pytest.raises(RuntimeError):
+            pool._pick_worker({7})  # pylint: disable=protected-access
+    finally:
+        for worker in pool.workers:
+            worker.ring.close()
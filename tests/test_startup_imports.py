@@ -0,0 +1,25 @@
+"""
+The GUI opens before the pipeline is loaded, so importing it must not pull
+in decoding or detection.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+PIPELINE_MODULES = ("av", "aiortc", "server_node.backend.frame_processor", "server_node.backend.server")
+
+
+def test_gui_import_leaves_the_pipeline_unloaded():
+    script = (
+        "import sys, server_node.gui.app\n"
+        f"print(','.join(m for m in {PIPELINE_MODULES!r} if m in sys.modules))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONPATH=root)
+    result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True,
+                            timeout=60, check=True)
+    assert result.stdout.strip() == ""